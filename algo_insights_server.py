@@ -1,11 +1,14 @@
-from mcp.server.fastmcp import FastMCP
+from utils.server import AnalyticsMCP, register_common_tools
 
 # Initialize the MCP server
-mcp = FastMCP("Paul")
+mcp = AnalyticsMCP("Paul")
 
 # Import Tools 
 from tools.algo_insights import *
 
+# Metrics, trend and result tools shared by every server
+register_common_tools(mcp, period="month")
+
 if __name__ == "__main__":
-    # Initialize and run the server
-    mcp.run(transport='stdio')
\ No newline at end of file
+    # Initialize and run the server (stdio by default, see --transport)
+    mcp.serve()
\ No newline at end of file
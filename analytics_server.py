@@ -0,0 +1,10 @@
+import algo_insights_server
+import weekly_kpis_server
+from utils.server import combine
+
+# Paul's and Maria's tools in one process, sharing the upstream clients and
+# cached histories of utils.core
+mcp = combine("Analytics", {"paul": algo_insights_server.mcp, "maria": weekly_kpis_server.mcp})
+
+if __name__ == "__main__":
+    mcp.serve()
\ No newline at end of file
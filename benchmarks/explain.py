@@ -0,0 +1,131 @@
+"""
+Check that the catalog queries let ClickHouse prune with the primary key
+
+Lists, for every ClickHouse query in docs/*/queries.yaml, the predicates that hide
+a sort key column behind a function (see utils.sargable). --fix rewrites them in
+the catalog files.
+
+--explain also runs EXPLAIN indexes=1 for every query, bound to --month/--week. It
+runs against the ClickHouse configured in .env, so point DB_HOST at a local
+ClickHouse loaded with the mainnet schema (and some data) rather than the shared
+server. For each table read it prints the parts and granules each index selected,
+for the catalog query and, when it differs, for its rewrite.
+
+    python -m benchmarks.explain
+    python -m benchmarks.explain --fix
+    python -m benchmarks.explain --explain --month 2025-04-30 --week 2025-04-27
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict
+
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+CATALOGS = sorted((ROOT / "docs").glob("*/queries.yaml"))
+
+
+def placeholders(month: str, week: str) -> Dict[str, str]:
+    """Values of the catalog placeholders, longest names first so PREV_MONTH wins over MONTH"""
+    curr_end = date.fromisoformat(month)
+    curr_start = curr_end.replace(day=1)
+    prev_end = curr_start - timedelta(days=1)
+    return {
+        "PREV_MONTH": f"'{prev_end}'",
+        "CURR_MONTH": f"'{curr_end}'",
+        "START_1": f"'{prev_end.replace(day=1)}'",
+        "START_2": f"'{curr_start}'",
+        "MONTH": f"'{curr_end}'",
+        "WEEK": f"'{week}'",
+    }
+
+
+def bind(sql: str, values: Dict[str, str]) -> str:
+    for name, value in values.items():
+        sql = sql.replace(name, value)
+    return sql
+
+
+def clickhouse_queries(text: str) -> Dict[str, str]:
+    """SQL of every ClickHouse query in a catalog (entries may set engine: bigquery)"""
+    catalog = yaml.safe_load(text)
+    return {name: info["sql"] for name, info in catalog.items() if info.get("engine", "clickhouse") == "clickhouse"}
+
+
+def fix(path: Path) -> int:
+    """Rewrite the catalog file in place; returns the number of queries changed"""
+    from utils.sargable import rewrite
+
+    text = path.read_text()
+    fixed = rewrite(text)
+    before, after = clickhouse_queries(text), clickhouse_queries(fixed)
+    # The file is rewritten as text to keep its layout; make sure that only did what
+    # rewriting each query would have done
+    if after != {name: rewrite(sql) for name, sql in before.items()}:
+        raise RuntimeError(f"{path}: rewriting the file changed more than its queries, fix it by hand")
+    if fixed != text:
+        path.write_text(fixed)
+    return sum(before[name] != after[name] for name in before)
+
+
+async def explain(sql: str):
+    from utils.core import CLICKHOUSE
+    from utils.sargable import parse_explain
+
+    result = await CLICKHOUSE.execute_query(f"EXPLAIN indexes = 1 {sql}")
+    return parse_explain([row[0] for row in result.result_rows])
+
+
+def print_usage(label: str, reads):
+    if not reads:
+        print(f"    {label}: no MergeTree reads")
+    for read in reads:
+        steps = ", ".join(f"{index} {parts} parts {granules} granules" for index, parts, granules in read.steps)
+        print(f"    {label}: {read.table}: {steps or 'no index used'}")
+
+
+async def check(args) -> int:
+    """Report (and optionally fix) every catalog; returns the number of issues left"""
+    from utils.sargable import issues, rewrite
+
+    values = placeholders(args.month, args.week)
+    found = 0
+    for path in CATALOGS:
+        print(path.relative_to(ROOT))
+        for name, sql in clickhouse_queries(path.read_text()).items():
+            problems = issues(sql)
+            found += len(problems)
+            print(f"  {name}: " + ("ok" if not problems else f"{len(problems)} issue(s)"))
+            for problem in problems:
+                print(f"    - {problem}")
+            if args.explain:
+                print_usage("catalog", await explain(bind(sql, values)))
+                if rewrite(sql) != sql:
+                    print_usage("rewrite", await explain(bind(rewrite(sql), values)))
+        if args.fix:
+            print(f"  rewrote {fix(path)} queries")
+    return 0 if args.fix else found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fix", action="store_true", help="rewrite the catalog files in place")
+    parser.add_argument("--explain", action="store_true", help="run EXPLAIN indexes=1 on ClickHouse")
+    parser.add_argument("--month", default="2025-04-30", help="month end the monthly queries are bound to")
+    parser.add_argument("--week", default="2025-04-27", help="week end the weekly queries are bound to")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    found = asyncio.run(check(args))
+    if found:
+        print(f"\n{found} predicate(s) defeat the primary key; run with --fix to rewrite them")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
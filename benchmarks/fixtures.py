@@ -0,0 +1,231 @@
+import hashlib
+import json
+import math
+import random
+import re
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+RECORDED_DIR = FIXTURE_DIR / "recorded"
+
+# Range covered by the synthetic series, wide enough for any benchmark period
+SERIES_START = date(2019, 6, 20)
+SERIES_END = date(2026, 12, 31)
+
+STABLES = {'usdt': 1, 'usdc': 2, 'eurd': 161, 'stbl': 38, 'eurs': 51, 'monerium': 101}
+RWA_PROTOCOLS = ['lofty', 'asa.gold', 'meld%20gold', 'vesta%20equity']
+N_PROTOCOLS = 80
+TVL_QUERY = "pool2=true&staking=true&borrowed=true&doublecounted=true&liquidstaking=true&vesting=true&govtokens=true"
+
+# ClickHouse stand-in: the first pattern found in the SQL decides the base value.
+# Each `'YYYY-MM-DD' as end_of_...` literal in the SQL becomes one result row.
+CLICKHOUSE_VALUES: List[Tuple[str, float]] = [
+    ("cumulative_fees_paid", 2_950_000.0),
+    ("fee_sink_balance", 210_000.0),
+    ("snd_addr_id = 90", 14_500_000.0),
+    ("rcv_addr_id = 90", 130_000_000.0),
+    ("count(distinct snd_addr_id)", 610_000.0),
+    ("uniqCombined(snd_addr_id)", 610_000.0),
+    ("uniqHLL12(snd_addr_id)", 610_000.0),
+    ("app_call_create", 5_400.0),
+    ("asa_create", 68_000.0),
+    ("SUM(fee)", 41_000.0),
+    ("stake/1e6", 1_950_000_000.0),
+    ("onl", 1_720.0),
+    ("mainnet.account", 44_000_000.0),
+    ("mainnet.txn", 2_900_000_000.0),
+]
+DATE_LITERAL = re.compile(r"'(\d{4}-\d{2}-\d{2})'\s+as\s+end_of_\w+", re.IGNORECASE)
+
+BIGQUERY_PYTHON_DOWNLOADS = 18_250
+
+
+def _days(start: date = SERIES_START, end: date = SERIES_END):
+    d = start
+    while d <= end:
+        yield d
+        d += timedelta(days=1)
+
+
+def _unix(d: date) -> int:
+    return int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp())
+
+
+def _wave(rng: random.Random, i: int, base: float) -> float:
+    return round(base * (1 + 0.3 * math.sin(i / 90)) * (1 + rng.uniform(-0.02, 0.02)), 2)
+
+
+def defillama_chain_csv() -> bytes:
+    """Wide simpleChainDataset CSV: one row per protocol, one column per day, Total last"""
+    rng = random.Random(1)
+    days = list(_days())
+    header = "Protocol," + ",".join(d.strftime("%d/%m/%Y") for d in days)
+    lines = [header]
+    totals = [0.0] * len(days)
+    for p in range(N_PROTOCOLS):
+        base = rng.uniform(1e4, 2e7)
+        born = rng.randrange(len(days))
+        values = []
+        for i in range(len(days)):
+            v = _wave(rng, i, base) if i >= born else 0.0
+            totals[i] += v
+            values.append(f"{v:.2f}" if v else "")
+        lines.append(f"Protocol {p}," + ",".join(values))
+    lines.append("Total," + ",".join(f"{v:.2f}" for v in totals))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def coingecko_csv() -> bytes:
+    rng = random.Random(2)
+    lines = ["snapped_at,price,market_cap,total_volume"]
+    for i, d in enumerate(_days()):
+        price = _wave(rng, i, 0.25)
+        supply = 5e9 + i * 1.5e6
+        lines.append(f"{d.isoformat()} 00:00:00 UTC,{price},{price * supply:.2f},{rng.uniform(2e7, 2e8):.2f}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def stablecoin_json(stable_id: int) -> bytes:
+    rng = random.Random(100 + stable_id)
+    base = rng.uniform(1e6, 8e7)
+    records = []
+    for i, d in enumerate(_days(date(2021, 1, 1))):
+        v = _wave(rng, i, base)
+        records.append({
+            "date": str(_unix(d)),
+            "totalCirculating": {"peggedUSD": v},
+            "totalUnreleased": {"peggedUSD": 0},
+            "totalCirculatingUSD": {"peggedUSD": v},
+            "totalMintedUSD": {"peggedUSD": v},
+            "totalBridgedToUSD": {"peggedUSD": 0},
+        })
+    return json.dumps(records).encode()
+
+
+def protocol_json(protocol: str) -> bytes:
+    rng = random.Random(protocol)
+    base = rng.uniform(1e5, 5e6)
+    tvl = [{"date": _unix(d), "totalLiquidityUSD": _wave(rng, i, base)}
+           for i, d in enumerate(_days(date(2022, 1, 1)))]
+    return json.dumps({"name": protocol, "chains": ["Algorand"], "tvl": tvl}).encode()
+
+
+def cmc_html(day: str) -> bytes:
+    """Historical snapshot page with the 100 rows the scraper selects"""
+    rng = random.Random(day)
+    names = [f"Coin {i}" for i in range(120)]
+    names[rng.randrange(30, 60)] = "Algorand"
+    rows = []
+    for i, name in enumerate(names[:100]):
+        cls = "cmc-table-row" if i < 20 else "sc-9db05dbd-1 iWrTcJ cmc-table-row"
+        cells = "".join(f"<td><div class=\"cell\">{rng.uniform(0, 1e9):.2f}</div></td>" for _ in range(8))
+        rows.append(f'<tr class="{cls}"><td>{i + 1}</td><td><a class="cmc-link" href="/currencies/{i}/" '
+                    f'title="{name}">{name}</a></td>{cells}</tr>')
+    body = "<html><head><title>Historical Snapshot</title></head><body>" + \
+           "<div class=\"padding\">" + "x" * 150_000 + "</div><table><tbody>" + \
+           "".join(rows) + "</tbody></table></body></html>"
+    return body.encode()
+
+
+def nodes_json(day: str) -> bytes:
+    return json.dumps({"date": day, "unique_ips": 1_400 + int(day.replace("-", "")) % 97}).encode()
+
+
+def npm_json(start: str, end: str, package: str) -> bytes:
+    return json.dumps({"downloads": 9_800 + int(start.replace("-", "")) % 211,
+                       "start": start, "end": end, "package": package}).encode()
+
+
+def active_devs_json() -> bytes:
+    rng = random.Random(3)
+    return json.dumps({d.isoformat(): rng.randrange(300, 500) for d in _days(date(2024, 1, 1))}).encode()
+
+
+class HttpFixtures:
+    """
+    Response bodies for one HTTP upstream, keyed by request path (with query)
+
+    Recorded responses under fixtures/recorded/<upstream>/ take precedence over the
+    synthetic ones, which are generated lazily and kept in memory.
+    """
+
+    def __init__(self, upstream: str, routes):
+        self.upstream = upstream
+        self.routes = routes
+        self._cache: Dict[str, Tuple[str, bytes]] = {}
+
+    def get(self, path: str) -> Optional[Tuple[str, bytes]]:
+        recorded = RECORDED_DIR / self.upstream / quote(path, safe="")
+        if recorded.exists():
+            return _content_type(path), recorded.read_bytes()
+        if path not in self._cache:
+            for pattern, build in self.routes:
+                m = re.fullmatch(pattern, path)
+                if m:
+                    self._cache[path] = (_content_type(path), build(*m.groups()))
+                    break
+            else:
+                return None
+        return self._cache[path]
+
+
+def _content_type(path: str) -> str:
+    if ".csv" in path or "simpleChainDataset" in path:
+        return "text/csv"
+    if "/historical/" in path:
+        return "text/html"
+    return "application/json"
+
+
+def http_fixtures() -> Dict[str, HttpFixtures]:
+    return {
+        "defillama": HttpFixtures("defillama", [
+            (r"/simpleChainDataset/algorand\?" + re.escape(TVL_QUERY), lambda: defillama_chain_csv()),
+            (r"/protocol/([^/?]+)", protocol_json),
+        ]),
+        "defillama_stablecoins": HttpFixtures("defillama_stablecoins", [
+            (r"/stablecoincharts/algorand\?stablecoin=(\d+)", lambda s: stablecoin_json(int(s))),
+        ]),
+        "coingecko": HttpFixtures("coingecko", [
+            (r"/price_charts/export/algorand/usd\.csv", lambda: coingecko_csv()),
+        ]),
+        "nodely": HttpFixtures("nodely", [
+            (r"/v1/env/network/nodes/([\d-]+)", nodes_json),
+        ]),
+        "coinmarketcap": HttpFixtures("coinmarketcap", [
+            (r"/historical/(\d+)/", cmc_html),
+        ]),
+        "npm": HttpFixtures("npm", [
+            (r"/downloads/point/([\d-]+):([\d-]+)/(.+)", npm_json),
+        ]),
+        "active_devs": HttpFixtures("active_devs", [
+            (r"/active_devs\.json", lambda: active_devs_json()),
+        ]),
+    }
+
+
+def sql_key(sql: str) -> str:
+    return hashlib.sha256(" ".join(sql.split()).encode()).hexdigest()[:16]
+
+
+def clickhouse_rows(sql: str) -> List[Tuple[str, float]]:
+    """Rows for a catalog query: recorded ones when available, synthetic otherwise"""
+    recorded = RECORDED_DIR / "clickhouse" / f"{sql_key(sql)}.json"
+    if recorded.exists():
+        return [tuple(r) for r in json.loads(recorded.read_text())]
+    base = next((v for pattern, v in CLICKHOUSE_VALUES if pattern in sql), 1.0)
+    rows = []
+    for literal in DATE_LITERAL.findall(sql):
+        offset = (date.fromisoformat(literal) - SERIES_START).days
+        rows.append((literal, round(base * (1 + offset / 20_000), 4)))
+    return rows
+
+
+def bigquery_rows(sql: str) -> List[dict]:
+    recorded = RECORDED_DIR / "bigquery" / f"{sql_key(sql)}.json"
+    if recorded.exists():
+        return json.loads(recorded.read_text())
+    return [{"python_downloads": BIGQUERY_PYTHON_DOWNLOADS}]
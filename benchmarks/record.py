@@ -0,0 +1,91 @@
+"""
+Record live upstream responses as benchmark fixtures
+
+Runs get_report and get_kpis_report against the real upstreams, using the
+credentials in .env, and saves every HTTP response, ClickHouse result and BigQuery
+result under benchmarks/fixtures/recorded/. benchmarks.run replays recorded
+fixtures in place of the synthetic ones. Sheets are never touched, since the
+writers only write.
+
+    python -m benchmarks.record
+"""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def main():
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    import clickhouse_connect
+    import requests
+    from google.cloud import bigquery
+
+    from benchmarks.fixtures import RECORDED_DIR, sql_key
+    from benchmarks.run import MONTH, WEEK
+    from utils.upstreams import UPSTREAMS
+
+    def save(path: Path, body: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+        print(f"recorded {path.relative_to(RECORDED_DIR)} ({len(body)} bytes)")
+
+    bases = {urlsplit(url).netloc: name for name, url in UPSTREAMS.items()}
+    active_devs_url = os.getenv("ACTIVE_DEVS_URL")
+    request = requests.Session.request
+
+    def recording_request(self, method, url, *args, **kwargs):
+        response = request(self, method, url, *args, **kwargs)
+        parts = urlsplit(response.url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        if url == active_devs_url:
+            save(RECORDED_DIR / "active_devs" / quote("/active_devs.json", safe=""), response.content)
+        elif parts.netloc in bases and response.ok:
+            save(RECORDED_DIR / bases[parts.netloc] / quote(path, safe=""), response.content)
+        return response
+
+    get_client = clickhouse_connect.get_client
+
+    def recording_client(**kwargs):
+        client = get_client(**kwargs)
+        query = client.query
+
+        def recording_query(sql, *args, **kw):
+            result = query(sql, *args, **kw)
+            rows = [[str(c) if not isinstance(c, (int, float)) else c for c in r] for r in result.result_rows]
+            save(RECORDED_DIR / "clickhouse" / f"{sql_key(sql)}.json", json.dumps(rows).encode())
+            return result
+        client.query = recording_query
+        return client
+
+    bq_query = bigquery.Client.query
+
+    def recording_bq_query(self, sql, *args, **kwargs):
+        job = bq_query(self, sql, *args, **kwargs)
+        rows = [dict(r) for r in job.result()]
+        save(RECORDED_DIR / "bigquery" / f"{sql_key(sql)}.json", json.dumps(rows, default=str).encode())
+        return job
+
+    requests.Session.request = recording_request
+    clickhouse_connect.get_client = recording_client
+    bigquery.Client.query = recording_bq_query
+
+    import algo_insights_server  # noqa: F401
+    import weekly_kpis_server  # noqa: F401
+    from tools.algo_insights.report_tool import get_report
+    from tools.kpis.weekly_kpi_tool import get_kpis_report
+
+    async def record():
+        await get_report(MONTH)
+        await get_kpis_report(WEEK)
+
+    asyncio.run(record())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Offline benchmarks for the report pipelines
+
+Replays fixtures for every upstream from local stand-ins and times the reports
+end to end and per stage (each tool and each upstream). Exits non-zero when a
+scenario regresses against the stored baseline.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --latency clickhouse=0.2 --latency http=0.05
+    python -m benchmarks.run --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import warnings
+from pathlib import Path
+
+from benchmarks.standins import DEFAULT_LATENCY, stand_ins
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+MONTH = "2025-04-30"
+WEEK = "2025-04-27"
+
+
+def scenarios():
+    """Name -> coroutine factory, imported only once the stand-ins are in place"""
+    import algo_insights_server  # noqa: F401  (registers Paul's tools)
+    import weekly_kpis_server  # noqa: F401  (registers Maria's tools)
+    from tools.algo_insights import report_tool, update_sheet_tool
+    from tools.kpis import publish_tool, weekly_kpi_tool
+
+    async def monthly_then_weekly():
+        # As in analytics_server.py: the weekly run reuses the monthly run's caches
+        await report_tool.get_report(MONTH)
+        await weekly_kpi_tool.get_kpis_report(WEEK)
+
+    async def republish_summary():
+        # The second run finds the tab and only reconciles it
+        await update_sheet_tool.update_sheet_individual(MONTH)
+        await update_sheet_tool.update_sheet_individual(MONTH)
+
+    return {
+        "paul.get_tvl_report": lambda: report_tool.get_tvl_report(MONTH),
+        "paul.get_report": lambda: report_tool.get_report(MONTH),
+        "paul.update_sheet_individual": lambda: update_sheet_tool.update_sheet_individual(MONTH),
+        "paul.republish_summary": republish_summary,
+        "maria.get_tvl_report": lambda: weekly_kpi_tool.get_tvl_report(WEEK),
+        "maria.get_kpis_report": lambda: weekly_kpi_tool.get_kpis_report(WEEK),
+        "maria.publish_kpis": lambda: publish_tool.publish_kpis(WEEK, "Financials & OnChain"),
+        "combined.monthly_then_weekly": monthly_then_weekly,
+    }
+
+
+def stage_breakdown(snapshot: dict) -> dict:
+    """Total seconds spent per tool and per upstream during one run"""
+    stages = {}
+    for h in snapshot["histograms"]:
+        if h["name"] == "tool_duration_seconds":
+            stages[f"tool:{h['labels']['tool']}"] = h["sum"]
+        elif h["name"] == "upstream_duration_seconds":
+            stages[f"upstream:{h['labels']['upstream']}"] = h["sum"]
+    return {k: round(v, 4) for k, v in sorted(stages.items())}
+
+
+async def run(selected, repeat: int, env):
+    from utils.cache import clear_caches
+    from utils.execution import EXECUTORS
+    from utils.metrics import METRICS
+
+    # As at server startup, but waited for, so no scenario pays for spawning the workers
+    for warming in EXECUTORS.warm():
+        warming.result()
+
+    results = {}
+    for name, factory in scenarios().items():
+        if selected and name not in selected:
+            continue
+        timings, stages = [], None
+        for _ in range(repeat):
+            env.sheets.reset()
+            METRICS.reset()
+            # Every run starts cold; warm reuse is measured within a scenario
+            clear_caches()
+            start = time.perf_counter()
+            await factory()
+            timings.append(time.perf_counter() - start)
+            stages = stage_breakdown(METRICS.snapshot())
+        results[name] = {"median": round(statistics.median(timings), 4),
+                         "min": round(min(timings), 4), "stages": stages}
+        print(f"{name:32s} median {results[name]['median']:8.3f}s  min {results[name]['min']:8.3f}s")
+        for stage, seconds in stages.items():
+            print(f"    {stage:40s} {seconds:8.3f}s")
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        allowed = baseline[name]["median"] * (1 + tolerance)
+        if result["median"] > allowed:
+            regressions.append(f"{name}: {result['median']:.3f}s > {allowed:.3f}s "
+                               f"(baseline {baseline[name]['median']:.3f}s +{tolerance:.0%})")
+    return regressions
+
+
+def parse_latency(values) -> dict:
+    latency = {}
+    for item in values or []:
+        key, _, seconds = item.partition("=")
+        if key not in DEFAULT_LATENCY:
+            raise SystemExit(f"Unknown upstream '{key}', expected one of {sorted(DEFAULT_LATENCY)}")
+        latency[key] = float(seconds)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=SECONDS",
+                        help=f"stand-in latency per call (defaults: {DEFAULT_LATENCY})")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the median is compared")
+    parser.add_argument("--only", action="append", help="run only these scenarios")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    latency = parse_latency(args.latency)
+    with stand_ins(latency) as env:
+        results = asyncio.run(run(args.only, args.repeat, env))
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print("No baseline stored yet, run with --update-baseline")
+        return
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+from gspread.utils import DateTimeOption, ValueInputOption
+
+from benchmarks.fixtures import HttpFixtures, bigquery_rows, clickhouse_rows, http_fixtures
+
+DEFAULT_LATENCY = {
+    "http": 0.02,
+    "clickhouse": 0.05,
+    "bigquery": 0.2,
+    "sheets": 0.02,
+}
+
+
+class StandInServer:
+    """Local HTTP server replaying the fixtures of one upstream with a fixed latency"""
+
+    def __init__(self, fixtures: HttpFixtures, latency: float):
+        self.fixtures = fixtures
+        self.latency = latency
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(outer.latency)
+                found = outer.fixtures.get(self.path)
+                if found is None:
+                    self.send_error(404)
+                    return
+                content_type, body = found
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeClickHouseClient:
+    """Stands in for clickhouse_connect's client, replaying catalog query results"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def query(self, sql: str, settings: dict = None, **kwargs):
+        time.sleep(self.latency)
+        rows = clickhouse_rows(sql)
+        summary = {"query_id": (settings or {}).get("query_id", str(uuid.uuid4())),
+                   "read_rows": "1000000", "read_bytes": "64000000",
+                   "elapsed_ns": str(int(self.latency * 1e9))}
+        return SimpleNamespace(result_rows=rows, row_count=len(rows), summary=summary)
+
+    def command(self, sql: str, **kwargs):
+        return None
+
+
+class FakeQueryJob:
+    def __init__(self, sql: str, latency: float):
+        self.sql = sql
+        self.latency = latency
+        self.job_id = str(uuid.uuid4())
+        self.total_bytes_processed = 2_400_000_000
+        self.cache_hit = False
+
+    def result(self, timeout=None):
+        time.sleep(self.latency)
+        return bigquery_rows(self.sql)
+
+    def cancel(self):
+        return True
+
+
+class FakeBigQueryClient:
+    latency = DEFAULT_LATENCY["bigquery"]
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def query(self, sql: str, *args, **kwargs):
+        return FakeQueryJob(sql, self.latency)
+
+
+class FakeWorksheet:
+    def __init__(self, title: str, latency: float, rows: List[List[str]] = None):
+        self.title = title
+        self.latency = latency
+        self.rows = rows or []
+
+    def _cell(self, label: str):
+        col = ord(label[0]) - ord("A")
+        return int(label[1:]) - 1, col
+
+    def _set(self, label: str, value, user_entered: bool = False):
+        r, c = self._cell(label)
+        while len(self.rows) <= r:
+            self.rows.append([])
+        while len(self.rows[r]) <= c:
+            self.rows[r].append("")
+        value = "" if value is None else str(value)
+        if user_entered:
+            # Like Sheets, a typed-in ISO date is stored as a date
+            try:
+                value = datetime.date.fromisoformat(value)
+            except ValueError:
+                pass
+        self.rows[r][c] = value
+
+    @staticmethod
+    def _render(value, date_time_render_option=None):
+        if not isinstance(value, datetime.date):
+            return value
+        if date_time_render_option == DateTimeOption.serial_number:
+            return (value - datetime.date(1899, 12, 30)).days
+        # Displayed in the sheet's locale, not as typed
+        return value.strftime("%m/%d/%Y")
+
+    def update_acell(self, label: str, value):
+        time.sleep(self.latency)
+        self._set(label, value, user_entered=True)
+
+    def batch_get(self, ranges, date_time_render_option=None, **kwargs):
+        time.sleep(self.latency)
+        blocks = []
+        for block in ranges:
+            (top, left), (bottom, right) = (self._cell(label) for label in block.split(":"))
+            values = [[self._render(v, date_time_render_option) for v in row[left:right + 1]]
+                      for row in self.rows[top:bottom + 1]]
+            # Like Sheets, trailing empty cells and rows are left out
+            values = [row[:max((i + 1 for i, v in enumerate(row) if v), default=0)] for row in values]
+            while values and not values[-1]:
+                values.pop()
+            blocks.append(values)
+        return blocks
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        time.sleep(self.latency)
+        for update in data:
+            self._set(update["range"], update["values"][0][0],
+                      user_entered=value_input_option == ValueInputOption.user_entered)
+
+    def get_all_values(self):
+        time.sleep(self.latency)
+        return [[self._render(v) for v in r] for r in self.rows]
+
+    def insert_row(self, values, index: int = 1):
+        time.sleep(self.latency)
+        self.rows.insert(index - 1, [str(v) for v in values])
+
+
+class FakeSpreadsheet:
+    def __init__(self, title: str, latency: float):
+        self.id = uuid.uuid4().hex
+        self.title = title
+        self.latency = latency
+        self.reset()
+
+    def reset(self):
+        self.worksheets: Dict[str, FakeWorksheet] = {
+            "Financials & OnChain": FakeWorksheet("Financials & OnChain", self.latency, [["week"]]),
+            "Algokit": FakeWorksheet("Algokit", self.latency, [["week"]]),
+        }
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26):
+        time.sleep(self.latency)
+        if title in self.worksheets:
+            raise ValueError(f'A sheet with the name "{title}" already exists')
+        self.worksheets[title] = FakeWorksheet(title, self.latency)
+        return self.worksheets[title]
+
+    def worksheet(self, title: str):
+        import gspread
+
+        time.sleep(self.latency)
+        if title not in self.worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+
+class FakeSheetsClient:
+    """Stands in for an authorized gspread client; spreadsheets live in memory"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+
+    def set_timeout(self, timeout=None):
+        pass
+
+    def reset(self):
+        """Empty every spreadsheet; they keep their IDs, like a sheet cleared by hand"""
+        for spreadsheet in self.spreadsheets.values():
+            spreadsheet.reset()
+
+    def open(self, title: str):
+        # A Drive search for the title, then the spreadsheet metadata
+        time.sleep(2 * self.latency)
+        if title not in self.spreadsheets:
+            self.spreadsheets[title] = FakeSpreadsheet(title, self.latency)
+        return self.spreadsheets[title]
+
+    def open_by_key(self, key: str):
+        import gspread
+
+        time.sleep(self.latency)
+        for spreadsheet in self.spreadsheets.values():
+            if spreadsheet.id == key:
+                return spreadsheet
+        raise gspread.SpreadsheetNotFound(key)
+
+
+@contextmanager
+def stand_ins(latency: Dict[str, float]):
+    """
+    Point every upstream the reports use at local stand-ins
+
+    HTTP upstreams get one local server each, wired in through settings.upstreams
+    of a temporary config.json. ClickHouse, BigQuery and Sheets are reached through
+    their client libraries, so those are swapped for in-process replaying clients
+    with the same latency model. Must be entered before the servers are imported.
+
+    Yields:
+        Namespace with the Sheets client, so benchmarks can reset spreadsheets
+    """
+    if any(m.startswith(("tools.", "utils.")) for m in sys.modules):
+        raise RuntimeError("stand_ins() must be entered before the tool modules are imported")
+    latency = {**DEFAULT_LATENCY, **latency}
+    servers = {name: StandInServer(fx, latency["http"]) for name, fx in http_fixtures().items()}
+    for server in servers.values():
+        server.start()
+
+    cache_dir = tempfile.mkdtemp(prefix="analytics-cache-")
+    config = {"settings": {"upstreams": {name: s.url for name, s in servers.items() if name != "active_devs"},
+                           "cache": {"dir": cache_dir},
+                           "archive": {"dir": str(Path(cache_dir) / "archive")},
+                           # Per-call logs would drown the timings; the config reaches the
+                           # spawned worker processes too, through ANALYTICS_CONFIG
+                           "log": {"level": "WARNING"}}}
+    config_file = Path(tempfile.mkstemp(suffix=".json")[1])
+    config_file.write_text(json.dumps(config))
+    os.environ["ANALYTICS_CONFIG"] = str(config_file)
+    os.environ["ACTIVE_DEVS_URL"] = f"{servers['active_devs'].url}/active_devs.json"
+
+    import clickhouse_connect
+    import gspread
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
+
+    sheets = FakeSheetsClient(latency["sheets"])
+    FakeBigQueryClient.latency = latency["bigquery"]
+    clickhouse_connect.get_client = lambda **kwargs: FakeClickHouseClient(latency["clickhouse"])
+    gspread.service_account = lambda *args, **kwargs: sheets
+    bigquery.Client = FakeBigQueryClient
+    service_account.Credentials.from_service_account_file = staticmethod(lambda *args, **kwargs: None)
+    try:
+        yield SimpleNamespace(sheets=sheets, servers=servers)
+    finally:
+        for server in servers.values():
+            server.stop()
+        config_file.unlink(missing_ok=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
@@ -1,129 +1,281 @@
 import asyncio
+import json
 import sys
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from contextlib import AsyncExitStack
 from pathlib import Path
 
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
 
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from dotenv import load_dotenv
 
+from utils.conversation import ConversationMemory
+from utils.results import RESULTS
+
 load_dotenv()  # load environment variables from .env
 
-class MCPClient:
-    def __init__(self, system_prompt: Optional[str] = None):
-        # Initialize session and client objects
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 4096
+# Separates the server name from the tool name when several servers are connected
+NAMESPACE_SEPARATOR = "__"
+
+
+class ServerCrashedError(ConnectionError):
+    """The server process exited while a tool call was waiting for its result"""
+
+
+class _WatchedStream:
+    """Server read stream that fires a callback once the server output ends"""
+
+    def __init__(self, stream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aenter__(self):
+        await self.stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.on_close()
+        return await self.stream.__aexit__(*exc_info)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.stream.__anext__()
+
+
+class ServerConnection:
+    """
+    One MCP server process and its client session
+
+    The process and session live in a dedicated task, so the connection can be torn
+    down and restarted from anywhere (anyio scopes must be exited by the task that
+    entered them).
+
+    Args:
+        name: server name, used to namespace its tools
+        script_path: path to the server script (.py or .js)
+        client: MCPClient receiving the server's log messages and notifications
+        max_concurrent_tools: calls to this server allowed to run at the same time
+    """
+
+    def __init__(self, name: str, script_path: str, client: "MCPClient", max_concurrent_tools: int = 4):
+        self.name = name
+        self.script_path = script_path
+        self.client = client
         self.session: Optional[ClientSession] = None
-        self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
-        self.system_prompt = system_prompt or "You are a helpful AI assistant."
-        self.conversation_history: List[Dict] = []
+        self.tools: List[types.Tool] = []
+        self.semaphore = asyncio.Semaphore(max_concurrent_tools)
+        self.restart_lock = asyncio.Lock()
+        self.closed = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
 
-    async def connect_to_server(self, server_script_path: str):
-        """Connect to an MCP server
-        
-        Args:
-            server_script_path: Path to the server script (.py or .js)
-        """
-        is_python = server_script_path.endswith('.py')
-        is_js = server_script_path.endswith('.js')
+    async def start(self):
+        """Start the server process and initialize its session"""
+        is_python = self.script_path.endswith('.py')
+        is_js = self.script_path.endswith('.js')
         if not (is_python or is_js):
             raise ValueError("Server script must be a .py or .js file")
-            
-        command = "python" if is_python else "node"
+
         server_params = StdioServerParameters(
-            command=command,
-            args=[server_script_path],
+            command="python" if is_python else "node",
+            args=[self.script_path],
             env=None
         )
+        self.closed = asyncio.Event()
+        self._stop = asyncio.Event()
+        ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run(server_params, ready))
+        waiter = asyncio.create_task(ready.wait())
+        await asyncio.wait({self._task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if self._task.done():
+            # Startup failed: surface the error from the connection task
+            self._task.result()
+            raise ServerCrashedError(f"Server '{self.name}' exited during startup")
+        await self.refresh_tools()
+
+    async def _run(self, server_params: StdioServerParameters, ready: asyncio.Event):
+        async with AsyncExitStack() as stack:
+            read, write = await stack.enter_async_context(stdio_client(server_params))
+            self.session = await stack.enter_async_context(
+                ClientSession(_WatchedStream(read, self.closed.set), write,
+                              logging_callback=self.client.handle_log_message,
+                              message_handler=self.client.handle_message)
+            )
+            await self.session.initialize()
+            ready.set()
+            await self._stop.wait()
+
+    async def stop(self):
+        """Close the session and terminate the server process"""
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await self._task
+        except Exception as e:
+            # A crashed process can fail its own teardown; it is gone either way
+            print(f"⚠ Server '{self.name}' did not shut down cleanly: {e}")
+        self._task = None
+        self.session = None
+
+    async def restart(self):
+        """Replace a crashed server process; concurrent callers restart it only once"""
+        async with self.restart_lock:
+            if self.session is not None and not self.closed.is_set():
+                return
+            print(f"\n♻️  Restarting server '{self.name}'")
+            await self.stop()
+            await self.start()
+
+    async def refresh_tools(self):
+        self.tools = (await self.session.list_tools()).tools
+
+    async def call_tool(self, name: str, arguments: Dict, progress_callback=None) -> types.CallToolResult:
+        """
+        Call a tool on this server
+
+        Raises:
+            ServerCrashedError: the process exited before the result arrived. The call
+                is not retried, since it may have had side effects (e.g. sheet writes).
+        """
+        if self.session is None or self.closed.is_set():
+            await self.restart()
+        async with self.semaphore:
+            call = asyncio.create_task(self.session.call_tool(name, arguments, progress_callback=progress_callback))
+            crashed = asyncio.create_task(self.closed.wait())
+            try:
+                await asyncio.wait({call, crashed}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                crashed.cancel()
+                if not call.done():
+                    call.cancel()
+            if not call.done() or call.cancelled():
+                raise ServerCrashedError(f"Server '{self.name}' exited while running {name}")
+            return call.result()
+
+
+class MCPClient:
+    def __init__(self, system_prompt: Optional[str] = None, max_concurrent_tools: int = 4):
+        # Connected servers by name, and the server and tool name behind each tool Claude sees
+        self.servers: Dict[str, ServerConnection] = {}
+        self.tool_routes: Dict[str, Tuple[ServerConnection, str]] = {}
+        self.max_concurrent_tools = max_concurrent_tools
+        self.anthropic = AsyncAnthropic()
+        self.system_prompt = system_prompt or "You are a helpful AI assistant."
+        # Token-bounded history: old tool results are summarized, then old turns dropped
+        self.memory = ConversationMemory()
+        # Tool definitions for Claude, cached for the session until the server
+        # sends notifications/tools/list_changed
+        self.available_tools: Optional[List[Dict]] = None
+
+    async def connect_to_servers(self, server_specs: List[str]):
+        """Start every MCP server in parallel
+
+        Args:
+            server_specs: server script paths, optionally named as name=path
+                (default name: the script name without '_server', e.g. 'weekly_kpis')
+        """
+        for spec in server_specs:
+            name, _, path = spec.rpartition("=")
+            name = name or Path(path).stem.removesuffix("_server")
+            if name in self.servers:
+                raise ValueError(f"Two servers are named '{name}'; name them with name=path")
+            self.servers[name] = ServerConnection(name, path, self, self.max_concurrent_tools)
+
+        await asyncio.gather(*(server.start() for server in self.servers.values()))
+        self.build_tool_catalog()
+        for server in self.servers.values():
+            print(f"\nConnected to {server.name} with tools:", [tool.name for tool in server.tools])
+
+    async def connect_to_server(self, server_script_path: str):
+        """Connect to a single MCP server
         
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
-        
-        await self.session.initialize()
-        
-        # List available tools
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\nConnected to server with tools:", [tool.name for tool in tools])
+        Args:
+            server_script_path: Path to the server script (.py or .js)
+        """
+        await self.connect_to_servers([server_script_path])
+
+    async def refresh_tools(self):
+        """Fetch every server's tool catalog again"""
+        await asyncio.gather(*(server.refresh_tools() for server in self.servers.values()))
+        self.build_tool_catalog()
+
+    def build_tool_catalog(self):
+        """
+        Merge the servers' tools into Claude tool definitions
+
+        With several servers, tools are named <server>__<tool> so that tools sharing
+        a name (e.g. both servers' get_tvl_report) stay distinct. A single server keeps
+        the plain tool names the system prompts refer to.
+        """
+        namespaced = len(self.servers) > 1
+        self.available_tools, self.tool_routes = [], {}
+        for server in self.servers.values():
+            for tool in server.tools:
+                name = f"{server.name}{NAMESPACE_SEPARATOR}{tool.name}" if namespaced else tool.name
+                description = f"[{server.name}] {tool.description or ''}" if namespaced else tool.description
+                self.tool_routes[name] = (server, tool.name)
+                self.available_tools.append({
+                    "name": name,
+                    "description": description,
+                    "input_schema": tool.inputSchema
+                })
+        # Cache breakpoint after the last tool caches every tool definition
+        if self.available_tools:
+            self.available_tools[-1]["cache_control"] = {"type": "ephemeral"}
+
+    async def handle_message(self, message):
+        """Drop the cached tool catalog when the server says it changed"""
+        # Only invalidate here: awaiting list_tools inside the receive loop would deadlock
+        if isinstance(message, types.ServerNotification) and \
+                isinstance(message.root, types.ToolListChangedNotification):
+            self.available_tools = None
 
     async def process_query(self, query: str) -> str:
         """Process a query using Claude and available tools"""
         # Add user message to conversation history
-        self.conversation_history.append({
+        self.memory.append({
             "role": "user",
             "content": query
         })
 
-        response = await self.session.list_tools()
-        available_tools = [{ 
-            "name": tool.name,
-            "description": tool.description,
-            "input_schema": tool.inputSchema
-        } for tool in response.tools]
+        if self.available_tools is None:
+            await self.refresh_tools()
 
         # Initial Claude API call with system prompt and conversation history
-        response = self.anthropic.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=4096,
-            system=self.system_prompt,  # Add system prompt here
-            messages=self.conversation_history,
-            tools=available_tools
-        )
+        response, tool_tasks = await self.stream_message()
 
         # Process response and handle tool calls
-        assistant_response_parts = []
-        
         while response.stop_reason == "tool_use":
-            # Collect all content from this turn
-            assistant_content = []
-            
-            for content in response.content:
-                if content.type == 'text':
-                    assistant_response_parts.append(content.text)
-                    assistant_content.append(content.model_dump())
-                elif content.type == 'tool_use':
-                    tool_name = content.name
-                    tool_args = content.input
-                    
-                    print(f"\n🔧 Calling tool: {tool_name}")
-                    
-                    # Add to assistant content
-                    assistant_content.append(content.model_dump())
-                    
-                    # Execute tool call
-                    result = await self.session.call_tool(tool_name, tool_args)
-                    
-                    # Add assistant message with tool use
-                    self.conversation_history.append({
-                        "role": "assistant",
-                        "content": assistant_content
-                    })
-                    
-                    # Add tool result as user message
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": [{
-                            "type": "tool_result",
-                            "tool_use_id": content.id,
-                            "content": result.content
-                        }]
-                    })
-                    
-                    # Reset for next iteration
-                    assistant_content = []
+            # The whole turn (text and every tool_use block) is one assistant message
+            self.memory.append({
+                "role": "assistant",
+                "content": [content.model_dump() for content in response.content]
+            })
+
+            # The calls were started while the message streamed; gather keeps their order
+            tool_results = await asyncio.gather(*tool_tasks)
+
+            # All tool results go back as a single user message
+            self.memory.append({
+                "role": "user",
+                "content": list(tool_results)
+            })
 
             # Get next response from Claude with updated conversation
-            response = self.anthropic.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=4096,
-                system=self.system_prompt,
-                messages=self.conversation_history,
-                tools=available_tools
-            )
+            print("\n", flush=True)
+            response, tool_tasks = await self.stream_message()
+
+        # A message cut short (e.g. max_tokens) may still have started tool calls
+        for task in tool_tasks:
+            task.cancel()
 
         # Handle final response (non-tool-use)
         final_text = []
@@ -136,18 +288,159 @@ class MCPClient:
 
         # Add final assistant response to history
         if final_content:
-            self.conversation_history.append({
+            self.memory.append({
                 "role": "assistant",
                 "content": final_content
             })
 
         return "\n".join(final_text) if final_text else "No response generated."
 
+    async def stream_message(self):
+        """
+        Stream Claude's next message, printing text as it arrives
+
+        Each tool_use block is started as soon as it is complete, while the rest of
+        the message is still streaming.
+
+        Returns:
+            The final message and the tasks of the tool calls it started, in block order
+        """
+        tool_tasks = []
+        try:
+            async with self.anthropic.messages.stream(
+                model=MODEL,
+                max_tokens=MAX_TOKENS,
+                # Tools and system prompt are identical on every call: cache them
+                system=[{"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}}],
+                messages=self.cached_history(),
+                tools=self.available_tools
+            ) as stream:
+                async for event in stream:
+                    if event.type == "text":
+                        print(event.text, end="", flush=True)
+                    elif event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                        tool_tasks.append(asyncio.create_task(self.call_tool(event.content_block)))
+                response = await stream.get_final_message()
+        except BaseException:
+            # A failed or interrupted stream must not leave tool calls running
+            for task in tool_tasks:
+                task.cancel()
+            raise
+        return response, tool_tasks
+
+    def cached_history(self) -> List[Dict]:
+        """
+        Conversation history with a cache breakpoint on its last block
+
+        Each round of the tool loop resends everything before the newest message,
+        so that prefix is read from the prompt cache. The breakpoint is set on a copy
+        to keep the stored history clean.
+        """
+        history = self.memory.api_messages()
+        if not history:
+            return history
+        last = history[-1]
+        content = last["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        content = [*content[:-1], {**content[-1], "cache_control": {"type": "ephemeral"}}]
+        return [*history[:-1], {**last, "content": content}]
+
+    async def call_tool(self, tool_use) -> Dict:
+        """Route one tool_use block to its server and return its tool_result content block"""
+        print(f"\n🔧 Calling tool: {tool_use.name}")
+        try:
+            if tool_use.name not in self.tool_routes:
+                raise ValueError(f"Unknown tool '{tool_use.name}'")
+            server, tool_name = self.tool_routes[tool_use.name]
+            result = await server.call_tool(tool_name, tool_use.input, progress_callback=self.handle_progress)
+        except ServerCrashedError as e:
+            # Bring the server back for the next call; the conversation is kept
+            try:
+                await server.restart()
+                status = "The server was restarted; the call can be retried."
+            except Exception as restart_error:
+                status = f"Restarting the server failed: {restart_error}"
+            return {
+                "type": "tool_result",
+                "tool_use_id": tool_use.id,
+                "content": f"Error: {e}. {status}",
+                "is_error": True
+            }
+        except Exception as e:
+            # Report the failure to Claude instead of aborting the other calls
+            return {
+                "type": "tool_result",
+                "tool_use_id": tool_use.id,
+                "content": f"Error: {e}",
+                "is_error": True
+            }
+        return {
+            "type": "tool_result",
+            "tool_use_id": tool_use.id,
+            "content": [content.model_dump() for content in result.content],
+            "is_error": result.isError
+        }
+
+    async def handle_progress(self, progress: float, total: Optional[float], message: Optional[str]):
+        """Print progress notifications sent by long-running tools"""
+        counter = f"{progress:g}/{total:g}" if total else f"{progress:g}"
+        print(f"   ⏳ [{counter}] {message or ''}")
+
+    async def handle_log_message(self, params: types.LoggingMessageNotificationParams):
+        """Print partial report rows streamed by the server before the tool returns"""
+        if params.logger == "partial_result":
+            print(f"   📊 {params.data}")
+
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.memory.clear()
         print("✓ Conversation history cleared.")
 
+    def show_memory(self):
+        """Print how much of the history budget is used"""
+        stats = self.memory.stats()
+        print(f"\n🧠 {stats['turns']} turns, {stats['messages']} messages, "
+              f"~{stats['estimated_tokens']:,}/{stats['token_budget']:,} tokens")
+        print(f"   {stats['archived_tool_results']} tool results summarized, "
+              f"{stats['dropped_turns']} turns dropped")
+
+    def recall_result(self, args: List[str]):
+        """Print a tool result that was summarized to save context"""
+        if len(args) != 1:
+            print("\nUsage: recall <ref>")
+            return
+        content = self.memory.archived(args[0])
+        if content is None:
+            print(f"\n❌ No summarized tool result with ref {args[0]}")
+            return
+        print(f"\n🗂️  Tool result {args[0]}:")
+        print(content if isinstance(content, str) else json.dumps(content, indent=2, default=str))
+
+    def show_results(self):
+        """Print the large tool results kept in the result store"""
+        results = RESULTS.list()
+        if not results:
+            print("\n📦 No stored results.")
+            return
+        print(f"\n📦 {len(results)} stored results:")
+        for result in results:
+            print(f"   {result['result_handle']}  {result['rows']:>10,} rows  "
+                  f"{result['source']:<24} {result['stored_at']}")
+
+    def export_result(self, args: List[str]):
+        """Save a stored result, so the analyst can open it without re-running the query"""
+        if len(args) != 2:
+            print("\nUsage: export <handle> <file.csv|file.parquet>")
+            return
+        handle, path = args
+        try:
+            RESULTS.export(handle, path)
+        except (KeyError, ValueError) as e:
+            print(f"\n❌ {e}")
+            return
+        print(f"\n✓ Result {handle} saved to {path}")
+
     async def chat_loop(self):
         """Run an interactive chat loop"""
         print("\n" + "="*60)
@@ -158,6 +451,10 @@ class MCPClient:
         print("  • 'quit' or 'exit' - End the conversation")
         print("  • 'clear' - Clear conversation history")
         print("  • 'prompt' - View system prompt")
+        print("  • 'memory' - View conversation memory usage")
+        print("  • 'recall <ref>' - Show a tool result summarized to save context")
+        print("  • 'results' - List large results stored by the tools")
+        print("  • 'export <handle> <file.csv|file.parquet>' - Save a stored result")
         print("="*60 + "\n")
         
         while True:
@@ -172,6 +469,22 @@ class MCPClient:
                     self.clear_history()
                     continue
                 
+                if query.lower() == 'memory':
+                    self.show_memory()
+                    continue
+
+                if query.lower().startswith('recall '):
+                    self.recall_result(query.split()[1:])
+                    continue
+
+                if query.lower() == 'results':
+                    self.show_results()
+                    continue
+
+                if query.lower().startswith('export '):
+                    self.export_result(query.split()[1:])
+                    continue
+
                 if query.lower() == 'prompt':
                     print("\n" + "="*60)
                     print("CURRENT SYSTEM PROMPT:")
@@ -184,8 +497,9 @@ class MCPClient:
                     continue
                     
                 print("\n🟢 Paul: ", end="", flush=True)
-                response = await self.process_query(query)
-                print(response)
+                # The reply is printed while it streams
+                await self.process_query(query)
+                print()
                     
             except KeyboardInterrupt:
                 print("\n\n👋 Conversation interrupted. Goodbye!")
@@ -197,7 +511,7 @@ class MCPClient:
     
     async def cleanup(self):
         """Clean up resources"""
-        await self.exit_stack.aclose()
+        await asyncio.gather(*(server.stop() for server in self.servers.values()))
 
 def load_system_prompt(prompt_path: str = "docs/prompt.txt") -> str:
     """Load system prompt from file"""
@@ -212,21 +526,26 @@ def load_system_prompt(prompt_path: str = "docs/prompt.txt") -> str:
 
 async def main():
     if len(sys.argv) < 2:
-        print("Usage: python client.py <path_to_server_script> [path_to_prompt]")
+        print("Usage: python client.py <server_script> [<server_script> ...] [path_to_prompt]")
         print("\nExample:")
         print("  python client.py server.py")
         print("  python client.py server.py docs/prompt.txt")
+        print("  python client.py paul=algo_insights_server.py maria=weekly_kpis_server.py")
         sys.exit(1)
     
+    # Server scripts end in .py/.js; anything else is the system prompt
+    servers = [arg for arg in sys.argv[1:] if arg.endswith(('.py', '.js'))]
+    prompts = [arg for arg in sys.argv[1:] if not arg.endswith(('.py', '.js'))]
+
     # Load system prompt
-    prompt_path = sys.argv[2] if len(sys.argv) > 2 else "docs/prompt.txt"
+    prompt_path = prompts[0] if prompts else "docs/prompt.txt"
     system_prompt = load_system_prompt(prompt_path)
     
     # Create client with system prompt
     client = MCPClient(system_prompt=system_prompt)
     
     try:
-        await client.connect_to_server(sys.argv[1])
+        await client.connect_to_servers(servers)
         await client.chat_loop()
     finally:
         await client.cleanup()
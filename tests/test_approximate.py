@@ -0,0 +1,37 @@
+import asyncio
+
+from utils import approximate
+from utils.approximate import FROM_TABLE, approximate_query
+
+
+def test_from_table_skips_a_table_already_sampled():
+    assert FROM_TABLE.findall("SELECT count() FROM mainnet.txn SAMPLE 0.1") == []
+
+
+def test_from_table_matches_whole_names():
+    sql = "SELECT count() FROM mainnet.txn t JOIN (SELECT * FROM mainnet.acct SAMPLE 0.5) a ON t.snd = a.addr"
+    assert FROM_TABLE.findall(sql) == ["mainnet.txn"]
+
+
+def test_approximate_query_keeps_an_existing_sample(monkeypatch):
+    async def sampling_keys():
+        return {"mainnet.txn": "cityHash64(snd)"}
+
+    monkeypatch.setattr(approximate, "sampling_keys", sampling_keys)
+    monkeypatch.setitem(approximate.APPROXIMATE_SETTINGS, "function", "uniqCombined")
+    sql = "SELECT count(distinct snd) FROM mainnet.txn SAMPLE 0.1 WHERE round > 0"
+    result = asyncio.run(approximate_query(sql))
+    assert result.sql == "SELECT uniqCombined(snd) FROM mainnet.txn SAMPLE 0.1 WHERE round > 0"
+    assert result.sample == 1.0
+
+
+def test_approximate_query_samples_tables_keyed_on_the_counted_column(monkeypatch):
+    async def sampling_keys():
+        return {"mainnet.txn": "cityHash64(snd)"}
+
+    monkeypatch.setattr(approximate, "sampling_keys", sampling_keys)
+    monkeypatch.setitem(approximate.APPROXIMATE_SETTINGS, "function", "uniqCombined")
+    monkeypatch.setitem(approximate.APPROXIMATE_SETTINGS, "sample", 0.1)
+    result = asyncio.run(approximate_query("SELECT count(distinct snd) FROM mainnet.txn WHERE round > 0"))
+    assert result.sql == "SELECT round(uniqCombined(snd) / 0.1) FROM mainnet.txn SAMPLE 0.1 WHERE round > 0"
+    assert result.sample == 0.1
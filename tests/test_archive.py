@@ -0,0 +1,38 @@
+import asyncio
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from utils import archive
+from utils.archive import MetricArchive, archived, trend
+
+MONTH = "2025-03-31"
+
+
+@pytest.fixture
+def metric_archive(tmp_path, monkeypatch):
+    monkeypatch.setitem(archive.ARCHIVE_SETTINGS, "enabled", True)
+    return MetricArchive(str(tmp_path))
+
+
+def report_run(metric_archive, mau, failed=()):
+    @archived("test_report", "month", archive=metric_archive, scheduler=SimpleNamespace(is_settled=lambda _: True))
+    async def get_report(month=None):
+        frame = pd.DataFrame({"query": ["mau"], MONTH: [mau]})
+        frame.attrs["failed"] = list(failed)
+        return frame
+
+    return asyncio.run(get_report(MONTH))
+
+
+def test_a_complete_run_is_archived(metric_archive):
+    report_run(metric_archive, 1200)
+    assert metric_archive.read("month")["value"].tolist() == [1200]
+
+
+def test_a_failed_run_does_not_replace_a_good_one(metric_archive):
+    report_run(metric_archive, 1200)
+    result = report_run(metric_archive, 0, failed=["mau"])
+    assert result.attrs["failed"] == ["mau"]
+    assert trend("month", ["mau"], archive=metric_archive)["summary"]["mau"]["last"]["value"] == 1200
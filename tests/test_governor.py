@@ -0,0 +1,11 @@
+from utils.governor import QueryGovernor
+
+
+def test_adhoc_queries_always_run_readonly():
+    governor = QueryGovernor({"adhoc_settings": {"readonly": 2, "max_rows_to_read": 1000}})
+    assert governor.profile("adhoc") == {"readonly": 1, "max_rows_to_read": 1000}
+
+
+def test_report_queries_keep_their_configured_settings():
+    governor = QueryGovernor({"report_settings": {"readonly": 2, "max_threads": 8}})
+    assert governor.profile("report") == {"readonly": 2, "max_threads": 8}
@@ -0,0 +1,31 @@
+import pytest
+
+from benchmarks.explain import CATALOGS, clickhouse_queries
+from utils.sargable import issues, rewrite
+
+
+def test_date_filter_becomes_a_utc_range():
+    sql = "SELECT count() FROM mainnet.txn WHERE toDate(realtime) = WEEK"
+    assert rewrite(sql) == ("SELECT count() FROM mainnet.txn WHERE "
+                            "(realtime >= toDateTime(WEEK, 'UTC') AND realtime < toDateTime(WEEK, 'UTC') + INTERVAL 1 DAY)")
+
+
+def test_zoneless_bound_is_flagged_and_fixed():
+    sql = "SELECT count() FROM mainnet.txn WHERE ts >= toDateTime(MONTH) AND ts < toDateTime(f(MONTH, 1))"
+    assert len(issues(sql)) == 2
+    fixed = rewrite(sql)
+    assert fixed == ("SELECT count() FROM mainnet.txn WHERE ts >= toDateTime(MONTH, 'UTC') "
+                     "AND ts < toDateTime(f(MONTH, 1), 'UTC')")
+    assert issues(fixed) == []
+
+
+def test_bound_with_a_zone_is_left_alone():
+    sql = "SELECT 1 WHERE ts >= toDateTime(MONTH, 'Europe/Paris')"
+    assert issues(sql) == []
+    assert rewrite(sql) == sql
+
+
+@pytest.mark.parametrize("catalog", CATALOGS, ids=lambda path: path.parent.name)
+def test_catalog_queries_have_no_issues(catalog):
+    for name, sql in clickhouse_queries(catalog.read_text()).items():
+        assert issues(sql) == [], name
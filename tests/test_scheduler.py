@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from utils.cache import PersistentCache
+from utils.scheduler import PrefetchScheduler
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, **delta):
+        self.now += timedelta(**delta)
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    def make(now: datetime) -> PrefetchScheduler:
+        settings = {"delay_hours": 2, "week_ends_on": 6, "retry_minutes": 30, "max_retry_minutes": 120}
+        return PrefetchScheduler(clock=FakeClock(now), settings=settings,
+                                 cache=PersistentCache("reports", str(tmp_path)))
+    return make
+
+
+def test_month_closes_after_the_delay(scheduler):
+    prefetch = scheduler(utc(2025, 5, 1, 1, 59))
+    assert prefetch.last_closed("month") == "2025-03-31"
+    assert not prefetch.is_settled("2025-04-30")
+    prefetch.clock.advance(minutes=1)
+    assert prefetch.last_closed("month") == "2025-04-30"
+    assert prefetch.is_settled("2025-04-30")
+
+
+def test_week_closes_after_the_delay(scheduler):
+    # 2025-04-27 is a Sunday
+    prefetch = scheduler(utc(2025, 4, 28, 1, 59))
+    assert prefetch.last_closed("week") == "2025-04-20"
+    assert not prefetch.is_settled("2025-04-27")
+    prefetch.clock.advance(minutes=1)
+    assert prefetch.last_closed("week") == "2025-04-27"
+    assert prefetch.is_settled("2025-04-27")
+
+
+def test_unparseable_period_is_never_settled(scheduler):
+    prefetch = scheduler(utc(2025, 5, 1, 12))
+    assert not prefetch.is_settled(None)
+    assert not prefetch.is_settled("April")
+
+
+def test_failed_prefetch_is_retried_with_backoff(scheduler):
+    prefetch = scheduler(utc(2025, 5, 1, 2))
+    calls = []
+
+    async def report(period_end):
+        calls.append(period_end)
+        if len(calls) <= 2:
+            raise ConnectionError("upstream down")
+        return pd.DataFrame({"query": ["mau"], period_end: [1.0]})
+
+    prefetch.add_report("get_report", "month", report)
+    assert asyncio.run(prefetch.tick()) == []
+    prefetch.clock.advance(minutes=29)
+    asyncio.run(prefetch.tick())
+    assert len(calls) == 1
+    prefetch.clock.advance(minutes=1)
+    asyncio.run(prefetch.tick())
+    assert len(calls) == 2
+    # The second failure doubles the wait
+    prefetch.clock.advance(minutes=59)
+    asyncio.run(prefetch.tick())
+    assert len(calls) == 2
+    prefetch.clock.advance(minutes=1)
+    assert asyncio.run(prefetch.tick()) == ["get_report:2025-04-30"]
+    assert calls == ["2025-04-30"] * 3
+    hit, cached = prefetch.cache.get("get_report:2025-04-30")
+    assert hit and cached["2025-04-30"].tolist() == [1.0]
+    # Done for this period
+    prefetch.clock.advance(hours=12)
+    assert asyncio.run(prefetch.tick()) == []
+    assert len(calls) == 3
+
+
+def test_report_that_stays_failed_is_never_cached(scheduler):
+    prefetch = scheduler(utc(2025, 5, 1, 2))
+    calls = []
+
+    async def report(period_end):
+        calls.append((prefetch.clock(), period_end))
+        frame = pd.DataFrame({"query": ["mau"], period_end: [0.0]})
+        frame.attrs["failed"] = ["mau"]
+        return frame
+
+    prefetch.add_report("get_report", "month", report)
+    for _ in range(24 * 6):
+        asyncio.run(prefetch.tick())
+        prefetch.clock.advance(minutes=10)
+    waits = [b[0] - a[0] for a, b in zip(calls, calls[1:])]
+    assert waits[:3] == [timedelta(minutes=30), timedelta(minutes=60), timedelta(minutes=120)]
+    assert set(waits[3:]) == {timedelta(minutes=120)}
+    assert not prefetch.cache.get("get_report:2025-04-30")[0]
+
+    # Once the next month closes it is tried at once, with the backoff reset
+    prefetch.clock.now = utc(2025, 6, 1, 2)
+    asyncio.run(prefetch.tick())
+    assert calls[-1] == (utc(2025, 6, 1, 2), "2025-05-31")
+    assert prefetch.reports["get_report"].retry_at == utc(2025, 6, 1, 2, 30)
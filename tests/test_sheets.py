@@ -0,0 +1,20 @@
+from benchmarks.standins import FakeWorksheet
+from utils.sheets import reconcile, same_cell, serial_number
+
+
+def test_serial_number_of_an_iso_date():
+    assert serial_number("2025-03-31") == 45747
+    assert serial_number("Q1 2025") == "Q1 2025"
+
+
+def test_a_date_matches_its_serial_number():
+    assert same_cell(45747, "2025-03-31")
+    assert not same_cell(45746, "2025-03-31")
+
+
+def test_reconcile_leaves_dates_already_written():
+    worksheet = FakeWorksheet("Summary", latency=0)
+    cells = {"F3": "2025-03-01", "G3": "2025-03-31", "B5": 12.5}
+    assert sorted(reconcile(worksheet, cells)) == ["B5", "F3", "G3"]
+    assert reconcile(worksheet, cells) == []
+    assert reconcile(worksheet, {**cells, "G3": "2025-04-30"}) == ["G3"]
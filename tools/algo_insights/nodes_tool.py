@@ -1,26 +1,8 @@
-import requests
 from typing import Dict, List, Any, Tuple, Optional
 from algo_insights_server import mcp 
-import os 
-from dotenv import load_dotenv 
-
-load_dotenv ()
-
-USER = os.getenv("NODELY_API_USER")
-PASS = os.getenv("NODELY_API_PASS")
-
-
-class Nodes: 
-
-    async def get_nodes(self, month: str) -> Any:
-        url = f"https://algoanalytics.api.nodely.io/v1/env/network/nodes/{month}"
-
-        response = requests.get(url, auth=(USER, PASS))
-        result = response.json()['unique_ips']
-        return result
+from utils.core import Nodes, NODES
     
 @mcp.tool()
 async def execute_get_nodes(month: str) -> Any:
-    api = Nodes()
-    return await api.get_nodes(month)
-    
\ No newline at end of file
+    return await NODES.get_nodes(month)
+    
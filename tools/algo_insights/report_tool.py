@@ -4,10 +4,51 @@ from tools.algo_insights.tvl_tool import get_defillama_tvl, get_coingecko_price,
 from tools.algo_insights.queries_tool import execute_query_tool
 from tools.algo_insights.nodes_tool import execute_get_nodes
 from algo_insights_server import mcp 
+from mcp.server.fastmcp import Context
+from utils.log import get_logger
+from utils.progress import ReportProgress
+from utils.execution import with_deadline
+from utils.report_model import ReportMetrics
+from utils.scheduler import prefetched
+from utils.archive import archived
+from utils.governor import report_workload
+from utils.approximate import approximate_query
 import pandas as pd 
 import numpy as np
 import yaml
 
+logger = get_logger("algo_insights.report")
+
+INITIAL_STAKE = 8326259584
+INITIAL_BALANCE = 5504018
+
+TVL_ROWS = ['tvl_usd', 'tvl_algo', 'rwa_tvl', 'circulating_supply']
+
+# Output order of get_report; everything else in the model (e.g. price) is an input only
+REPORT_ROWS = ['nodes', 'total_fee_sink_balance', 'inflation_amount', 'inflation',
+               'stables_mcap', *TVL_ROWS]
+
+
+def declare_derived_metrics(metrics: ReportMetrics):
+    """Derived metrics of the monthly report and the metrics each depends on"""
+    metrics.derive('total_fee_sink_balance', ['fee_sink_balance', 'fees_collected_cumulative'],
+                   lambda balance, fees: balance + fees)
+    metrics.derive('inflation_amount', ['gross_issuance', 'total_fee_sink_balance'],
+                   lambda issuance, fee_sink: (issuance + INITIAL_BALANCE) - fee_sink)
+    metrics.derive('inflation', ['inflation_amount'], lambda amount: amount / INITIAL_STAKE)
+    metrics.derive('tvl_algo', ['tvl_usd', 'price'], lambda tvl, price: tvl / price)
+    metrics.derive('circulating_supply', ['market_cap', 'price'], lambda mcap, price: mcap / price)
+
+
+async def collect_tvl_inputs(metrics: ReportMetrics):
+    """Fetch the DeFiLlama, CoinGecko and RWA inputs of the TVL rows"""
+    curr, prev = metrics.curr_label, metrics.prev_label
+    metrics.add('tvl_usd', await get_defillama_tvl(curr), await get_defillama_tvl(prev))
+    metrics.add('price', await get_coingecko_price(curr, 'price'), await get_coingecko_price(prev, 'price'))
+    metrics.add('market_cap', await get_coingecko_price(curr, 'market_cap'),
+                await get_coingecko_price(prev, 'market_cap'))
+    metrics.add('rwa_tvl', await get_rwa_tvl(curr), await get_rwa_tvl(prev))
+
 @mcp.tool()
 async def get_tvl_report(month: Optional[str] = None):
     # Set default month to current month if not provided
@@ -44,33 +85,11 @@ async def get_tvl_report(month: Optional[str] = None):
     
     except ValueError:
         return f"Error: Invalid date format. Please use YYYY-MM-DD (e.g., 2023-12-31)."
-    data = []
-
-    defillama_tvl_usd_curr = await get_defillama_tvl(curr_month_end)
-    defillama_tvl_usd_prev = await get_defillama_tvl(prev_month_end)
-    coingecko_price_curr = await get_coingecko_price(curr_month_end, 'price')
-    coingecko_price_prev = await get_coingecko_price(prev_month_end, 'price')
-    mcap_curr = await get_coingecko_price(curr_month_end, 'market_cap')
-    mcap_prev = await get_coingecko_price(prev_month_end, 'market_cap') 
-    defillama_tvl_algo_curr = defillama_tvl_usd_curr / coingecko_price_curr
-    defillama_tvl_algo_prev = defillama_tvl_usd_prev / coingecko_price_prev
-    circulating_supply_curr = mcap_curr / coingecko_price_curr
-    circulating_supply_prev = mcap_prev / coingecko_price_prev
-
-    # Calculate the inflation rate
-
-    rwa_tvl_curr = await get_rwa_tvl(curr_month_end)
-    rwa_tvl_prev = await get_rwa_tvl(prev_month_end)
-    rows = [
-        {"query": "tvl_usd", curr_month_end: defillama_tvl_usd_curr, prev_month_end: defillama_tvl_usd_prev},
-        {"query": "tvl_algo", curr_month_end: defillama_tvl_algo_curr, prev_month_end: defillama_tvl_algo_prev},
-        {"query": "rwa_tvl", curr_month_end: rwa_tvl_curr, prev_month_end: rwa_tvl_prev},
-        {"query": "circulating_supply", curr_month_end: circulating_supply_curr, prev_month_end: circulating_supply_prev}
-    ]
-    df = pd.DataFrame(rows)
-    df['change'] = df[curr_month_end]/df[prev_month_end] - 1
-    
-    return df
+    metrics = ReportMetrics(curr_month_end, prev_month_end)
+    declare_derived_metrics(metrics)
+    await collect_tvl_inputs(metrics)
+
+    return metrics.to_frame(TVL_ROWS)
 
 @mcp.tool()
 async def get_stables_mcap(month: Optional[str] = None):
@@ -112,17 +131,29 @@ async def get_stables_mcap(month: Optional[str] = None):
     stables_tvl_curr = await get_stables_tvl(curr_month_end)
     stables_tvl_prev = await get_stables_tvl(prev_month_end)
 
-    rows = [
-        {"query": "stables_mcap", curr_month_end: stables_tvl_curr, prev_month_end: stables_tvl_prev}
-    ]
-    df = pd.DataFrame(rows)
-    df['change'] = df[curr_month_end]/df[prev_month_end] - 1
-    
-    return df
+    metrics = ReportMetrics(curr_month_end, prev_month_end)
+    metrics.add('stables_mcap', stables_tvl_curr, stables_tvl_prev)
+
+    return metrics.to_frame()
 
 
 @mcp.tool()
-async def get_report(month: Optional[str] = None) -> Any:
+@prefetched("get_report", "month", preview_param="approximate")
+@archived("get_report", "month", preview_param="approximate")
+@with_deadline()
+@report_workload
+async def get_report(month: Optional[str] = None, approximate: bool = False, refresh: bool = False,
+                     ctx: Context = None) -> Any:
+    """
+    Monthly report comparing the month ending on `month` with the previous month
+
+    With approximate=True, distinct counts (monthly active users) are estimated
+    with ClickHouse sketches and sampling for a fast preview. Their error bounds
+    are added as <date>_error columns. Publish exact reports only.
+
+    With refresh=True, a closed month is recomputed instead of being served from
+    the report cache (see settings.prefetch).
+    """
     # Predefined queries from the documentation
     with open('docs/algo_insights/queries.yaml', 'r') as f:
         QUERIES = yaml.safe_load(f)
@@ -166,75 +197,46 @@ async def get_report(month: Optional[str] = None) -> Any:
         
     except ValueError:
         return f"Error: Invalid date format. Please use YYYY-MM-DD (e.g., 2023-12-31)."
-    data = []
-    
+    metrics = ReportMetrics(curr_month_end, prev_month_end)
+    declare_derived_metrics(metrics)
+    # One step per catalog query, plus nodes, stables mcap and the TVL inputs
+    progress = ReportProgress(ctx, "get_report", len(QUERIES) + 3)
 
     for query_name, query_info in QUERIES.items():
         query_sql = query_info["sql"]
-        print(query_sql)
+        logger.debug("running query", extra={"query": query_name})
         query_sql = query_sql.replace("START_1", f"'{prev_month_start}'")
         query_sql = query_sql.replace("START_2", f"'{curr_month_start}'")
         query_sql = query_sql.replace("PREV_MONTH", f"'{prev_month_end}'")
         query_sql = query_sql.replace("CURR_MONTH", f"'{curr_month_end}'")
-        result = await execute_query_tool(query_sql)
+        approximation = await approximate_query(query_sql) if approximate else None
+        # Catalog queries are reviewed, and some scan the whole history by design: under
+        # the report workload they skip the pre-flight
+        result = await execute_query_tool(approximation.sql if approximation else query_sql)
         
         # Convert result to dict with date as keys
         row = {"query": query_name}
         for date, value in result.result_rows:
             row[date] = value
-        data.append(row)
+        errors = {date: approximation.bound(value) for date, value in result.result_rows} if approximation else None
+        metrics.add_row(row, errors)
+        await progress.advance(query_name, row)
 
     curr_nodes = await execute_get_nodes(curr_month_end)
     prev_nodes = await execute_get_nodes(prev_month_end)
 
     row = {'query': 'nodes', curr_month_end: curr_nodes, prev_month_end: prev_nodes}
-    data.append(row)
-
-    df = pd.DataFrame(data)
-    fee_sink_balance_curr = df[df['query'] == 'fee_sink_balance'][curr_month_end].values[0]
-    fee_sink_balance_prev = df[df['query'] == 'fee_sink_balance'][prev_month_end].values[0]
-    cumulative_fees_collected_curr = df[df['query'] == 'fees_collected_cumulative'][curr_month_end].values[0]
-    cumulative_fees_collected_prev = df[df['query'] == 'fees_collected_cumulative'][prev_month_end].values[0]
-    total_fee_sink_balance_curr = fee_sink_balance_curr + cumulative_fees_collected_curr 
-    total_fee_sink_balance_prev = fee_sink_balance_prev + cumulative_fees_collected_prev
-    
-    initial_stake = 8326259584
-    initial_balance = 5504018
-    
-    gross_issuance_curr = df[df['query']=='gross_issuance'][curr_month_end].values[0]
-    gross_issuance_prev = df[df['query']=='gross_issuance'][prev_month_end].values[0]
-    token_issuance_curr = (gross_issuance_curr + initial_balance) - total_fee_sink_balance_curr 
-    token_issuance_prev = (gross_issuance_prev + initial_balance) - total_fee_sink_balance_prev
-    inflation_rate_curr = token_issuance_curr / initial_stake
-    inflation_rate_prev = token_issuance_prev / initial_stake
-    inflation_rows = [
-        {'query': 'total_fee_sink_balance', curr_month_end: total_fee_sink_balance_curr, prev_month_end: total_fee_sink_balance_prev},
-        {'query': 'inflation_amount', curr_month_end: token_issuance_curr, prev_month_end: token_issuance_prev},
-        {'query': 'inflation', curr_month_end: inflation_rate_curr, prev_month_end: inflation_rate_prev}
-    ]
-
-    balance_df = pd.DataFrame(inflation_rows)
-    df = pd.concat([df, balance_df], ignore_index=True)
-
-    df['change'] = np.where(
-    df[prev_month_end] == 0,
-    0,  
-    df[curr_month_end] / df[prev_month_end] - 1 
-    )
-
-    df = df.replace([np.inf, -np.inf], 0).fillna(0)
-    stables_mcap = await get_stables_mcap(month)
-    tvl = await get_tvl_report(month)
-    df = pd.concat([df, stables_mcap, tvl], ignore_index=True)
+    metrics.add_row(row)
+    await progress.advance('nodes', row)
 
-    
-    inflation_df = pd.DataFrame(inflation_rows)
-    inflation_df['change'] = np.where(
-        inflation_df[prev_month_end] == 0,
-        0,  
-        inflation_df[curr_month_end] / inflation_df[prev_month_end] - 1 
-    )
-    df = pd.concat([df, inflation_df])
-
-    return df
+    stables_tvl_curr = await get_stables_tvl(curr_month_end)
+    stables_tvl_prev = await get_stables_tvl(prev_month_end)
+    metrics.add('stables_mcap', stables_tvl_curr, stables_tvl_prev)
+    await progress.advance('stables_mcap', {'query': 'stables_mcap', curr_month_end: stables_tvl_curr,
+                                            prev_month_end: stables_tvl_prev})
+
+    await collect_tvl_inputs(metrics)
+    await progress.advance('tvl_report')
+
+    return metrics.to_frame([*QUERIES, *REPORT_ROWS])
 
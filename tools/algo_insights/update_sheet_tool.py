@@ -1,21 +1,31 @@
 from typing import Dict, List, Any, Tuple, Optional
 from datetime import datetime
-import gspread 
+import gspread
 import pandas as pd 
 from tools.algo_insights.report_tool import get_report
 from algo_insights_server import mcp
+from mcp.server.fastmcp import Context
+from utils.progress import ReportProgress
+from utils.execution import run_blocking, with_deadline, TIMEOUTS
+from utils.sheets import SHEETS, reconcile
 import os
 from dotenv import load_dotenv 
 
 load_dotenv ()
 
 @mcp.tool()
-async def update_sheet_individual(month: Optional[str] = None):
+@with_deadline()
+async def update_sheet_individual(month: Optional[str] = None, ctx: Context = None):
     """
     Update Google Sheet using individual cell updates
     Less efficient but more granular control
+
+    If the month's summary tab already exists (a re-run, e.g. after a data fix), it
+    is read in one request and only the cells whose values changed are written, in
+    one more request. Re-running for the same month is safe.
     """
-    df = await get_report(month)
+    # Always recomputed, so a republish compares the sheet against fresh values
+    df = await get_report(month, refresh=True, ctx=ctx)
 
     # Format as "Summary Table Mar - Apr"
     month_name = lambda d: d.strftime("%b")
@@ -23,15 +33,10 @@ async def update_sheet_individual(month: Optional[str] = None):
     date_columns = [df.columns[1], df.columns[2]]
     date_columns_sorted = sorted(date_columns, key=pd.to_datetime)
     prev_month_end, curr_month_end = date_columns_sorted
-    sa = gspread.service_account(filename='/Users/marc/Documents/paul/credentials/insights-credentials.json') 
 
-    sh = sa.open('ALGORAND INSIGHTS REPORT DATA') 
-    
     prev_month_name = month_name(datetime.strptime(prev_month_end, "%Y-%m-%d"))
     curr_month_name = month_name(datetime.strptime(curr_month_end, "%Y-%m-%d"))
     new_sheet_name = f"Summary Table {prev_month_name} - {curr_month_name}"
-    # Create new sheet
-    new_sheet = sh.add_worksheet(title=new_sheet_name, rows=1000, cols=26)
 
     # Define the mapping of queries to their row positions
     row_mapping = {
@@ -80,31 +85,72 @@ async def update_sheet_individual(month: Optional[str] = None):
     mau_definition = "MAU is any wallet which sent at least 1 txn in a month"
     paul_attribution = "This report has been made by Paul under the supervision of AF BI team"
 
-    worksheet = sh.worksheet(new_sheet_name)
-    worksheet.update_acell('F3', prev_month_end)
-    worksheet.update_acell('G3', month)
-    worksheet.update_acell('E3', 'Metric')
-    worksheet.update_acell('H3', f'MoM change:\n{prev_month_name} - {curr_month_name}')
-    worksheet.update_acell('D5', 'Tokenomics')
-    worksheet.update_acell('E20', 'AF Stake (ALGO)')
-    worksheet.update_acell('D25', 'Network')
-    worksheet.update_acell('D35', 'Ecosystem')
-    worksheet.update_acell('D49', 'Social')
-    worksheet.update_acell('E50', 'X - AlgoFoundation')
-    worksheet.update_acell('E52', 'YT - AlgoFoundation')
-    worksheet.update_acell('E54', 'IG - AlgoFoundation')
-    
-    worksheet.update_acell('D57', data_sources_msg)
-    worksheet.update_acell('D58', mau_definition)
-    worksheet.update_acell('D59', paul_attribution)
-        
+    labels = {
+        'F3': prev_month_end,
+        'G3': month,
+        'E3': 'Metric',
+        'H3': f'MoM change:\n{prev_month_name} - {curr_month_name}',
+        'D5': 'Tokenomics',
+        'E20': 'AF Stake (ALGO)',
+        'D25': 'Network',
+        'D35': 'Ecosystem',
+        'D49': 'Social',
+        'E50': 'X - AlgoFoundation',
+        'E52': 'YT - AlgoFoundation',
+        'E54': 'IG - AlgoFoundation',
+
+        'D57': data_sources_msg,
+        'D58': mau_definition,
+        'D59': paul_attribution,
+    }
+
+    # Cells of each metric row, in report order
+    rows = {}
     for _, row in df.iterrows():
         query = row['query']
         if query in row_mapping:
             row_num = row_mapping[query]
-            metric = metric_mapping[query]
-            worksheet.update_acell(f'E{row_num}', metric)
-            worksheet.update_acell(f'F{row_num}', row[prev_month_end])
-            worksheet.update_acell(f'G{row_num}', row[curr_month_end])
-            worksheet.update_acell(f'H{row_num}', row['change'])
+            rows[query] = {
+                f'E{row_num}': metric_mapping[query],
+                f'F{row_num}': row[prev_month_end],
+                f'G{row_num}': row[curr_month_end],
+                f'H{row_num}': row['change'],
+            }
+
+    spreadsheet = 'ALGORAND INSIGHTS REPORT DATA'
+    try:
+        worksheet = await SHEETS.worksheet(spreadsheet, new_sheet_name)
+    except gspread.WorksheetNotFound:
+        worksheet = None
+
+    if worksheet is not None:
+        cells = dict(labels)
+        for row_cells in rows.values():
+            cells.update(row_cells)
+        progress = ReportProgress(ctx, "update_sheet_individual", 1)
+        changed = await run_blocking(reconcile, worksheet, cells, timeout=TIMEOUTS["sheets"], upstream="sheets")
+        await progress.advance('reconcile')
+        return {"sheet": new_sheet_name, "mode": "reconciled", "cells_written": changed}
+
+    # Create new sheet
+    worksheet = await SHEETS.add_worksheet(spreadsheet, new_sheet_name, rows=1000, cols=26)
+
+    def write_cells(cells):
+        for label, value in cells.items():
+            worksheet.update_acell(label, value)
+
+    # Each update_acell is bounded by the client timeout, so no extra call deadline here
+    await run_blocking(write_cells, labels, upstream="sheets")
+
+    # One step for the static labels, then one per metric row written
+    progress = ReportProgress(ctx, "update_sheet_individual", 1 + len(rows))
+    await progress.advance('labels')
+
+    for query, row_cells in rows.items():
+        await run_blocking(write_cells, row_cells, upstream="sheets")
+        await progress.advance(query)
 
+    written = list(labels)
+    for row_cells in rows.values():
+        written.extend(row_cells)
+    return {"sheet": new_sheet_name, "mode": "created", "cells_written": written}
@@ -4,6 +4,7 @@ from typing import Dict, List, Any, Tuple, Optional
 from google.cloud import bigquery
 from google.oauth2 import service_account
 from weekly_kpis_server import mcp 
+from utils.execution import http_get
 import os 
 from dotenv import load_dotenv 
 
@@ -13,7 +14,7 @@ ACTIVE_DEVS_URL = os.getenv("ACTIVE_DEVS_URL")
 
 class ActiveDevs():
     async def executre_active_devs(self, week: str) -> Any:
-        response = requests.get(ACTIVE_DEVS_URL)
+        response = await http_get(ACTIVE_DEVS_URL)
         active_devs = response.json()
         return active_devs[week]
     
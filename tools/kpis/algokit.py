@@ -4,6 +4,9 @@ from typing import Dict, List, Any, Tuple, Optional
 from google.cloud import bigquery
 from google.oauth2 import service_account
 from weekly_kpis_server import mcp 
+from utils.execution import http_get, run_blocking, SingleFlight, TIMEOUTS
+from utils.metrics import METRICS
+from utils.upstreams import UPSTREAMS
 import os 
 from dotenv import load_dotenv 
 
@@ -11,15 +14,26 @@ load_dotenv ()
 
 PROJECT_ID = os.getenv("PROJECT_ID")
 
+# Identical BigQuery jobs in flight at the same time run once
+BIGQUERY_FLIGHTS = SingleFlight("bigquery")
+
 class AlgokitDownloads():
     async def execute_algokit_query(self, query: str) -> Any:
+        return await BIGQUERY_FLIGHTS.do(query, lambda: self._run_algokit_query(query))
+
+    async def _run_algokit_query(self, query: str) -> Any:
         credentials = service_account.Credentials.from_service_account_file(filename='/Users/marc/Documents/paul/credentials/insights-credentials.json')
         client = bigquery.Client(
             credentials = credentials, 
             project = PROJECT_ID)
 
-        query_job = client.query(query)
-        rows = query_job.result() 
+        query_job = await run_blocking(client.query, query, timeout=TIMEOUTS["http_read"])
+        # Cancel the BigQuery job itself if the call is abandoned
+        rows = await run_blocking(query_job.result, timeout=TIMEOUTS["bigquery"],
+                                  on_cancel=query_job.cancel, upstream="bigquery")
+        METRICS.record_call("bigquery", job_id=query_job.job_id,
+                            bytes_processed=query_job.total_bytes_processed,
+                            cache_hit=query_job.cache_hit)
         results = [dict(row) for row in rows]
         return results[0]['python_downloads']
     
@@ -36,8 +50,8 @@ class AlgokitDownloads():
         # Get downloads for that specific week
         package_name = "@algorandfoundation/algokit-utils"
         encoded_package = package_name.replace("/", "%2F").replace("@", "%40")
-        url = f"https://api.npmjs.org/downloads/point/{start_date}:{end_date}/{encoded_package}"
-        response = requests.get(url)
+        url = f"{UPSTREAMS['npm']}/downloads/point/{start_date}:{end_date}/{encoded_package}"
+        response = await http_get(url)
         response.raise_for_status()
         data = response.json()
         return data['downloads']
@@ -1,31 +1,29 @@
-import clickhouse_connect
 from typing import Dict, List, Any, Tuple, Optional
 from weekly_kpis_server import mcp 
-import os 
-from dotenv import load_dotenv 
-
-load_dotenv ()
-
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
-
-class ClickhouseQueries: 
-
-    async def execute_query(self, query: str) -> Any:
-        client = clickhouse_connect.get_client(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASS,
-            secure=False
-        )
-        result = client.query(query)
-        return result
+from utils.core import ClickhouseQueries, CLICKHOUSE
+from utils.governor import current_workload
+from utils.query_cost import estimate_query, preflight
     
 @mcp.tool()
 async def execute_query_tool(query: str) -> Any:
-    db = ClickhouseQueries()
-    return await db.execute_query(query)
-    
\ No newline at end of file
+    """
+    Run a ClickHouse query
+
+    The query is estimated first. If it would read more than the configured limits, it is
+    not run and a message explains how to narrow it. Only the analyst can lift these limits,
+    with settings.preflight.allow_expensive. The query always runs with the ad-hoc
+    ClickHouse limits (settings.governor.adhoc_settings, e.g. max_rows_to_read), sent
+    with readonly=1 so ClickHouse rejects any query that tries to change them.
+    """
+    # Report tools run reviewed catalog queries under their own workload and limits
+    if current_workload() != "report":
+        refusal = await preflight(query)
+        if refusal:
+            return refusal
+    return await CLICKHOUSE.execute_query(query)
+
+@mcp.tool()
+async def estimate_query_cost(query: str) -> Dict[str, Any]:
+    """Estimate the rows, bytes and parts a ClickHouse query would read, without running it"""
+    return (await estimate_query(query)).to_dict()
+    
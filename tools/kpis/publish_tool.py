@@ -4,25 +4,35 @@ import gspread
 import pandas as pd 
 from tools.kpis.weekly_kpi_tool import get_kpis_report
 from weekly_kpis_server import mcp
+from mcp.server.fastmcp import Context
+from utils.log import get_logger
+from utils.execution import run_blocking, with_deadline, TIMEOUTS
+from utils.sheets import SHEETS
 import os
 from dotenv import load_dotenv 
 
 load_dotenv ()
 
+logger = get_logger("kpis.publish")
+
 @mcp.tool()
-async def publish_kpis(week: Optional[str] = None, sheet: Optional[str] = None):
+@with_deadline()
+async def publish_kpis(week: Optional[str] = None, sheet: Optional[str] = None, ctx: Context = None):
     """
     Update Google Sheet using individual cell updates
     Less efficient but more granular control
     """
-    df = await get_kpis_report(week)
-    print('I got the df')
-    sa = gspread.service_account(filename='/Users/marc/Documents/paul/credentials/insights-credentials.json') 
-    print('I got the sa')
-    sh = sa.open('KPIS Marketing') 
-    source_sheet = sh.worksheet(sheet)
+    # Always recomputed, so a republish writes fresh values rather than the cached report
+    df = await get_kpis_report(week, refresh=True, ctx=ctx)
+    logger.info("report ready", extra={"week": week, "rows": len(df)})
+    source_sheet = await SHEETS.worksheet('KPIS Marketing', sheet)
 
-    values = source_sheet.get_all_values()
+    try:
+        values = await run_blocking(source_sheet.get_all_values, timeout=TIMEOUTS["sheets"], upstream="sheets")
+    except gspread.exceptions.APIError:
+        # The cached handle may point at a sheet renamed or deleted since; reopen next time
+        SHEETS.forget('KPIS Marketing')
+        raise
 
     # Find the last row with data (skip empty rows at the end)
     last_row_index = len(values)
@@ -34,10 +44,10 @@ async def publish_kpis(week: Optional[str] = None, sheet: Optional[str] = None):
     # Get the latest row data
     if last_row_index > 0:
         latest_row_data = values[last_row_index - 1]  # -1 because list is 0-indexed
-        print(f"Latest row ({last_row_index}): {latest_row_data}")
+        logger.info("latest row", extra={"row_index": last_row_index, "row": latest_row_data})
     else:
         latest_row_data = []
-        print("No data found in the sheet")
+        logger.warning("no data found in the sheet", extra={"sheet": sheet})
 
     week_dt = datetime.strptime(week, '%Y-%m-%d')  
     week_dt = datetime.date(week_dt).isoformat()  
@@ -49,15 +59,15 @@ async def publish_kpis(week: Optional[str] = None, sheet: Optional[str] = None):
                    df[df['query'] == 'nodes'][week].values[0]
                    ]
         next_row_index = last_row_index + 1
-        source_sheet.insert_row(new_row, next_row_index)
-        print(f"New row inserted at index {next_row_index}, {new_row}")
+        await run_blocking(source_sheet.insert_row, new_row, next_row_index, timeout=TIMEOUTS["sheets"], upstream="sheets")
+        logger.info("row inserted", extra={"sheet": sheet, "row_index": next_row_index, "row": new_row})
         return 
     elif sheet == "Algokit":
         new_row = [week, df[df['query'] == 'algokit_downloads'][week].values[0], 
                    df[df['query'] == 'algokit_python'][week].values[0], df[df['query'] == 'algokit_ts'][week].values[0],
                    df[df['query'] == 'active_devs'][week].values[0]]
         next_row_index = last_row_index + 1
-        source_sheet.insert_row(new_row, next_row_index)
-        print(f"New row inserted at index {next_row_index}, {new_row}")
+        await run_blocking(source_sheet.insert_row, new_row, next_row_index, timeout=TIMEOUTS["sheets"], upstream="sheets")
+        logger.info("row inserted", extra={"sheet": sheet, "row_index": next_row_index, "row": new_row})
         return df
 
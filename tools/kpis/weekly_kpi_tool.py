@@ -7,6 +7,13 @@ from tools.kpis.cmc_tool import get_cmc_ranking
 from tools.kpis.algokit import get_algokit_downloads
 from tools.kpis.active_devs import get_active_devs
 from weekly_kpis_server import mcp 
+from mcp.server.fastmcp import Context
+from utils.progress import ReportProgress
+from utils.execution import with_deadline
+from utils.scheduler import prefetched
+from utils.archive import archived
+from utils.governor import report_workload
+from utils.approximate import approximate_query
 import pandas as pd 
 import yaml
 
@@ -31,7 +38,22 @@ async def get_tvl_report(week: Optional[str] = None):
     return df
 
 @mcp.tool()
-async def get_kpis_report(week: Optional[str] = None) -> Any:
+@prefetched("get_kpis_report", "week", preview_param="approximate")
+@archived("get_kpis_report", "week", preview_param="approximate")
+@with_deadline()
+@report_workload
+async def get_kpis_report(week: Optional[str] = None, approximate: bool = False, refresh: bool = False,
+                          ctx: Context = None) -> Any:
+    """
+    Weekly KPIs for the week ending on `week`
+
+    With approximate=True, distinct counts (weekly active users) are estimated
+    with ClickHouse sketches and sampling for a fast preview. Their error bounds
+    are added as a <week>_error column. Publish exact reports only.
+
+    With refresh=True, a closed week is recomputed instead of being served from
+    the report cache (see settings.prefetch).
+    """
     # Predefined queries from the documentation
     with open('docs/kpis/queries.yaml', 'r') as f:
         QUERIES = yaml.safe_load(f)
@@ -39,30 +61,41 @@ async def get_kpis_report(week: Optional[str] = None) -> Any:
     if not week:
         week = datetime.now().strftime("%Y-%m-%d")
     data = []
+    # One step per ClickHouse query, plus nodes, algokit downloads, active devs and TVL
+    progress = ReportProgress(ctx, "get_kpis_report", len(QUERIES) - 1 + 4)
     
     for query_name, query_info in QUERIES.items():        
         query_sql = query_info["sql"]
         query_sql = query_sql.replace("WEEK", f"'{week}'")
         if query_name == 'algokit_downloads':
             continue
-        result = await execute_query_tool(query_sql)
+        approximation = await approximate_query(query_sql) if approximate else None
+        # Catalog queries are reviewed, and some scan the whole history by design: under
+        # the report workload they skip the pre-flight
+        result = await execute_query_tool(approximation.sql if approximation else query_sql)
         
         # Convert result to dict with date as keys
         row = {"query": query_name}
         for date, value in result.result_rows:
             row[date] = value
+            if approximation:
+                row[f"{date}_error"] = approximation.bound(value)
         data.append(row)
+        await progress.advance(query_name, row)
 
     nodes = await execute_get_nodes(week)
     row = {'query': 'nodes', week: nodes}
     data.append(row)
+    await progress.advance('nodes', row)
         
     df = pd.DataFrame(data)
 
     algokit_sql = QUERIES['algokit_downloads']['sql']
     algokit_sql = algokit_sql.replace("WEEK", f"'{week}'")
     py_downloads, npm_downloads = await get_algokit_downloads(algokit_sql, week)
+    await progress.advance('algokit_downloads', {'python': py_downloads, 'ts': npm_downloads})
     active_devs = await get_active_devs(week)
+    await progress.advance('active_devs', {week: active_devs})
     
     downloads = [
         {'query': 'algokit_downloads', week: py_downloads+npm_downloads},
@@ -73,7 +106,14 @@ async def get_kpis_report(week: Optional[str] = None) -> Any:
     downloads_df = pd.DataFrame(downloads)
 
     tvl = await get_tvl_report(week)
+    await progress.advance('tvl_report')
     df = pd.concat([df, tvl, downloads_df], ignore_index=True)
+    if approximate and f"{week}_error" in df:
+        df[f"{week}_error"] = df[f"{week}_error"].fillna(0.0)
+    # Queries that returned no value for the week; such a report is not cached
+    failed = df.loc[df[week].isna(), 'query'].tolist()
+    if failed:
+        df.attrs['failed'] = failed
 
     return df
 
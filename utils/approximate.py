@@ -0,0 +1,102 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from utils.cache import TTLCache
+from utils.config import get_settings
+from utils.core import CLICKHOUSE
+from utils.log import get_logger
+
+logger = get_logger("approximate")
+
+APPROXIMATE_SETTINGS = get_settings("approximate", {
+    # Sketch replacing count(distinct x): uniqCombined (HLL with 2^17 cells) or
+    # uniqHLL12 (2^12 cells, less memory, larger error)
+    "function": "uniqCombined",
+    # Fraction of rows read with SAMPLE, on tables whose sampling key hashes the
+    # counted column. 1 disables sampling.
+    "sample": 0.1,
+    # Standard errors covered by the reported bounds (2 is about 95%)
+    "sigmas": 2,
+})
+
+# Relative standard error of each sketch, 1.04 / sqrt(cells)
+SKETCH_ERRORS = {
+    "uniqCombined": 1.04 / math.sqrt(2 ** 17),
+    "uniqHLL12": 1.04 / math.sqrt(2 ** 12),
+}
+
+COUNT_DISTINCT = re.compile(r"count\(\s*distinct\s+([\w.]+)\s*\)", re.IGNORECASE)
+# The whole table name, unless a SAMPLE clause already follows it
+FROM_TABLE = re.compile(r"\bFROM\s+([\w.]+)(?![\w.]|\s+SAMPLE\b)", re.IGNORECASE)
+SAMPLE_CLAUSE = re.compile(r"\bSAMPLE\b", re.IGNORECASE)
+
+# Table sampling keys change with migrations only
+SAMPLING_KEYS = TTLCache("sampling_keys", ttl=86400)
+
+
+@dataclass
+class Approximation:
+    """A catalog query rewritten to estimate its distinct counts"""
+    sql: str
+    relative_error: float
+    sample: float = 1.0
+
+    def bound(self, value: float) -> float:
+        """Half-width of the interval around an estimate, in the units of the estimate"""
+        if not value:
+            return 0.0
+        error = self.relative_error
+        if self.sample < 1:
+            # Distinct keys kept by hash sampling follow a binomial distribution
+            error = math.hypot(error, math.sqrt((1 - self.sample) / (value * self.sample)))
+        return APPROXIMATE_SETTINGS["sigmas"] * error * value
+
+
+async def sampling_keys() -> Dict[str, str]:
+    """Sampling key of every ClickHouse table that has one, by 'database.table'"""
+    async def load():
+        try:
+            result = await CLICKHOUSE.execute_query(
+                "SELECT database || '.' || name, sampling_key FROM system.tables WHERE sampling_key != ''")
+        except Exception:
+            logger.warning("sampling keys unavailable, approximating without SAMPLE", exc_info=True)
+            return {}
+        return dict(result.result_rows)
+
+    return await SAMPLING_KEYS.get_or_load("all", load)
+
+
+async def approximate_query(sql: str) -> Optional[Approximation]:
+    """
+    Rewrite the exact distinct counts of a query into sketch estimates
+
+    Every count(distinct x) becomes the configured sketch. When each table read
+    has a sampling key built on x, the query also reads only a SAMPLE of it and
+    scales the estimate back up. A query that already samples a table is left
+    unsampled, as its counts would be scaled by the wrong fraction. Returns None
+    when the query has no distinct count to approximate.
+    """
+    columns = set(COUNT_DISTINCT.findall(sql))
+    if not columns:
+        return None
+    function = APPROXIMATE_SETTINGS["function"]
+    if function not in SKETCH_ERRORS:
+        raise ValueError(f"Unknown settings.approximate.function '{function}', "
+                         f"expected one of {', '.join(SKETCH_ERRORS)}")
+
+    sample = 1.0 if SAMPLE_CLAUSE.search(sql) else APPROXIMATE_SETTINGS["sample"]
+    if sample < 1:
+        keys = await sampling_keys()
+        tables = set(FROM_TABLE.findall(sql))
+        if not all(any(re.search(rf"\b{re.escape(c.split('.')[-1])}\b", keys.get(t, "")) for c in columns)
+                   for t in tables):
+            sample = 1.0
+
+    if sample < 1:
+        sql = FROM_TABLE.sub(lambda m: f"{m.group(0)} SAMPLE {sample}", sql)
+        sql = COUNT_DISTINCT.sub(lambda m: f"round({function}({m.group(1)}) / {sample})", sql)
+    else:
+        sql = COUNT_DISTINCT.sub(lambda m: f"{function}({m.group(1)})", sql)
+    return Approximation(sql, SKETCH_ERRORS[function], sample)
@@ -0,0 +1,218 @@
+import functools
+import inspect
+import re
+import uuid
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from utils.config import get_settings
+from utils.execution import run_blocking
+from utils.log import get_logger
+from utils.scheduler import SCHEDULER, PrefetchScheduler, failed_queries
+
+logger = get_logger("archive")
+
+ARCHIVE_SETTINGS = get_settings("archive", {
+    # Append every computed report to the archive
+    "enabled": True,
+    # Directory of the archive: Parquet files partitioned by period and metric
+    "dir": str(Path(__file__).resolve().parent.parent / ".archive"),
+})
+
+SCHEMA = pa.schema([
+    ("period_end", pa.date32()),
+    ("value", pa.float64()),
+    # Error bound of an approximate value, null for exact ones
+    ("error", pa.float64()),
+    ("approximate", pa.bool_()),
+    ("report", pa.string()),
+    ("run_id", pa.string()),
+    ("run_at", pa.timestamp("us", tz="UTC")),
+    ("period", pa.string()),
+    ("metric", pa.string()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("period", pa.string()), ("metric", pa.string())]), flavor="hive")
+
+DATE_COLUMN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class MetricArchive:
+    """
+    Every value each report run produced, as Parquet files on local disk
+
+    A run is appended as one file per (period, metric) partition, named after the
+    run, so appends never rewrite earlier runs. Rows carry the report, run ID and
+    time, and whether the values were approximate. Reads prune partitions and
+    keep, for each metric and period end, the latest exact value (or the latest
+    approximate one if no exact run covered it).
+
+    Args:
+        directory: root directory of the archive
+    """
+
+    def __init__(self, directory: str = ARCHIVE_SETTINGS["dir"]):
+        self.path = Path(directory)
+
+    @staticmethod
+    def records(report: str, period: str, frame: pd.DataFrame, approximate: bool = False) -> pa.Table:
+        """One row per metric and period end of a report frame (query, <date>..., change)"""
+        labels = [c for c in frame.columns if isinstance(c, str) and DATE_COLUMN.match(c)]
+        pieces = []
+        for label in labels:
+            error = f"{label}_error"
+            pieces.append(pd.DataFrame({
+                "metric": frame["query"].astype(str),
+                "period_end": date.fromisoformat(label),
+                "value": pd.to_numeric(frame[label], errors="coerce").astype("float64"),
+                "error": (pd.to_numeric(frame[error], errors="coerce").astype("float64")
+                          if error in frame else float("nan")),
+            }))
+        long = pd.concat(pieces, ignore_index=True) if pieces else pd.DataFrame(columns=["metric", "period_end",
+                                                                                         "value", "error"])
+        long = long.dropna(subset=["value"])
+        if not approximate:
+            long["error"] = float("nan")
+        long["approximate"] = approximate
+        long["report"] = report
+        long["run_id"] = uuid.uuid4().hex
+        long["run_at"] = pd.Timestamp(datetime.now(timezone.utc))
+        long["period"] = period
+        return pa.Table.from_pandas(long[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+    def append(self, report: str, period: str, frame: pd.DataFrame, approximate: bool = False) -> int:
+        """Append a report run; returns the number of values stored"""
+        table = self.records(report, period, frame, approximate)
+        if table.num_rows == 0:
+            return 0
+        run_id = table["run_id"][0].as_py()
+        ds.write_dataset(table, self.path, format="parquet", partitioning=PARTITIONING,
+                         basename_template=f"{run_id}-{{i}}.parquet",
+                         existing_data_behavior="overwrite_or_ignore")
+        return table.num_rows
+
+    def _dataset(self) -> Optional[ds.Dataset]:
+        if not self.path.exists():
+            return None
+        return ds.dataset(self.path, schema=SCHEMA, format="parquet", partitioning=PARTITIONING)
+
+    def read(self, period: str, metrics: Optional[List[str]] = None,
+             start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+        """Latest value of each metric at each period end, sorted by metric and period end"""
+        dataset = self._dataset()
+        if dataset is None:
+            return pd.DataFrame(columns=SCHEMA.names)
+        condition = pc.field("period") == period
+        if metrics:
+            condition &= pc.field("metric").isin(metrics)
+        if start:
+            condition &= pc.field("period_end") >= pa.scalar(date.fromisoformat(start), pa.date32())
+        if end:
+            condition &= pc.field("period_end") <= pa.scalar(date.fromisoformat(end), pa.date32())
+        table = dataset.to_table(filter=condition)
+        table = table.sort_by([("metric", "ascending"), ("period_end", "ascending"),
+                               ("approximate", "ascending"), ("run_at", "descending")])
+        frame = table.to_pandas()
+        return frame.drop_duplicates(["metric", "period_end"]).reset_index(drop=True)
+
+    def metrics(self) -> Dict[str, List[str]]:
+        """Archived metric names by period"""
+        dataset = self._dataset()
+        if dataset is None:
+            return {}
+        table = dataset.to_table(columns=["period", "metric"]).group_by(["period", "metric"]).aggregate([])
+        names: Dict[str, List[str]] = {}
+        for period, metric in sorted(zip(table["period"].to_pylist(), table["metric"].to_pylist())):
+            names.setdefault(period, []).append(metric)
+        return names
+
+
+ARCHIVE = MetricArchive()
+
+
+def trend(period: str, metrics: List[str], start: Optional[str] = None, end: Optional[str] = None,
+          archive: MetricArchive = ARCHIVE) -> Dict[str, Any]:
+    """
+    History of some metrics from the archive, with changes and a summary per metric
+
+    Returns:
+        {'period', 'series': {metric: [{period_end, value, change, approximate}...]},
+         'summary': {metric: {first, last, min, max, mean, change, periods}},
+         'missing': metrics with no archived value}
+    """
+    frame = archive.read(period, metrics, start, end)
+    frame["period_end"] = frame["period_end"].astype(str)
+    frame["change"] = frame.groupby("metric")["value"].pct_change()
+
+    series, summary = {}, {}
+    for metric, rows in frame.groupby("metric", sort=False):
+        values = rows["value"]
+        series[metric] = [
+            {"period_end": p, "value": float(v), "change": None if pd.isna(c) else float(c), "approximate": bool(a)}
+            for p, v, c, a in zip(rows["period_end"], values, rows["change"], rows["approximate"])
+        ]
+        first, last = values.iloc[0], values.iloc[-1]
+        summary[metric] = {
+            "first": {"period_end": rows["period_end"].iloc[0], "value": float(first)},
+            "last": {"period_end": rows["period_end"].iloc[-1], "value": float(last)},
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "change": float(last / first - 1) if first else None,
+            "periods": int(len(values)),
+        }
+    return {"period": period, "series": series, "summary": summary,
+            "missing": [m for m in metrics if m not in series]}
+
+
+def archived(report: str, period: str, archive: MetricArchive = ARCHIVE, preview_param: Optional[str] = None,
+             scheduler: PrefetchScheduler = SCHEDULER):
+    """
+    Decorator appending every report the function computes to the metric archive
+
+    Only computed reports pass through here: place it under @prefetched, so reports
+    served from the report cache are not archived again. Like @prefetched, it takes
+    the period's last day from the first parameter, and only settled periods are
+    archived (scheduler.is_settled), never a week or month still in progress.
+    A run with failed queries (attrs['failed']) is not archived either, since its
+    failed and derived values would be stored as real ones and replace a good run.
+    Archiving never fails the report; errors are logged.
+
+    Args:
+        report: report name stored with each value
+        period: 'week' or 'month'
+        preview_param: boolean parameter asking for approximate values, which are
+            archived as such
+        scheduler: decides which periods have settled
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        period_param = next(iter(signature.parameters))
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            result = await fn(*args, **kwargs)
+            if not ARCHIVE_SETTINGS["enabled"] or not isinstance(result, pd.DataFrame):
+                return result
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            if not scheduler.is_settled(arguments.get(period_param)):
+                return result
+            failed = failed_queries(result)
+            if failed:
+                logger.warning("report not archived, some queries failed", extra={"report": report, "failed": failed})
+                return result
+            approximate = bool(preview_param and arguments.get(preview_param))
+            try:
+                stored = await run_blocking(archive.append, report, period, result, approximate, upstream="archive")
+                logger.info("report archived", extra={"report": report, "values": stored})
+            except Exception:
+                logger.warning("report not archived", extra={"report": report}, exc_info=True)
+            return result
+        return wrapper
+    return decorator
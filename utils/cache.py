@@ -0,0 +1,123 @@
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from utils.config import get_settings
+from utils.execution import SingleFlight
+from utils.metrics import METRICS
+
+CACHE_SETTINGS = get_settings("cache", {
+    # Seconds an upstream history (DeFiLlama, CoinGecko...) is reused before being
+    # downloaded again. The upstreams publish at most daily.
+    "ttl": 900,
+    # Directory of the persistent caches (e.g. prefetched reports)
+    "dir": str(Path(__file__).resolve().parent.parent / ".cache"),
+})
+
+# Every cache created, so they can all be dropped at once (benchmarks, tests)
+CACHES: List[Any] = []
+
+
+class TTLCache:
+    """
+    In-process cache of upstream datasets that expire after `ttl` seconds
+
+    Hits and misses are counted in cache_requests_total{cache=name}. Concurrent
+    misses on one key share a single load.
+
+    Args:
+        name: label of the cache in the metrics
+        ttl: seconds an entry stays valid
+        clock: monotonic time source, replaceable in tests
+    """
+
+    def __init__(self, name: str, ttl: float = CACHE_SETTINGS["ttl"], clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: Dict[Any, Tuple[float, Any]] = {}
+        self.loads = SingleFlight(name)
+        CACHES.append(self)
+
+    def get(self, key: Any) -> Tuple[bool, Any]:
+        """Return (True, value) for a fresh entry, (False, None) otherwise"""
+        entry = self.entries.get(key)
+        if entry is not None and self.clock() < entry[0]:
+            return True, entry[1]
+        return False, None
+
+    def set(self, key: Any, value: Any):
+        self.entries[key] = (self.clock() + self.ttl, value)
+
+    async def get_or_load(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value, or await loader() and cache its result"""
+        hit, value = self.get(key)
+        METRICS.record_cache(self.name, hit)
+        if hit:
+            return value
+        return await self.loads.do(key, lambda: self.refresh(key, loader))
+
+    async def refresh(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Await loader() and cache its result, whether or not the entry is still fresh"""
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+
+class PersistentCache:
+    """
+    Results kept on disk across restarts, one pickle file per key
+
+    Writes are atomic, so a crash never leaves a truncated entry behind, and each
+    goes through its own temporary file, so server processes sharing the directory
+    can write the same key at once. Only the servers' own results are stored here;
+    never point it at untrusted files.
+
+    Args:
+        name: label in the metrics, and subdirectory of settings.cache.dir
+        directory: parent directory of the cache
+        clock: wall-clock time source, replaceable in tests
+    """
+
+    def __init__(self, name: str, directory: str = CACHE_SETTINGS["dir"], clock: Callable[[], float] = time.time):
+        self.name = name
+        self.path = Path(directory) / name
+        self.clock = clock
+        CACHES.append(self)
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{quote(key, safe='')}.pkl"
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Tuple[bool, Any]:
+        """Return (True, value) if the key is stored and younger than max_age seconds"""
+        try:
+            with open(self._file(key), "rb") as f:
+                entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            METRICS.record_cache(self.name, False)
+            return False, None
+        hit = max_age is None or self.clock() - entry["stored_at"] <= max_age
+        METRICS.record_cache(self.name, hit)
+        return (True, entry["value"]) if hit else (False, None)
+
+    def set(self, key: str, value: Any):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix=".tmp", delete=False) as f:
+            pickle.dump({"stored_at": self.clock(), "value": value}, f)
+        os.replace(f.name, self._file(key))
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def clear_caches():
+    for cache in CACHES:
+        cache.clear()
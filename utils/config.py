@@ -0,0 +1,30 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+CONFIG_PATH = Path(os.getenv("ANALYTICS_CONFIG", Path(__file__).resolve().parent.parent / "config.json"))
+
+
+def get_settings(section: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Read a section of the 'settings' block in config.json
+
+    Missing files, sections or keys fall back to the given defaults, so the
+    servers keep working with a Claude Desktop-only config.json.
+
+    Args:
+        section: name of the section under 'settings' (e.g. 'timeouts')
+        defaults: default values for every key the caller expects
+
+    Returns:
+        Dictionary with the defaults overridden by the configured values
+    """
+    settings = dict(defaults)
+    try:
+        config = json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return settings
+    settings.update(config.get("settings", {}).get(section, {}))
+    return settings
+
@@ -0,0 +1,176 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from utils.config import get_settings
+
+SETTINGS = get_settings("conversation", {
+    # Estimated tokens of history kept before older tool results are summarized
+    # and, if still needed, the oldest turns are dropped
+    "token_budget": 50000,
+    # Most recent turns that are never compacted
+    "keep_turns": 2,
+    # Characters of an elided tool result kept as a preview
+    "summary_chars": 200,
+})
+
+def estimate_tokens(content: Any) -> int:
+    """Rough token count (about 4 characters per token) without calling the API"""
+    text = content if isinstance(content, str) else json.dumps(content, default=str)
+    return len(text) // 4 + 1
+
+
+def _text_of(content: Any) -> str:
+    """Flatten message or tool_result content to plain text"""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if isinstance(block, dict):
+            parts.append(block.get("text") or _text_of(block.get("content")))
+        else:
+            parts.append(getattr(block, "text", "") or "")
+    return "\n".join(p for p in parts if p)
+
+
+def _is_user_query(message: Dict) -> bool:
+    """A turn starts with a user message typed by the analyst, not a tool result"""
+    if message["role"] != "user":
+        return False
+    content = message["content"]
+    if isinstance(content, str):
+        return True
+    return not any(isinstance(b, dict) and b.get("type") == "tool_result" for b in content)
+
+
+class ConversationMemory:
+    """
+    Bounded conversation history for the chat client
+
+    Every message is stored with an estimated token count. Once the total crosses
+    `token_budget`, the history is compacted, oldest first, but the last
+    `keep_turns` turns are never touched:
+
+    1. Tool results of older turns are replaced by a one-line summary. The full
+       result is kept in `archive`, keyed by tool_use_id, and can be read back
+       with archived().
+    2. If that is not enough, whole turns are dropped. They are replaced by a short
+       note listing the questions asked, which is put in front of the first turn
+       that is kept. The last turn is never dropped, whatever `keep_turns` is: it
+       may be in the middle of a tool loop, and dropping part of it would leave
+       tool_result blocks without their tool_use.
+
+    Args:
+        token_budget: estimated tokens the history may use before compacting
+        keep_turns: most recent turns (analyst question and everything after it) kept verbatim
+        summary_chars: characters of an elided tool result kept as a preview
+    """
+
+    def __init__(self, token_budget: int = SETTINGS["token_budget"], keep_turns: int = SETTINGS["keep_turns"],
+                 summary_chars: int = SETTINGS["summary_chars"]):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary_chars = summary_chars
+        self.messages: List[Dict] = []
+        self.tokens: List[int] = []
+        self.archive: Dict[str, Any] = {}
+        self.dropped_queries: List[str] = []
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    def append(self, message: Dict):
+        self.messages.append(message)
+        self.tokens.append(estimate_tokens(message["content"]))
+        if self.total_tokens > self.token_budget:
+            self.compact()
+
+    def clear(self):
+        self.messages, self.tokens = [], []
+        self.archive.clear()
+        self.dropped_queries.clear()
+
+    def _turn_starts(self) -> List[int]:
+        return [i for i, m in enumerate(self.messages) if _is_user_query(m)]
+
+    def compact(self):
+        starts = self._turn_starts()
+        if len(starts) <= self.keep_turns:
+            return
+        protected_from = starts[-self.keep_turns] if self.keep_turns else len(self.messages)
+
+        # 1. Summarize tool results outside the protected turns
+        for i in range(protected_from):
+            if self.total_tokens <= self.token_budget:
+                return
+            message = self.messages[i]
+            if message["role"] != "user" or isinstance(message["content"], str):
+                continue
+            content = [self._elide(block) for block in message["content"]]
+            self.messages[i] = {**message, "content": content}
+            self.tokens[i] = estimate_tokens(content)
+
+        # 2. Drop whole turns, oldest first, always keeping the current one
+        while self.total_tokens > self.token_budget:
+            starts = self._turn_starts()
+            if len(starts) <= max(self.keep_turns, 1):
+                break
+            first, end = starts[0], starts[1]
+            content = self.messages[first]["content"]
+            if not isinstance(content, str):
+                content = [b for b in content if not (isinstance(b, dict) and b.get("summary"))]
+            self.dropped_queries.append(_text_of(content)[:self.summary_chars])
+            del self.messages[first:end]
+            del self.tokens[first:end]
+            self._prepend_summary()
+
+    def _elide(self, block: Any) -> Any:
+        if not (isinstance(block, dict) and block.get("type") == "tool_result"):
+            return block
+        if block.get("elided"):
+            return block
+        text = _text_of(block.get("content"))
+        self.archive[block["tool_use_id"]] = block.get("content")
+        preview = " ".join(text.split())[:self.summary_chars]
+        summary = (f"[Earlier tool result elided to save context: {len(text)} chars, "
+                   f"ref {block['tool_use_id']}. Preview: {preview}]")
+        return {**{k: v for k, v in block.items() if k != "content"}, "content": summary, "elided": True}
+
+    def _prepend_summary(self):
+        """Put the list of dropped questions in front of the oldest kept turn"""
+        first = self.messages[0]
+        content = first["content"]
+        blocks = [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+        if blocks and blocks[0].get("summary"):
+            blocks = blocks[1:]
+        note = "Earlier in this conversation (details dropped to save context) the analyst asked:\n" + \
+               "\n".join(f"- {q}" for q in self.dropped_queries)
+        blocks = [{"type": "text", "text": note, "summary": True}, *blocks]
+        self.messages[0] = {**first, "content": blocks}
+        self.tokens[0] = estimate_tokens(blocks)
+
+    def api_messages(self) -> List[Dict]:
+        """Messages as sent to the API, without the bookkeeping keys"""
+        def clean(block):
+            if isinstance(block, dict) and ("elided" in block or "summary" in block):
+                return {k: v for k, v in block.items() if k not in ("elided", "summary")}
+            return block
+
+        return [
+            m if isinstance(m["content"], str) else {**m, "content": [clean(b) for b in m["content"]]}
+            for m in self.messages
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "messages": len(self.messages),
+            "turns": len(self._turn_starts()),
+            "estimated_tokens": self.total_tokens,
+            "token_budget": self.token_budget,
+            "archived_tool_results": len(self.archive),
+            "dropped_turns": len(self.dropped_queries),
+        }
+
+    def archived(self, tool_use_id: str) -> Optional[Any]:
+        """Full content of an elided tool result, by the ref shown in its summary"""
+        return self.archive.get(tool_use_id)
@@ -0,0 +1,260 @@
+import csv
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple
+
+import clickhouse_connect
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+from dotenv import load_dotenv
+
+from utils.cache import TTLCache
+from utils.execution import http_get, http_scan, run_blocking, run_cpu, SingleFlight, TIMEOUTS
+from utils.governor import GOVERNOR, current_workload
+from utils.metrics import METRICS, BYTES_BUCKETS, ROWS_BUCKETS
+from utils.upstreams import UPSTREAMS
+from utils.utils import fetch_all_algorand_stables, build_stables_history, fetch_all_rwa, build_rwa_history
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = os.getenv("DB_PORT")
+DB_USER = os.getenv("DB_USER")
+DB_PASS = os.getenv("DB_PASS")
+
+NODELY_USER = os.getenv("NODELY_API_USER")
+NODELY_PASS = os.getenv("NODELY_API_PASS")
+
+
+def read_csv_arrow(body: bytes, **convert_options) -> pa.Table:
+    """
+    Parse a CSV response body into an Arrow table
+
+    The bytes are read in place, with no decoded str or StringIO copy, and parsed on
+    every core. Typed columns and date parsing are set through ConvertOptions keywords
+    (column_types, timestamp_parsers...).
+    """
+    return pa_csv.read_csv(pa.BufferReader(body),
+                           read_options=pa_csv.ReadOptions(use_threads=True),
+                           convert_options=pa_csv.ConvertOptions(**convert_options))
+
+
+def _csv_field(value: str) -> str:
+    if any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def scan_rows(lines: Iterator[bytes], names: Collection[str]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Header and the rows whose first field is in `names`, from CSV lines
+
+    Reading stops as soon as every named row has been seen. Other rows are only
+    checked for their leading field, never decoded or split.
+    """
+    header = next(csv.reader([next(lines).decode()]))
+    prefixes = {(_csv_field(name) + ",").encode(): name for name in names}
+    rows = {}
+    for line in lines:
+        for prefix, name in prefixes.items():
+            if line.startswith(prefix):
+                rows[name] = next(csv.reader([line.decode()]))
+        if len(rows) == len(prefixes):
+            break
+    return header, rows
+
+
+def lookup(table: pa.Table, key: str, value: str, field: str) -> Any:
+    """
+    `field` of the first row whose `key` column equals value (a YYYY-MM-DD date)
+
+    Raises IndexError when no row matches, like the .values[0] lookups it replaces.
+    """
+    key_type = table.schema.field(key).type
+    if pa.types.is_timestamp(key_type):
+        value = datetime.fromisoformat(value)
+    elif pa.types.is_date(key_type):
+        value = date.fromisoformat(value)
+    matches = table.filter(pc.equal(table[key], pa.scalar(value, key_type)))
+    result = matches[field][0].as_py()
+    return float("nan") if result is None else result
+
+
+class ClickhouseQueries:
+    """
+    ClickHouse access shared by every toolset
+
+    A single client, and so a single HTTP connection pool, is created on first use
+    and kept for the life of the process. Identical queries running at the same
+    time are sent once and share the result. Every query goes through the query
+    governor, which queues it for a slot and supplies the settings profile of its
+    workload (report or ad-hoc).
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self.flights = SingleFlight("clickhouse")
+
+    def get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = clickhouse_connect.get_client(
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    user=DB_USER,
+                    password=DB_PASS,
+                    secure=False,
+                    connect_timeout=TIMEOUTS["http_connect"],
+                    send_receive_timeout=TIMEOUTS["query"],
+                    # Without a session, concurrent queries can share the client
+                    autogenerate_session_id=False
+                )
+            return self._client
+
+    async def execute_query(self, query: str) -> Any:
+        # Workloads run under different settings, so only identical queries of one workload are shared
+        return await self.flights.do((current_workload(), query), lambda: self._execute_query(query))
+
+    async def _execute_query(self, query: str) -> Any:
+        queued_at = time.perf_counter()
+        async with GOVERNOR.slot() as profile:
+            queue_seconds = time.perf_counter() - queued_at
+            client = await run_blocking(self.get_client, timeout=TIMEOUTS["http_read"])
+            # Tag the query so it can be killed server-side if the call is abandoned
+            query_id = str(uuid.uuid4())
+            settings = {"max_execution_time": TIMEOUTS["query"], **profile, "query_id": query_id}
+            result = await run_blocking(client.query, query, settings=settings,
+                                        timeout=TIMEOUTS["query"],
+                                        on_cancel=lambda: self.kill_query(query_id),
+                                        upstream="clickhouse")
+        summary = result.summary
+        read_rows, read_bytes = int(summary.get("read_rows", 0)), int(summary.get("read_bytes", 0))
+        METRICS.observe("clickhouse_read_rows", read_rows, buckets=ROWS_BUCKETS)
+        METRICS.observe("clickhouse_read_bytes", read_bytes, buckets=BYTES_BUCKETS)
+        METRICS.record_call("clickhouse", query_id=query_id, workload=current_workload(),
+                            queue_seconds=round(queue_seconds, 3), read_rows=read_rows, read_bytes=read_bytes,
+                            result_rows=result.row_count,
+                            seconds=int(summary.get("elapsed_ns", 0)) / 1e9)
+        return result
+
+    def kill_query(self, query_id: str):
+        self.get_client().command(f"KILL QUERY WHERE query_id = '{query_id}' ASYNC")
+
+
+class Nodes:
+    """Nodely node counts, cached per date"""
+
+    def __init__(self):
+        self.cache = TTLCache("nodely")
+
+    async def get_nodes(self, month: str) -> Any:
+        return await self.cache.get_or_load(month, lambda: self._load_nodes(month))
+
+    async def refresh(self):
+        """Fetch every cached date again, e.g. from the prefetch scheduler"""
+        for month in list(self.cache.entries):
+            await self.cache.refresh(month, lambda: self._load_nodes(month))
+
+    async def _load_nodes(self, month: str) -> Any:
+        url = f"{UPSTREAMS['nodely']}/v1/env/network/nodes/{month}"
+
+        response = await http_get(url, auth=(NODELY_USER, NODELY_PASS))
+        result = response.json()['unique_ips']
+        return result
+
+
+# Row of the DeFiLlama chain dataset summing every protocol
+DEFILLAMA_TOTAL = "Total"
+
+
+class TvlData:
+    """
+    DeFiLlama and CoinGecko histories shared by every toolset
+
+    Each upstream returns its whole history in one download, so the parsed history
+    is cached and every date lookup within the TTL is served from it. The CSV
+    histories are kept as Arrow tables; table.to_pandas() gives a DataFrame without
+    copying the numeric columns.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache("tvl")
+
+    async def defillama_history(self, protocol: str = DEFILLAMA_TOTAL) -> pa.Table:
+        """Algorand TVL per day, in total or of one protocol: date (date32) and value (float64) columns"""
+        key = "defillama" if protocol == DEFILLAMA_TOTAL else ("defillama", protocol)
+        return await self.cache.get_or_load(key, lambda: self._load_defillama(protocol))
+
+    async def _load_defillama(self, protocol: str = DEFILLAMA_TOTAL) -> pa.Table:
+        url = f'{UPSTREAMS["defillama"]}/simpleChainDataset/algorand?pool2=true&staking=true&borrowed=true&doublecounted=true&liquidstaking=true&vesting=true&govtokens=true'
+        # Wide CSV: one row per protocol, one column per day (dd/mm/YYYY). Only the
+        # header and the wanted row are parsed; the download stops once it is found.
+        header, rows = await http_scan(url, lambda lines: scan_rows(lines, [protocol]))
+        if protocol not in rows:
+            raise ValueError(f"No '{protocol}' row in the DeFiLlama Algorand dataset")
+        days = pc.strptime(pa.array(header[1:]), format="%d/%m/%Y", unit="s").cast(pa.date32())
+        values = pa.array([float(v) if v else None for v in rows[protocol][1:]], pa.float64())
+        return pa.table({"date": days, "value": values})
+
+    async def coingecko_history(self) -> pa.Table:
+        return await self.cache.get_or_load("coingecko", self._load_coingecko)
+
+    async def _load_coingecko(self) -> pa.Table:
+        url = f'{UPSTREAMS["coingecko"]}/price_charts/export/algorand/usd.csv'
+        response = await http_get(url)
+        return read_csv_arrow(
+            response.content,
+            column_types={"snapped_at": pa.timestamp("s"), "price": pa.float64(),
+                          "market_cap": pa.float64(), "total_volume": pa.float64()},
+            timestamp_parsers=["%Y-%m-%d %H:%M:%S UTC"],
+        )
+
+    async def stables_history(self) -> pd.DataFrame:
+        return await self.cache.get_or_load("stables", self._load_stables)
+
+    async def _load_stables(self) -> pd.DataFrame:
+        bodies = await run_blocking(fetch_all_algorand_stables, upstream="defillama_stables")
+        return await run_cpu(build_stables_history, bodies)
+
+    async def rwa_history(self) -> pd.DataFrame:
+        return await self.cache.get_or_load("rwa", self._load_rwa)
+
+    async def _load_rwa(self) -> pd.DataFrame:
+        bodies = await run_blocking(fetch_all_rwa, upstream="defillama_rwa")
+        return await run_cpu(build_rwa_history, bodies)
+
+    async def refresh(self):
+        """Download every history in use again, e.g. from the prefetch scheduler"""
+        loaders = {"defillama": self._load_defillama, "coingecko": self._load_coingecko,
+                   "stables": self._load_stables, "rwa": self._load_rwa}
+        for key in list(self.cache.entries):
+            if isinstance(key, tuple):
+                await self.cache.refresh(key, lambda: self._load_defillama(key[1]))
+            else:
+                await self.cache.refresh(key, loaders[key])
+
+    async def execute_defillama_api(self, date: Optional[str] = None, protocol: str = DEFILLAMA_TOTAL):
+        return lookup(await self.defillama_history(protocol), "date", date, "value")
+
+    async def execute_coingecko_api(self, date: Optional[str] = None, field: str = 'price'):
+        return lookup(await self.coingecko_history(), "snapped_at", date, field)
+
+    async def execute_stables_tvl(self, date: Optional[str] = None):
+        stables_mcap = await self.stables_history()
+        return stables_mcap[stables_mcap['date']==date]['total_mcap'].values[0]
+
+    async def execute_rwa_tvl(self, date: Optional[str] = None):
+        rwa_tvl = await self.rwa_history()
+        return rwa_tvl[rwa_tvl['date']==date]['total_tvl'].values[0]
+
+
+# One instance of each per process, shared by Paul's and Maria's tools
+CLICKHOUSE = ClickhouseQueries()
+NODES = Nodes()
+TVL = TvlData()
@@ -0,0 +1,323 @@
+import asyncio
+import contextvars
+import functools
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import requests
+
+from utils.config import get_settings
+from utils.log import get_logger
+from utils.metrics import METRICS, BYTES_BUCKETS
+
+logger = get_logger("execution")
+
+# Seconds. Every upstream call gets a deadline so a stuck upstream costs seconds,
+# not a wedged server.
+TIMEOUTS = get_settings("timeouts", {
+    "http_connect": 5,
+    "http_read": 60,
+    # Whole download of one response body, however steadily it arrives
+    "http_download": 600,
+    "query": 300,
+    "bigquery": 300,
+    "sheets": 60,
+    "report": 900,
+})
+
+EXECUTOR_SETTINGS = get_settings("executors", {
+    # Worker threads for blocking I/O clients (HTTP, ClickHouse, BigQuery, Sheets)
+    "threads": 32,
+    # Worker processes for CPU-bound parsing; 0 runs it in the thread pool instead
+    "processes": os.cpu_count() or 1,
+})
+
+# Imported in every worker process when it is warmed, so the first task skips it
+WARM_MODULES = ("utils.utils",)
+
+
+def _warm(modules: Sequence[str]) -> int:
+    for module in modules:
+        importlib.import_module(module)
+    return os.getpid()
+
+
+class Executors:
+    """
+    The worker pools of one server process
+
+    Blocking I/O runs in a thread pool (see run_blocking), and CPU-bound parsing in
+    a process pool (see run_cpu), so neither holds up the event loop and parsing
+    uses every core. Worker processes are spawned, not forked, so they never
+    inherit the server's threads or open connections. warm() starts them at
+    startup, and a pool broken by a dead worker is replaced on the next task.
+
+    Args:
+        settings: the pool sizes, see EXECUTOR_SETTINGS
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        self.settings = {**EXECUTOR_SETTINGS, **(settings or {})}
+        self.threads = ThreadPoolExecutor(max_workers=self.settings["threads"], thread_name_prefix="blocking")
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def processes(self) -> Optional[ProcessPoolExecutor]:
+        """The process pool, None when settings.executors.processes is 0"""
+        if self.settings["processes"] <= 0:
+            return None
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.settings["processes"],
+                                                      mp_context=multiprocessing.get_context("spawn"))
+            return self._processes
+
+    def discard_processes(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._processes is pool:
+                self._processes = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self, modules: Sequence[str] = WARM_MODULES) -> List[Future]:
+        """Start every worker process and import the parsing modules in it, without waiting"""
+        pool = self.processes()
+        if pool is None:
+            return []
+        return [pool.submit(_warm, modules) for _ in range(self.settings["processes"])]
+
+
+EXECUTORS = Executors()
+
+
+async def run_cpu(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run a CPU-bound function in the process pool
+
+    fn and its arguments and result cross a process boundary, so they must be
+    picklable: a module-level function of a utils module (tool modules register
+    MCP tools on import) and plain data, e.g. the raw response body rather than a
+    parsed object. Durations are recorded in cpu_task_seconds{task}.
+
+    Returns:
+        Whatever fn returns
+    """
+    start = time.perf_counter()
+    pool = EXECUTORS.processes()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool or EXECUTORS.threads,
+                                                                functools.partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        logger.error("worker process died, replacing the process pool", extra={"task": fn.__name__})
+        EXECUTORS.discard_processes(pool)
+        raise
+    finally:
+        METRICS.observe("cpu_task_seconds", time.perf_counter() - start, task=fn.__name__)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent upstream requests into one
+
+    The first caller for a key starts the request in its own task. Callers that
+    arrive while it is in flight await that same task instead of starting another.
+    The result, or the exception, goes to every waiter and is then forgotten, so a
+    failure is never cached. The request is cancelled only once every waiter has
+    given up on it.
+
+    Args:
+        name: label of the flight group in singleflight_shared_total
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: Dict[Hashable, _Flight] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = self.flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda task: self._land(key, flight))
+        else:
+            METRICS.inc("singleflight_shared_total", flight=self.name)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Everyone gave up: stop the request, and let the next caller start afresh
+                self._land(key, flight)
+                flight.task.cancel()
+
+    def _land(self, key: Hashable, flight: _Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Mark the exception as retrieved even if no waiter was left to see it
+            flight.task.exception()
+
+
+# Identical HTTP GETs (same URL and arguments) in flight at the same time
+HTTP_FLIGHTS = SingleFlight("http")
+
+
+async def run_blocking(fn: Callable, *args, timeout: Optional[float] = None,
+                       on_cancel: Optional[Callable[[], Any]] = None,
+                       upstream: Optional[str] = None, **kwargs) -> Any:
+    """
+    Run a blocking upstream call in a worker thread with a deadline
+
+    A thread cannot be interrupted, so when the call times out or the MCP request
+    is cancelled, `on_cancel` is fired in the background to stop the work at the
+    source (e.g. KILL QUERY, closing an HTTP session) and the caller is released
+    immediately.
+
+    Args:
+        fn: blocking callable
+        timeout: seconds before the call is abandoned, None for no call deadline
+        on_cancel: best-effort cleanup for an abandoned call
+        upstream: label under which the call duration and outcome are recorded
+
+    Returns:
+        Whatever fn returns
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        async with asyncio.timeout(timeout):
+            # Like asyncio.to_thread, but on the sized pool of EXECUTORS
+            call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+            result = await asyncio.get_running_loop().run_in_executor(EXECUTORS.threads, call)
+        outcome = "ok"
+        return result
+    except (asyncio.CancelledError, TimeoutError) as e:
+        outcome = "timeout" if isinstance(e, TimeoutError) else "cancelled"
+        if on_cancel is not None:
+            # Not awaited: the task may be cancelled again at its next await
+            asyncio.get_running_loop().run_in_executor(EXECUTORS.threads, _cleanup, on_cancel)
+        if isinstance(e, TimeoutError):
+            raise TimeoutError(f"{getattr(fn, '__name__', 'call')} timed out after {timeout}s") from e
+        raise
+    finally:
+        if upstream is not None:
+            METRICS.observe("upstream_duration_seconds", time.perf_counter() - start, upstream=upstream)
+            METRICS.inc("upstream_calls_total", upstream=upstream, outcome=outcome)
+
+
+def _cleanup(on_cancel: Callable[[], Any]):
+    try:
+        on_cancel()
+    except Exception:
+        logger.exception("cleanup of abandoned call failed")
+
+
+async def http_get(url: str, **kwargs) -> requests.Response:
+    """
+    GET a URL off the event loop with connect/read timeouts
+
+    http_connect and http_read bound each wait for the server; the whole body must
+    arrive within http_download. Takes the same keyword arguments as requests.get. The request runs on its own
+    session, which is closed when the call is abandoned so its connection is not
+    left hanging around. Concurrent GETs of the same URL with the same arguments
+    share one request and its response.
+    """
+    key = (url, repr(sorted(kwargs.items())))
+    return await HTTP_FLIGHTS.do(key, lambda: _http_get(url, **kwargs))
+
+
+async def _http_get(url: str, **kwargs) -> requests.Response:
+    session = requests.Session()
+    timeouts = (TIMEOUTS["http_connect"], TIMEOUTS["http_read"])
+    try:
+        response = await run_blocking(functools.partial(session.get, url, timeout=timeouts, **kwargs),
+                                      timeout=TIMEOUTS["http_download"], on_cancel=session.close,
+                                      upstream="http")
+    finally:
+        session.close()
+    host = urlparse(url).netloc
+    METRICS.observe("http_response_bytes", len(response.content), buckets=BYTES_BUCKETS, host=host)
+    METRICS.record_call("http", host=host, status=response.status_code, bytes=len(response.content),
+                        seconds=response.elapsed.total_seconds())
+    return response
+
+
+async def http_scan(url: str, scan: Callable[[Iterator[bytes]], Any], **kwargs) -> Any:
+    """
+    Stream a line-oriented response through scan() off the event loop
+
+    scan() gets the response lines as they arrive. Whatever it returns is the result.
+    When it returns early, the connection is closed and the rest of the body is
+    never downloaded. Takes the same keyword arguments as requests.get.
+
+    The whole scan must finish within the http_download timeout.
+
+    Unlike http_get, scans are not coalesced: two scans of one URL may want
+    different rows. Cache the scanned result in a TTLCache, which coalesces loads.
+    """
+    session = requests.Session()
+    timeouts = (TIMEOUTS["http_connect"], TIMEOUTS["http_read"])
+    received = 0
+
+    def run():
+        with session.get(url, timeout=timeouts, stream=True, **kwargs) as response:
+            response.raise_for_status()
+
+            def lines():
+                nonlocal received
+                for line in response.iter_lines(chunk_size=64 * 1024):
+                    received += len(line) + 1
+                    yield line
+
+            return response.status_code, scan(lines())
+
+    start = time.perf_counter()
+    try:
+        status, result = await run_blocking(run, timeout=TIMEOUTS["http_download"], on_cancel=session.close,
+                                            upstream="http")
+    finally:
+        session.close()
+    host = urlparse(url).netloc
+    METRICS.observe("http_response_bytes", received, buckets=BYTES_BUCKETS, host=host)
+    METRICS.record_call("http", host=host, status=status, bytes=received,
+                        seconds=time.perf_counter() - start)
+    return result
+
+
+def with_deadline(setting: str = "report"):
+    """
+    Decorator giving an async tool an overall deadline
+
+    Cancelling the tool (deadline or MCP cancel request) cancels every in-flight
+    upstream call started through run_blocking.
+
+    Args:
+        setting: key in TIMEOUTS holding the deadline in seconds
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            seconds = TIMEOUTS[setting]
+            deadline = asyncio.timeout(seconds)
+            try:
+                async with deadline:
+                    return await fn(*args, **kwargs)
+            except TimeoutError as e:
+                if not deadline.expired():
+                    raise
+                logger.error("deadline exceeded", extra={"tool": fn.__name__, "seconds": seconds})
+                raise TimeoutError(f"{fn.__name__} exceeded its {seconds}s deadline") from e
+        return wrapper
+    return decorator
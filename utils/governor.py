@@ -0,0 +1,149 @@
+import asyncio
+import functools
+import itertools
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from utils.config import get_settings
+from utils.metrics import METRICS
+
+GOVERNOR_SETTINGS = get_settings("governor", {
+    # ClickHouse queries running at once per server process; later ones wait in a queue
+    "max_in_flight": 4,
+    # Of those, how many may be ad-hoc (model-written) queries, so reports always get a slot
+    "max_adhoc_in_flight": 2,
+    # ClickHouse settings sent with every query of each workload. Each block replaces
+    # the default block as a whole when configured.
+    "report_settings": {
+        "readonly": 2,
+        "max_memory_usage": 20_000_000_000,
+        "max_threads": 8,
+    },
+    "adhoc_settings": {
+        "readonly": 1,
+        "max_memory_usage": 5_000_000_000,
+        "max_threads": 4,
+        "max_rows_to_read": 2_000_000_000,
+        "max_execution_time": 120,
+    },
+})
+
+# readonly=1 is always sent with ad-hoc queries, whatever adhoc_settings says.
+# ClickHouse then rejects any setting the query itself changes (a SETTINGS clause,
+# SET), so the ad-hoc limits hold whatever SQL the model writes. The settings of
+# the request itself are checked before readonly applies, so they still go through.
+ADHOC_READONLY = 1
+
+# Queue order: report pipeline queries before ad-hoc ones
+WORKLOADS = ("report", "adhoc")
+
+_workload: ContextVar[str] = ContextVar("query_workload", default="adhoc")
+
+
+def current_workload() -> str:
+    return _workload.get()
+
+
+def report_workload(fn):
+    """
+    Decorator marking every ClickHouse query made by a report tool as report workload
+
+    Queries outside such a tool (e.g. SQL written by the model) are ad-hoc.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = _workload.set("report")
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _workload.reset(token)
+    return wrapper
+
+
+class QueryGovernor:
+    """
+    Admission control for the ClickHouse queries of one server process
+
+    At most `max_in_flight` queries run at once, and at most `max_adhoc_in_flight`
+    of them ad-hoc. Others wait in a queue. When a slot frees up it goes to the
+    oldest waiting report query, and only then to the oldest ad-hoc one that fits
+    under its cap. Time spent queued is recorded per workload in
+    clickhouse_queue_wait_seconds.
+
+    Args:
+        settings: the governor settings, see GOVERNOR_SETTINGS
+        clock: monotonic time source, replaceable in tests
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, clock: Callable[[], float] = time.perf_counter):
+        self.settings = {**GOVERNOR_SETTINGS, **(settings or {})}
+        self.clock = clock
+        self.in_flight = {workload: 0 for workload in WORKLOADS}
+        self.waiting: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def profile(self, workload: str) -> Dict[str, Any]:
+        profile = dict(self.settings[f"{workload}_settings"])
+        if workload == "adhoc":
+            profile["readonly"] = ADHOC_READONLY
+        return profile
+
+    def _fits(self, workload: str) -> bool:
+        if sum(self.in_flight.values()) >= self.settings["max_in_flight"]:
+            return False
+        return workload != "adhoc" or self.in_flight["adhoc"] < self.settings["max_adhoc_in_flight"]
+
+    def _dispatch(self):
+        for entry in sorted(self.waiting):
+            _, _, workload, future = entry
+            if self._fits(workload):
+                self.waiting.remove(entry)
+                self.in_flight[workload] += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, workload: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Wait for a query slot; yields the ClickHouse settings profile of the workload"""
+        workload = workload or current_workload()
+        start = self.clock()
+        ahead = any(w == workload or WORKLOADS.index(w) < WORKLOADS.index(workload)
+                    for _, _, w, _ in self.waiting)
+        if not ahead and self._fits(workload):
+            self.in_flight[workload] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            entry = (WORKLOADS.index(workload), next(self._order), workload, future)
+            self.waiting.append(entry)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                if future.done() and not future.cancelled():
+                    # The slot was granted just as the caller gave up: pass it on
+                    self.release(workload)
+                else:
+                    self._dispatch()
+                raise
+        wait = self.clock() - start
+        METRICS.observe("clickhouse_queue_wait_seconds", wait, workload=workload)
+        try:
+            yield self.profile(workload)
+        finally:
+            self.release(workload)
+
+    def release(self, workload: str):
+        self.in_flight[workload] -= 1
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": dict(self.in_flight),
+            "queued": {w: sum(1 for _, _, q, _ in self.waiting if q == w) for w in WORKLOADS},
+        }
+
+
+# One governor per process, shared by every toolset it hosts
+GOVERNOR = QueryGovernor()
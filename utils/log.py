@@ -0,0 +1,54 @@
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+
+from utils.config import get_settings
+
+LOG_SETTINGS = get_settings("log", {
+    # Level of the 'analytics' loggers, in the servers and their worker processes
+    "level": "INFO",
+})
+
+# Attributes every LogRecord carries; anything else was passed through `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Render each record as a single JSON line including any `extra` fields"""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a logger that writes structured JSON lines to stderr
+
+    stdout is the MCP stdio transport, so nothing in the servers may print to it.
+
+    Args:
+        name: dotted logger name, nested under the shared 'analytics' logger
+
+    Returns:
+        Configured logger
+    """
+    root = logging.getLogger("analytics")
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_SETTINGS["level"])
+        root.propagate = False
+    return root.getChild(name)
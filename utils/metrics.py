@@ -0,0 +1,226 @@
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import get_settings
+from utils.log import get_logger
+
+logger = get_logger("metrics")
+
+SETTINGS = get_settings("metrics", {
+    # Rewrite this file in OpenMetrics text format while a server runs (None disables)
+    "export_path": None,
+    # Seconds between rewrites of export_path
+    "export_seconds": 15,
+    # Number of individual upstream calls kept for inspection
+    "recent_calls": 200,
+})
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, math.inf)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11)) + (math.inf,)
+ROWS_BUCKETS = tuple(10 ** i for i in range(11)) + (math.inf,)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with count and sum, as in Prometheus"""
+
+    def __init__(self, buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+def _labels_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    In-process store for tool and upstream metrics
+
+    Histograms and counters are keyed by metric name plus labels. The last few
+    upstream calls are also kept verbatim (query_id, rows, bytes, status...) so a
+    slow report can be traced back to a single call.
+    """
+
+    def __init__(self, recent_calls: int = 200):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.recent = deque(maxlen=recent_calls)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.recent.clear()
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_call(self, upstream: str, **details):
+        details = {"upstream": upstream, "at": datetime.now(timezone.utc).isoformat(), **details}
+        with self._lock:
+            self.recent.append(details)
+        logger.info("upstream call", extra=details)
+
+    def record_cache(self, cache: str, hit: bool):
+        self.inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summarize every metric as plain dictionaries"""
+        with self._lock:
+            histograms = [
+                {"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                 "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99)}
+                for (name, labels), h in self.histograms.items()
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counters.items()
+            ]
+            recent = list(self.recent)
+        return {"histograms": histograms, "counters": counters, "recent_calls": recent}
+
+    def to_openmetrics(self) -> str:
+        """Render every metric in the OpenMetrics text exposition format"""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), h in self.histograms.items():
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(float(bound))
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_count{fmt(labels)} {h.count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {h.sum}")
+            for name in sorted({n for n, _ in self.counters}):
+                family = name[:-len("_total")] if name.endswith("_total") else name
+                lines.append(f"# TYPE {family} counter")
+                for (n, labels), value in self.counters.items():
+                    if n == name:
+                        lines.append(f"{family}_total{fmt(labels)} {value}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Atomically write the OpenMetrics text to a local file"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_openmetrics())
+        os.replace(tmp, path)
+
+
+METRICS = MetricsRegistry(SETTINGS["recent_calls"])
+
+
+class MetricsExporter:
+    """
+    Rewrites an OpenMetrics file on a background thread, every `every_seconds`
+
+    Tool calls never wait for the disk: the file is written off the event loop, on
+    a timer, and once more when the exporter stops.
+
+    Args:
+        path: file to rewrite
+        every_seconds: time between rewrites
+        registry: the metrics to export
+    """
+
+    def __init__(self, path: str, every_seconds: float, registry: MetricsRegistry = METRICS):
+        self.path = path
+        self.every_seconds = every_seconds
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+
+    def export(self):
+        try:
+            self.registry.export(self.path)
+        except OSError:
+            logger.exception("metrics export failed", extra={"path": self.path})
+
+    def _run(self):
+        while not self._stop.wait(self.every_seconds):
+            self.export()
+
+    def start(self) -> "MetricsExporter":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.export()
+
+
+def start_export() -> Optional[MetricsExporter]:
+    """Start exporting to settings.metrics.export_path; None when it is not set"""
+    if not SETTINGS["export_path"]:
+        return None
+    return MetricsExporter(SETTINGS["export_path"], SETTINGS["export_seconds"]).start()
+
+
+def instrument_tool(fn):
+    """
+    Wrap an async tool so every call is timed and counted
+
+    Nested calls (e.g. get_report calling get_tvl_report) are measured too, since
+    the tool modules call each other through the wrapped functions.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = await fn(*args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            METRICS.observe("tool_duration_seconds", time.perf_counter() - start, tool=fn.__name__)
+            METRICS.inc("tool_calls_total", tool=fn.__name__, status=status)
+    return wrapper
@@ -0,0 +1,51 @@
+import json
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from mcp.server.fastmcp import Context
+
+from utils.log import get_logger
+
+logger = get_logger("progress")
+
+# Last progress value sent for the current tool call. Nested reports (e.g. the
+# sheet writer calling get_report) continue from here so progress never goes back.
+_last_progress: ContextVar[float] = ContextVar("last_progress", default=0)
+
+
+class ReportProgress:
+    """
+    Emit MCP progress notifications while a report is being assembled
+
+    Each completed step is logged to stderr and, when the client sent a progress
+    token, reported as a progress notification. Steps that produce a row also stream
+    that row to the client as a log message so partial results show up before the
+    whole report is finished.
+
+    Args:
+        ctx: FastMCP request context, or None when called outside a tool call
+        report: name of the report, used as a prefix in messages
+        total: number of steps this report is expected to take
+    """
+
+    def __init__(self, ctx: Optional[Context], report: str, total: int):
+        self.ctx = ctx
+        self.report = report
+        self.base = _last_progress.get()
+        self.total = total
+        self.done = 0
+
+    async def advance(self, step: str, row: Optional[Dict[str, Any]] = None):
+        self.done += 1
+        progress = self.base + self.done
+        _last_progress.set(progress)
+        logger.info("step completed", extra={"report": self.report, "step": step,
+                                             "done": self.done, "total": self.total})
+        if self.ctx is None:
+            return
+        await self.ctx.report_progress(progress, self.base + self.total,
+                                       message=f"{self.report}: {step}")
+        if row is not None:
+            partial = {"report": self.report, "step": step, "row": row}
+            await self.ctx.log("info", json.dumps(partial, default=str),
+                               logger_name="partial_result")
@@ -0,0 +1,150 @@
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils.cache import TTLCache
+from utils.config import get_settings
+from utils.core import CLICKHOUSE
+from utils.log import get_logger
+from utils.sargable import IndexUsage, issues, parse_explain
+
+logger = get_logger("query_cost")
+
+PREFLIGHT_SETTINGS = get_settings("preflight", {
+    # Estimated rows, compressed bytes and parts above which execute_query_tool
+    # refuses a query until it is narrowed
+    "max_rows": 500_000_000,
+    "max_bytes": 20_000_000_000,
+    "max_parts": 2000,
+    # Let model-written queries over these limits run. Set by the analyst, never by
+    # the model; the ad-hoc ClickHouse limits (settings.governor.adhoc_settings) apply
+    # either way.
+    "allow_expensive": False,
+})
+
+# Average compressed bytes per row of each table; sizes drift slowly
+TABLE_SIZES = TTLCache("table_sizes", ttl=3600)
+
+
+@dataclass
+class TableEstimate:
+    """What ClickHouse expects to read from one table (EXPLAIN ESTIMATE)"""
+    table: str
+    parts: int
+    rows: int
+    marks: int
+    bytes: int
+
+
+@dataclass
+class QueryEstimate:
+    tables: List[TableEstimate]
+    indexes: List[IndexUsage] = field(default_factory=list)
+    hints: List[str] = field(default_factory=list)
+
+    @property
+    def rows(self) -> int:
+        return sum(t.rows for t in self.tables)
+
+    @property
+    def bytes(self) -> int:
+        return sum(t.bytes for t in self.tables)
+
+    @property
+    def parts(self) -> int:
+        return sum(t.parts for t in self.tables)
+
+    def over_limits(self, limits: Optional[Dict[str, Any]] = None) -> List[str]:
+        limits = {**PREFLIGHT_SETTINGS, **(limits or {})}
+        over = []
+        for name, value in (("rows", self.rows), ("bytes", self.bytes), ("parts", self.parts)):
+            if value > limits[f"max_{name}"]:
+                over.append(f"{value:,} {name} estimated, limit {int(limits[f'max_{name}']):,}")
+        return over
+
+    def to_dict(self) -> Dict[str, Any]:
+        over = self.over_limits()
+        return {
+            "estimated_rows": self.rows,
+            "estimated_bytes": self.bytes,
+            "estimated_parts": self.parts,
+            "tables": [asdict(t) for t in self.tables],
+            "indexes": [{"table": r.table, "steps": [{"index": i, "parts": p, "granules": g} for i, p, g in r.steps]}
+                        for r in self.indexes],
+            "within_limits": not over,
+            "over_limits": over,
+            "hints": self.hints,
+        }
+
+
+async def bytes_per_row() -> Dict[str, float]:
+    """Average compressed bytes per row of every MergeTree table, by 'database.table'"""
+    async def load():
+        try:
+            result = await CLICKHOUSE.execute_query(
+                "SELECT database || '.' || table, sum(data_compressed_bytes) / greatest(sum(rows), 1) "
+                "FROM system.parts WHERE active GROUP BY database, table")
+        except Exception:
+            logger.warning("table sizes unavailable, estimating rows and parts only", exc_info=True)
+            return {}
+        return {table: float(size) for table, size in result.result_rows}
+
+    return await TABLE_SIZES.get_or_load("all", load)
+
+
+async def estimate_query(query: str) -> QueryEstimate:
+    """
+    Estimate what a query reads without running it
+
+    EXPLAIN ESTIMATE gives the parts, rows and marks read per table. Bytes are those
+    rows times the table's average compressed row size, so an upper bound when only
+    some columns are read. EXPLAIN indexes=1 shows how far each index narrowed the
+    read, and filters that defeat the primary key are listed as hints.
+    """
+    query = query.strip().rstrip(";")
+    result = await CLICKHOUSE.execute_query(f"EXPLAIN ESTIMATE {query}")
+    sizes = await bytes_per_row()
+    tables = []
+    for database, table, parts, rows, marks in result.result_rows:
+        name = f"{database}.{table}"
+        tables.append(TableEstimate(name, int(parts), int(rows), int(marks), int(rows * sizes.get(name, 0))))
+
+    estimate = QueryEstimate(tables, hints=issues(query))
+    try:
+        plan = await CLICKHOUSE.execute_query(f"EXPLAIN indexes = 1 {query}")
+        estimate.indexes = parse_explain([row[0] for row in plan.result_rows])
+    except Exception:
+        logger.warning("index plan unavailable", exc_info=True)
+    for read in estimate.indexes:
+        selected, _, total = read.granules.partition("/")
+        if read.steps and selected == total:
+            estimate.hints.append(f"No index narrows the read of {read.table}: filter on its sort key "
+                                  f"(e.g. a time range on the raw timestamp column)")
+    return estimate
+
+
+async def preflight(query: str) -> Optional[str]:
+    """
+    Check a model-written query before it runs
+
+    Returns None when the query may run, or a message asking for a narrower query
+    when its estimate crosses settings.preflight (unless the analyst set
+    settings.preflight.allow_expensive). A query that cannot be estimated is let
+    through; running it reports the real error. The ad-hoc ClickHouse limits are
+    enforced by ClickHouse itself (see governor.ADHOC_READONLY), not here.
+    """
+    if PREFLIGHT_SETTINGS["allow_expensive"]:
+        return None
+    try:
+        estimate = await estimate_query(query)
+    except Exception:
+        logger.warning("pre-flight estimate failed, running the query unchecked", exc_info=True)
+        return None
+    over = estimate.over_limits()
+    if not over:
+        return None
+    logger.info("query refused by pre-flight", extra={"over_limits": over})
+    hints = "".join(f"\n- {hint}" for hint in estimate.hints)
+    return ("Query not run: it would read too much of the shared warehouse (" + "; ".join(over) + "). "
+            "Narrow it (a tighter time range on the sort key, fewer tables, pre-aggregated tables) and "
+            "check it with estimate_query_cost. If the analyst needs the full scan, they can set "
+            "settings.preflight.allow_expensive." + (f"\nHints:{hints}" if hints else ""))
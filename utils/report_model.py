@@ -0,0 +1,115 @@
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+
+def _number(value: Any) -> float:
+    """Coerce an upstream value (Decimal, numpy scalar, None...) to a float, 0 if missing"""
+    if value is None:
+        return 0.0
+    value = float(value)
+    return 0.0 if math.isnan(value) or math.isinf(value) else value
+
+
+@dataclass
+class Metric:
+    """One report line: the value at the current and previous period end"""
+    query: str
+    curr: float
+    prev: float
+
+    @property
+    def change(self) -> float:
+        if self.prev == 0:
+            return 0.0
+        change = self.curr / self.prev - 1
+        return 0.0 if math.isnan(change) or math.isinf(change) else change
+
+
+class ReportMetrics:
+    """
+    Keyed metric records for a report comparing two period ends
+
+    Inputs are added as they arrive from the upstreams. Derived metrics are declared
+    once with the metrics they depend on, and they are evaluated lazily. Each one is
+    computed at most once per period, in dependency order. The DataFrame is only
+    built at the output edge, in to_frame().
+
+    Estimated inputs (see utils.approximate) carry error bounds, which to_frame()
+    outputs as one <label>_error column per period. Inputs that arrived without a
+    value are reported as 0 and listed in the frame's attrs['failed'].
+
+    Args:
+        curr_label: column name for the current period (e.g. '2025-04-30')
+        prev_label: column name for the previous period
+    """
+
+    def __init__(self, curr_label: str, prev_label: str):
+        self.curr_label = curr_label
+        self.prev_label = prev_label
+        self.metrics: Dict[str, Metric] = {}
+        self.derived: Dict[str, Tuple[Tuple[str, ...], Callable[..., float]]] = {}
+        self.errors: Dict[str, Tuple[float, float]] = {}
+        self.failed: List[str] = []
+
+    def add(self, query: str, curr: Any, prev: Any):
+        if pd.isna(curr) or pd.isna(prev):
+            self.failed.append(query)
+        self.metrics[query] = Metric(query, _number(curr), _number(prev))
+
+    def add_row(self, row: Dict[str, Any], errors: Optional[Dict[str, float]] = None):
+        """
+        Add a {'query': name, <curr_label>: value, <prev_label>: value} row
+
+        Args:
+            errors: for an estimated row, the error bound of each value, by label
+        """
+        self.add(row['query'], row.get(self.curr_label), row.get(self.prev_label))
+        if errors:
+            self.errors[row['query']] = (_number(errors.get(self.curr_label)), _number(errors.get(self.prev_label)))
+
+    def derive(self, query: str, depends_on: Iterable[str], fn: Callable[..., float]):
+        self.derived[query] = (tuple(depends_on), fn)
+
+    def __contains__(self, query: str) -> bool:
+        return query in self.metrics or query in self.derived
+
+    def __getitem__(self, query: str) -> Metric:
+        return self._resolve(query, ())
+
+    def _resolve(self, query: str, path: Tuple[str, ...]) -> Metric:
+        if query in self.metrics:
+            return self.metrics[query]
+        if query in path:
+            raise ValueError(f"Circular metric dependency: {' -> '.join(path + (query,))}")
+        if query not in self.derived:
+            raise KeyError(f"Unknown metric '{query}'")
+        depends_on, fn = self.derived[query]
+        inputs = [self._resolve(dep, path + (query,)) for dep in depends_on]
+        self.add(query, fn(*(m.curr for m in inputs)), fn(*(m.prev for m in inputs)))
+        return self.metrics[query]
+
+    def to_frame(self, order: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Build the report DataFrame: query, previous, current and change columns
+
+        Args:
+            order: metrics to output, in order. Defaults to every metric, inputs first.
+        """
+        order = order or list(dict.fromkeys([*self.metrics, *self.derived]))
+        rows = [self[query] for query in order]
+        frame = pd.DataFrame({
+            'query': [m.query for m in rows],
+            self.prev_label: [m.prev for m in rows],
+            self.curr_label: [m.curr for m in rows],
+            'change': [m.change for m in rows],
+        })
+        if self.errors:
+            # Exact metrics have no error. Bounds are not propagated into derived metrics.
+            frame[f'{self.prev_label}_error'] = [self.errors.get(m.query, (0.0, 0.0))[1] for m in rows]
+            frame[f'{self.curr_label}_error'] = [self.errors.get(m.query, (0.0, 0.0))[0] for m in rows]
+        if self.failed:
+            frame.attrs['failed'] = list(dict.fromkeys(self.failed))
+        return frame
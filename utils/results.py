@@ -0,0 +1,209 @@
+import functools
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from utils.config import get_settings
+from utils.execution import run_blocking
+from utils.log import get_logger
+
+logger = get_logger("results")
+
+RESULT_SETTINGS = get_settings("results", {
+    # Tables with more rows than this are stored and returned as a handle
+    "max_inline_rows": 200,
+    # ...as are tables taking more bytes than this in memory
+    "max_inline_bytes": 64_000,
+    # Rows of a stored result shown with its handle
+    "preview_rows": 20,
+    # Hours a stored result is kept
+    "max_age_hours": 168,
+    # Directory of the stored results, shared by the servers and client.py
+    "dir": str(Path(__file__).resolve().parent.parent / ".results"),
+})
+
+AGGREGATIONS = ("sum", "mean", "min", "max", "count", "count_distinct")
+
+
+def _column(values: List[Any]) -> pa.Array:
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed or exotic values (UUIDs, IP addresses...) are kept as text
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def is_table(result: Any) -> bool:
+    """DataFrames and ClickHouse query results"""
+    return isinstance(result, pd.DataFrame) or (hasattr(result, "column_names") and hasattr(result, "result_rows"))
+
+
+def to_table(result: Any) -> Optional[pa.Table]:
+    """A tool result as an Arrow table, None if it is not a table"""
+    if not is_table(result):
+        return None
+    if isinstance(result, pd.DataFrame):
+        try:
+            return pa.Table.from_pandas(result, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return pa.Table.from_pandas(result.astype({c: str for c in result.select_dtypes("object")}),
+                                        preserve_index=False)
+    names = [str(name) for name in result.column_names]
+    columns = list(zip(*result.result_rows)) or [[] for _ in names]
+    return pa.Table.from_arrays([_column(list(values)) for values in columns], names=names)
+
+
+class ResultStore:
+    """
+    Large tool results written once to local disk, and read back by handle
+
+    Each result is one zstd-compressed Parquet file named after its handle, written
+    atomically. Readers memory-map it, so slices and aggregates never load the
+    other columns. Results older than `max_age_hours` are removed when a new one is
+    stored.
+
+    Args:
+        directory: where the results are stored
+        settings: thresholds and retention, see RESULT_SETTINGS
+    """
+
+    def __init__(self, directory: str = RESULT_SETTINGS["dir"], settings: Optional[Dict[str, Any]] = None):
+        self.path = Path(directory)
+        self.settings = {**RESULT_SETTINGS, **(settings or {})}
+
+    def _file(self, handle: str) -> Path:
+        if not handle.isalnum():
+            raise ValueError(f"Invalid result handle '{handle}'")
+        return self.path / f"{handle}.parquet"
+
+    def is_large(self, table: pa.Table) -> bool:
+        return (table.num_rows > self.settings["max_inline_rows"]
+                or table.nbytes > self.settings["max_inline_bytes"])
+
+    def put(self, table: pa.Table, source: str) -> str:
+        """Store a table; returns its handle"""
+        self.prune()
+        self.path.mkdir(parents=True, exist_ok=True)
+        handle = uuid.uuid4().hex
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"source": source.encode()})
+        file = self._file(handle)
+        tmp = file.with_suffix(".tmp")
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, file)
+        return handle
+
+    def open(self, handle: str, columns: Optional[List[str]] = None) -> pa.Table:
+        file = self._file(handle)
+        if not file.exists():
+            raise KeyError(f"No stored result '{handle}' (results are kept {self.settings['max_age_hours']} hours)")
+        return pq.read_table(file, columns=columns, memory_map=True)
+
+    def describe(self, handle: str, table: pa.Table, source: str) -> Dict[str, Any]:
+        """What a tool returns instead of a large table"""
+        return {
+            "result_handle": handle,
+            "source": source,
+            "rows": table.num_rows,
+            "columns": [{"name": field.name, "type": str(field.type)} for field in table.schema],
+            "preview": table.slice(0, self.settings["preview_rows"]).to_pylist(),
+            "note": (f"Only the first {self.settings['preview_rows']} rows are shown. Read more with "
+                     f"get_result_slice or summarize with aggregate_result, using this result_handle."),
+        }
+
+    def slice(self, handle: str, offset: int = 0, limit: int = 100, columns: Optional[List[str]] = None,
+              sort_by: Optional[str] = None, descending: bool = False) -> Dict[str, Any]:
+        """Rows offset..offset+limit of a stored result, optionally sorted first"""
+        limit = max(0, min(limit, self.settings["max_inline_rows"]))
+        wanted = None if columns is None else list(dict.fromkeys([*columns, *([sort_by] if sort_by else [])]))
+        table = self.open(handle, wanted)
+        if sort_by:
+            table = table.sort_by([(sort_by, "descending" if descending else "ascending")])
+        if columns is not None:
+            table = table.select(columns)
+        return {"result_handle": handle, "rows": table.num_rows, "offset": offset,
+                "data": table.slice(offset, limit).to_pylist()}
+
+    def aggregate(self, handle: str, aggregations: Dict[str, str],
+                  group_by: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Aggregates of a stored result, over all rows or per group"""
+        unknown = sorted(set(aggregations.values()) - set(AGGREGATIONS))
+        if unknown:
+            raise ValueError(f"Unknown aggregation(s) {unknown}, expected one of {list(AGGREGATIONS)}")
+        group_by = group_by or []
+        table = self.open(handle, list(dict.fromkeys([*group_by, *aggregations])))
+        grouped = table.group_by(group_by).aggregate([(column, fn) for column, fn in aggregations.items()])
+        limit = self.settings["max_inline_rows"]
+        return {"result_handle": handle, "groups": grouped.num_rows, "truncated": grouped.num_rows > limit,
+                "data": grouped.slice(0, limit).to_pylist()}
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Stored results, newest first"""
+        results = []
+        for file in sorted(self.path.glob("*.parquet"), key=lambda f: f.stat().st_mtime, reverse=True):
+            metadata = pq.read_metadata(file)
+            results.append({"result_handle": file.stem, "rows": metadata.num_rows,
+                            "source": (metadata.metadata or {}).get(b"source", b"").decode(),
+                            "stored_at": time.strftime("%Y-%m-%d %H:%M", time.localtime(file.stat().st_mtime))})
+        return results
+
+    def export(self, handle: str, path: str):
+        """Write a stored result to a .csv or .parquet file"""
+        table = self.open(handle)
+        if path.endswith(".csv"):
+            pacsv.write_csv(table, path)
+        else:
+            pq.write_table(table, path)
+
+    def prune(self):
+        cutoff = time.time() - self.settings["max_age_hours"] * 3600
+        for file in self.path.glob("*.parquet"):
+            try:
+                if file.stat().st_mtime < cutoff:
+                    file.unlink()
+            except FileNotFoundError:
+                pass
+
+
+RESULTS = ResultStore()
+
+
+def store_if_large(result: Any, source: str, store: ResultStore = RESULTS) -> Any:
+    """
+    The result as a tool should return it: large tables are stored and replaced by a handle
+
+    Small ClickHouse query results are returned inline as columns and rows. Anything
+    else is returned unchanged. Blocking; run it with run_blocking.
+    """
+    table = to_table(result)
+    if table is None:
+        return result
+    if store.is_large(table):
+        handle = store.put(table, source)
+        logger.info("result stored", extra={"tool": source, "handle": handle, "rows": table.num_rows})
+        return store.describe(handle, table, source)
+    if isinstance(result, pd.DataFrame):
+        return result
+    return {"columns": table.column_names, "rows": [list(row) for row in result.result_rows]}
+
+
+def spill_large_results(fn):
+    """
+    Wrap a tool so that large tables go to the result store instead of the response
+
+    Only what the MCP client receives changes; tools calling each other directly
+    still get the DataFrame or query result itself (see AnalyticsMCP.tool).
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        result = await fn(*args, **kwargs)
+        if not is_table(result):
+            return result
+        return await run_blocking(store_if_large, result, fn.__name__, upstream="results")
+    return wrapper
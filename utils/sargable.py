@@ -0,0 +1,197 @@
+import base64
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+# toDate(<column>) followed by a comparison: the date filters of the catalogs
+TO_DATE = re.compile(r"\btoDate\(\s*(\w+)\s*\)\s*(<=|>=|<>|!=|=|<|>|\bBETWEEN\b)\s*", re.IGNORECASE)
+# Decoding every note to match a prefix
+NOTE_PREFIX = re.compile(r"\btoString\(\s*base64Decode\(\s*(\w+)\s*\)\s*\)\s+LIKE\s+'([^'%_\\]+)%'", re.IGNORECASE)
+AND = re.compile(r"\s*\bAND\b\s*", re.IGNORECASE)
+# Days are UTC days, as toDate() of the chain's UTC timestamps; an explicit zone
+# keeps the bounds from following the server's or the session's time zone
+TIMEZONE = "'UTC'"
+TO_DATETIME = re.compile(r"\btoDateTime\(", re.IGNORECASE)
+
+
+def _operand(sql: str, pos: int) -> Optional[int]:
+    """End of the operand starting at pos: a literal, a name or a call, None if neither"""
+    if pos < len(sql) and sql[pos] == "'":
+        end = sql.find("'", pos + 1)
+        return None if end < 0 else end + 1
+    match = re.compile(r"[\w.]+").match(sql, pos)
+    if not match:
+        return None
+    end = match.end()
+    if end < len(sql) and sql[end] == "(":
+        depth = 0
+        for i in range(end, len(sql)):
+            depth += {"(": 1, ")": -1}.get(sql[i], 0)
+            if depth == 0:
+                return i + 1
+        return None
+    return end
+
+
+def _start(day: str) -> str:
+    return f"toDateTime({day}, {TIMEZONE})"
+
+
+def _after(day: str) -> str:
+    return f"toDateTime({day}, {TIMEZONE}) + INTERVAL 1 DAY"
+
+
+def _zoneless(sql: str) -> List[Tuple[int, int]]:
+    """(start, end) of every toDateTime(x) call given no time zone argument"""
+    calls = []
+    for match in TO_DATETIME.finditer(sql):
+        end = _operand(sql, match.start())
+        if end is None:
+            continue
+        depth, quoted = 0, False
+        for char in sql[match.end():end - 1]:
+            if char == "'":
+                quoted = not quoted
+            elif not quoted:
+                depth += {"(": 1, ")": -1}.get(char, 0)
+                if char == "," and depth == 0:
+                    break
+        else:
+            calls.append((match.start(), end))
+    return calls
+
+
+def _date_range(column: str, op: str, low: str, high: Optional[str] = None) -> Optional[str]:
+    """toDate(column) <op> day(s) as a half-open range on the column itself"""
+    op = op.upper()
+    if op == "BETWEEN":
+        return f"({column} >= {_start(low)} AND {column} < {_after(high)})"
+    if op == "=":
+        return f"({column} >= {_start(low)} AND {column} < {_after(low)})"
+    return {
+        "<": f"{column} < {_start(low)}",
+        "<=": f"{column} < {_after(low)}",
+        ">": f"{column} >= {_after(low)}",
+        ">=": f"{column} >= {_start(low)}",
+    }.get(op)
+
+
+def rewrite(sql: str) -> str:
+    """
+    Rewrite predicates that hide the sort key behind a function
+
+    - toDate(col) compared with a day (=, <, <=, >, >=, BETWEEN) becomes a
+      half-open range on col itself, so ClickHouse can prune parts and granules
+      with the primary key. Bounds are still whatever expression the query used,
+      read as UTC days (see TIMEZONE).
+    - toString(base64Decode(note)) LIKE 'prefix%' is guarded by a startsWith on
+      the encoded column, so only the candidate rows are decoded.
+
+    - toDateTime(x) without a time zone gets TIMEZONE as its second argument.
+
+    Predicates that cannot be rewritten safely (!=, unparseable operands) are left
+    as they are; issues() still reports them.
+    """
+    out, pos = [], 0
+    for match in TO_DATE.finditer(sql):
+        if match.start() < pos:
+            continue
+        column, op = match.group(1), match.group(2)
+        low_end = _operand(sql, match.end())
+        replacement, end = None, low_end
+        if low_end is not None:
+            low = sql[match.end():low_end]
+            if op.upper() == "BETWEEN":
+                and_match = AND.match(sql, low_end)
+                high_end = _operand(sql, and_match.end()) if and_match else None
+                if high_end is not None:
+                    replacement = _date_range(column, op, low, sql[and_match.end():high_end])
+                    end = high_end
+            else:
+                replacement = _date_range(column, op, low)
+        if replacement is None:
+            continue
+        out.append(sql[pos:match.start()])
+        out.append(replacement)
+        pos = end
+    out.append(sql[pos:])
+    sql = "".join(out)
+
+    out, pos = [], 0
+    for start, end in _zoneless(sql):
+        out.append(sql[pos:end - 1] + f", {TIMEZONE})")
+        pos = end
+    out.append(sql[pos:])
+    sql = "".join(out)
+
+    def guard(match):
+        check = _note_guard(match)
+        if not check or sql[:match.start()].endswith(check):
+            return match.group(0)
+        return check + match.group(0)
+
+    return NOTE_PREFIX.sub(guard, sql)
+
+
+def _note_guard(match: re.Match) -> str:
+    """Cheap startsWith on the encoded column that must hold for the LIKE to match"""
+    column, prefix = match.group(1), match.group(2).encode()
+    # Whole 3-byte groups encode to the same characters whatever follows them
+    encoded = base64.b64encode(prefix[:len(prefix) - len(prefix) % 3]).decode()
+    return f"startsWith({column}, '{encoded}') AND " if encoded else ""
+
+
+def issues(sql: str) -> List[str]:
+    """
+    Predicates in sql that keep ClickHouse from using the primary key or decode every
+    row, and toDateTime() bounds that follow the server's time zone
+    """
+    found = [f"{m.group(0).strip()} ... wraps {m.group(1)} in toDate()" for m in TO_DATE.finditer(sql)]
+    found += [f"{sql[start:end]} has no time zone, use {sql[start:end - 1]}, {TIMEZONE})"
+              for start, end in _zoneless(sql)]
+    found += [f"{m.group(0)} decodes every {m.group(1)}"
+              for m in NOTE_PREFIX.finditer(sql) if not sql[:m.start()].endswith(_note_guard(m) or "\0")]
+    return found
+
+
+@dataclass
+class IndexUsage:
+    """Parts and granules selected by each index of one table read, from EXPLAIN indexes=1"""
+    table: str
+    steps: List[Tuple[str, str, str]] = field(default_factory=list)
+
+    @property
+    def parts(self) -> str:
+        return self.steps[-1][1] if self.steps else "?"
+
+    @property
+    def granules(self) -> str:
+        return self.steps[-1][2] if self.steps else "?"
+
+
+def parse_explain(lines: List[str]) -> List[IndexUsage]:
+    """
+    Index usage per table read in the text of EXPLAIN indexes=1
+
+    The last index step of a read (usually PrimaryKey) gives what is actually read.
+    """
+    reads: List[IndexUsage] = []
+    index: Optional[str] = None
+    parts: Optional[str] = None
+    for line in lines:
+        text = line.strip()
+        read = re.match(r"ReadFromMergeTree \((.+)\)", text)
+        if read:
+            reads.append(IndexUsage(read.group(1)))
+            index = None
+        elif not reads:
+            continue
+        elif re.fullmatch(r"MinMax|Partition|PrimaryKey|Skip", text):
+            index = text
+        elif text.startswith("Name:") and index == "Skip":
+            index = f"Skip {text[5:].strip()}"
+        elif text.startswith("Parts:"):
+            parts = text[6:].strip()
+        elif text.startswith("Granules:") and index:
+            reads[-1].steps.append((index, parts or "?", text[9:].strip()))
+    return reads
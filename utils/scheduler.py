@@ -0,0 +1,262 @@
+import asyncio
+import functools
+import inspect
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.cache import PersistentCache
+from utils.config import get_settings
+from utils.core import NODES, TVL
+from utils.log import get_logger
+
+logger = get_logger("scheduler")
+
+PREFETCH_SETTINGS = get_settings("prefetch", {
+    # Run the scheduler inside the server process (see AnalyticsMCP.serve)
+    "enabled": False,
+    # Hours after a period closes (midnight UTC after its last day) before its reports
+    # are computed, so the upstreams have ingested the last day
+    "delay_hours": 2,
+    # Weekday the weekly KPI weeks end on (Monday=0 ... Sunday=6)
+    "week_ends_on": 6,
+    # Minutes between refreshes of the CoinGecko, DeFiLlama and Nodely series. Keep it
+    # below settings.cache.ttl so interactive calls always find them warm.
+    "series_refresh_minutes": 10,
+    # Minutes before a failed prefetch is tried again, doubled after each further
+    # failure of the same period, up to max_retry_minutes
+    "retry_minutes": 30,
+    "max_retry_minutes": 360,
+    # Days a closed period's report is served from the report cache
+    "report_max_age_days": 7,
+    # Longest sleep between checks for due jobs, in seconds
+    "poll_seconds": 60,
+})
+
+# Reports of closed periods, kept across restarts
+REPORTS = PersistentCache("reports")
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def failed_queries(report: Any) -> List[str]:
+    """Queries of a report frame that returned no value, listed in its attrs['failed']"""
+    return list(getattr(report, "attrs", {}).get("failed", []))
+
+
+@dataclass
+class ReportJob:
+    """A report computed once for every period that closes"""
+    name: str
+    period: str
+    fn: Callable[[str], Awaitable[Any]]
+    done: Optional[str] = None
+    retry_at: Optional[datetime] = None
+    # Consecutive failures for `failing`, the period being retried
+    failures: int = 0
+    failing: Optional[str] = None
+
+
+@dataclass
+class RefreshJob:
+    """A refresh of upstream series on a fixed interval"""
+    name: str
+    every: timedelta
+    fn: Callable[[], Awaitable[Any]]
+    next_run: Optional[datetime] = None
+
+
+class PrefetchScheduler:
+    """
+    In-process scheduler for report prefetches and series refreshes
+
+    Shortly after each week or month closes, every registered report is computed for
+    that period and stored in the report cache, so the analyst's request returns
+    instantly. Upstream series are refreshed on a timer in between.
+
+    All time comes from `clock`, and all waiting goes through `sleep`. A test can
+    drive the scheduler with a fake clock by advancing it and calling tick().
+
+    Args:
+        clock: returns the current time as an aware UTC datetime
+        sleep: awaitable sleep taking seconds
+        settings: the prefetch settings, see PREFETCH_SETTINGS
+        cache: where report results are stored
+    """
+
+    def __init__(self, clock: Callable[[], datetime] = utc_now,
+                 sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+                 settings: Optional[Dict[str, Any]] = None, cache: PersistentCache = REPORTS):
+        self.clock = clock
+        self.sleep = sleep
+        self.settings = {**PREFETCH_SETTINGS, **(settings or {})}
+        self.cache = cache
+        self.reports: Dict[str, ReportJob] = {}
+        self.refreshes: Dict[str, RefreshJob] = {}
+
+    @property
+    def delay(self) -> timedelta:
+        return timedelta(hours=self.settings["delay_hours"])
+
+    @property
+    def max_age(self) -> float:
+        return self.settings["report_max_age_days"] * 86400
+
+    def add_report(self, name: str, period: str, fn: Callable[[str], Awaitable[Any]]):
+        """
+        Args:
+            name: report name, also its key prefix in the report cache
+            period: 'week' or 'month'
+            fn: computes the report given the period's last day (YYYY-MM-DD)
+        """
+        if period not in ("week", "month"):
+            raise ValueError(f"Unknown period '{period}', expected 'week' or 'month'")
+        self.reports[name] = ReportJob(name, period, fn)
+
+    def retry_delay(self, failures: int) -> timedelta:
+        """Wait before the next try after `failures` consecutive failures"""
+        minutes = self.settings["retry_minutes"] * 2 ** (failures - 1)
+        return timedelta(minutes=min(minutes, self.settings["max_retry_minutes"]))
+
+    def _failed(self, job: ReportJob, period_end: str, now: datetime):
+        if job.failing != period_end:
+            job.failing, job.failures = period_end, 0
+        job.failures += 1
+        job.retry_at = now + self.retry_delay(job.failures)
+
+    def add_refresh(self, name: str, every_seconds: float, fn: Callable[[], Awaitable[Any]]):
+        self.refreshes[name] = RefreshJob(name, timedelta(seconds=every_seconds), fn)
+
+    def latest_settled_day(self, now: datetime) -> date:
+        """Last day whose close plus the delay has passed"""
+        return (now - self.delay).date() - timedelta(days=1)
+
+    def is_settled(self, period_end: str) -> bool:
+        """True once the period ending on period_end has closed and the delay has passed"""
+        try:
+            day = date.fromisoformat(period_end)
+        except (TypeError, ValueError):
+            return False
+        return day <= self.latest_settled_day(self.clock())
+
+    def last_closed(self, period: str, now: Optional[datetime] = None) -> str:
+        """Last day of the latest settled week or month"""
+        day = self.latest_settled_day(now or self.clock())
+        if period == "month":
+            if (day + timedelta(days=1)).day != 1:
+                day = day.replace(day=1) - timedelta(days=1)
+        else:
+            day -= timedelta(days=(day.weekday() - self.settings["week_ends_on"]) % 7)
+        return day.isoformat()
+
+    @staticmethod
+    def key(report: str, period_end: str) -> str:
+        return f"{report}:{period_end}"
+
+    async def tick(self) -> List[str]:
+        """Run every job that is due now; returns what ran"""
+        now = self.clock()
+        ran = []
+        for job in self.reports.values():
+            period_end = self.last_closed(job.period, now)
+            # A failing period waits for its retry; a newly closed one is tried at once
+            if job.done == period_end or (job.failing == period_end and now < job.retry_at):
+                continue
+            key = self.key(job.name, period_end)
+            hit, _ = self.cache.get(key, self.max_age)
+            if not hit:
+                try:
+                    result = await job.fn(period_end)
+                except Exception:
+                    logger.exception("prefetch failed", extra={"report": job.name, "period_end": period_end})
+                    self._failed(job, period_end, now)
+                    continue
+                if failed_queries(result):
+                    logger.warning("prefetch incomplete", extra={"report": job.name, "period_end": period_end,
+                                                                 "failed": failed_queries(result)})
+                    self._failed(job, period_end, now)
+                    continue
+                self.cache.set(key, result)
+                logger.info("report prefetched", extra={"report": job.name, "period_end": period_end})
+            job.done, job.retry_at, job.failing, job.failures = period_end, None, None, 0
+            ran.append(key)
+
+        for job in self.refreshes.values():
+            if job.next_run is not None and now < job.next_run:
+                continue
+            try:
+                await job.fn()
+            except Exception:
+                logger.exception("series refresh failed", extra={"series": job.name})
+            job.next_run = now + job.every
+            ran.append(job.name)
+        return ran
+
+    def seconds_until_next(self) -> float:
+        now = self.clock()
+        waits = [self.settings["poll_seconds"]]
+        waits += [(job.next_run - now).total_seconds() for job in self.refreshes.values() if job.next_run]
+        return max(0.0, min(waits))
+
+    async def run(self):
+        """Run due jobs until cancelled"""
+        logger.info("prefetch scheduler started",
+                    extra={"reports": list(self.reports), "refreshes": list(self.refreshes)})
+        while True:
+            await self.tick()
+            await self.sleep(self.seconds_until_next())
+
+
+SCHEDULER = PrefetchScheduler()
+SCHEDULER.add_refresh("tvl_series", PREFETCH_SETTINGS["series_refresh_minutes"] * 60, TVL.refresh)
+SCHEDULER.add_refresh("nodely", PREFETCH_SETTINGS["series_refresh_minutes"] * 60, NODES.refresh)
+
+
+def prefetched(report: str, period: str, scheduler: PrefetchScheduler = SCHEDULER,
+               preview_param: Optional[str] = None, refresh_param: Optional[str] = "refresh"):
+    """
+    Decorator serving a report's settled periods from the report cache
+
+    The first parameter of the report must be the period's last day. The cache is
+    only used when settings.prefetch.enabled; otherwise every request runs the
+    report. Requests for a period that has not settled yet always run it too. The
+    report is also registered with the scheduler, which computes each new period in
+    the background. A report with failed queries (see failed_queries) is returned
+    but never cached.
+
+    Args:
+        report: report name, the key prefix in the report cache
+        period: 'week' or 'month'
+        preview_param: boolean parameter asking for a preview (e.g. approximate). A
+            preview is answered from the cache when the full report is there, but
+            it is never stored in the cache itself.
+        refresh_param: boolean parameter asking to recompute the report instead of
+            reading the cache; the new report replaces the cached one
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        period_param = next(iter(signature.parameters))
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            period_end = arguments.get(period_param)
+            if not scheduler.settings["enabled"] or not scheduler.is_settled(period_end):
+                return await fn(*args, **kwargs)
+            key = scheduler.key(report, period_end)
+            if not (refresh_param and arguments.get(refresh_param)):
+                hit, result = scheduler.cache.get(key, scheduler.max_age)
+                if hit:
+                    return result
+            result = await fn(*args, **kwargs)
+            # Error messages are returned as strings; only cache complete, exact reports
+            if (not isinstance(result, str) and not failed_queries(result)
+                    and not (preview_param and arguments.get(preview_param))):
+                scheduler.cache.set(key, result)
+            return result
+
+        scheduler.add_report(report, period, lambda period_end: fn(period_end))
+        return wrapper
+    return decorator
@@ -0,0 +1,236 @@
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import anyio
+from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from utils.archive import ARCHIVE, trend
+from utils.config import get_settings
+from utils.execution import EXECUTORS, run_blocking
+from utils.governor import GOVERNOR
+from utils.metrics import METRICS, instrument_tool, start_export
+from utils.results import RESULTS, spill_large_results
+from utils.scheduler import PREFETCH_SETTINGS, SCHEDULER
+
+SERVER_SETTINGS = get_settings("server", {
+    # stdio (one process per client, as Claude Desktop runs it), streamable-http or sse
+    "transport": "stdio",
+    "host": "127.0.0.1",
+    "port": 8000,
+    # Port per server name, so Paul, Maria and the combined server can run side by side
+    "ports": {},
+    # Seconds in-flight requests get to finish after SIGINT/SIGTERM
+    "graceful_shutdown": 30,
+})
+
+TRANSPORTS = ["stdio", "streamable-http", "sse"]
+
+# Tools every server has, registered by register_common_tools
+COMMON_TOOLS = ("get_server_metrics", "get_metric_trend", "get_result_slice", "aggregate_result")
+
+
+class AnalyticsMCP(FastMCP):
+    """
+    FastMCP server shared by Paul and Maria
+
+    Every function registered with @mcp.tool() is wrapped with instrument_tool, and
+    the wrapped function is what the decorator returns. Tools calling each other
+    directly are therefore measured as well. What is registered also passes large
+    tables through the result store (see utils.results), so clients get a handle.
+
+    Run with serve(). Over HTTP, one long-lived process serves every client session,
+    so the caches and pools of utils.core are shared between them. GET /health
+    reports liveness and GET /ready readiness (503 while starting or shutting down).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http_server = None
+        self.custom_route("/health", methods=["GET"])(self.health)
+        self.custom_route("/ready", methods=["GET"])(self.readiness)
+
+    def tool(self, *args, **kwargs):
+        register = super().tool(*args, **kwargs)
+
+        def decorator(fn):
+            wrapped = instrument_tool(fn)
+            # Clients get large tables as result handles; tools calling each other get the tables
+            register(spill_large_results(wrapped))
+            return wrapped
+
+        return decorator
+
+    async def health(self, request: Request) -> JSONResponse:
+        return JSONResponse({"status": "ok", "server": self.name,
+                             "tools": len(self._tool_manager.list_tools())})
+
+    async def readiness(self, request: Request) -> JSONResponse:
+        server = self._http_server
+        ready = server is not None and server.started and not server.should_exit
+        return JSONResponse({"ready": ready, "server": self.name}, status_code=200 if ready else 503)
+
+    def serve(self, argv: Optional[List[str]] = None):
+        """
+        Run the server with the transport chosen on the command line or in settings.server
+
+        Args:
+            argv: command line arguments, defaults to sys.argv[1:]
+        """
+        parser = argparse.ArgumentParser(description=f"{self.name} MCP server")
+        parser.add_argument("--transport", choices=TRANSPORTS, default=SERVER_SETTINGS["transport"])
+        parser.add_argument("--host", default=SERVER_SETTINGS["host"])
+        parser.add_argument("--port", type=int,
+                            default=SERVER_SETTINGS["ports"].get(self.name, SERVER_SETTINGS["port"]))
+        args = parser.parse_args(argv)
+        # Worker processes start while the server does, so the first parse does not wait
+        EXECUTORS.warm()
+        exporter = start_export()
+        try:
+            if args.transport == "stdio":
+                anyio.run(self.with_prefetch, self.run_stdio_async)
+                return
+            self.settings.host, self.settings.port = args.host, args.port
+            anyio.run(self.with_prefetch, self.serve_http, args.transport)
+        finally:
+            if exporter:
+                exporter.stop()
+
+    async def with_prefetch(self, main, *args):
+        """Run the server, with the prefetch scheduler alongside when settings.prefetch.enabled"""
+        if not PREFETCH_SETTINGS["enabled"]:
+            return await main(*args)
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(SCHEDULER.run)
+            await main(*args)
+            tg.cancel_scope.cancel()
+
+    async def serve_http(self, transport: str):
+        """Serve over streamable HTTP or SSE until SIGINT/SIGTERM, then drain in-flight requests"""
+        import uvicorn
+
+        app = self.streamable_http_app() if transport == "streamable-http" else self.sse_app()
+        config = uvicorn.Config(
+            app,
+            host=self.settings.host,
+            port=self.settings.port,
+            log_level=self.settings.log_level.lower(),
+            timeout_graceful_shutdown=SERVER_SETTINGS["graceful_shutdown"],
+        )
+        self._http_server = uvicorn.Server(config)
+        await self._http_server.serve()
+
+
+def register_common_tools(mcp: AnalyticsMCP, period: str = "month"):
+    """
+    Register the tools every server has: server metrics, metric trends and large results
+
+    They read the process-wide METRICS, ARCHIVE and RESULTS, so one copy serves
+    every toolset a process hosts.
+
+    Args:
+        mcp: the server to register them on
+        period: default period of get_metric_trend, 'month' (Paul) or 'week' (Maria)
+    """
+    @mcp.tool()
+    async def get_server_metrics() -> Dict[str, Any]:
+        """
+        Get timing, size and call metrics for every tool and upstream call since startup
+
+        Histograms summarize tool and upstream durations (ClickHouse, HTTP, BigQuery,
+        Sheets) with count, sum and p50/p95/p99. Recent calls list the ClickHouse
+        query_id, rows and bytes read, time queued and workload, and the HTTP status and
+        payload size. clickhouse_queue shows the queries running and waiting now.
+
+        The OpenMetrics export goes only to settings.metrics.export_path, rewritten in
+        the background while the server runs; a tool call cannot choose where files are
+        written.
+        """
+        return {**METRICS.snapshot(), "clickhouse_queue": GOVERNOR.stats()}
+
+    @mcp.tool()
+    async def get_metric_trend(metrics: Optional[List[str]] = None, period: str = period,
+                               start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Trend of report metrics over past periods, from the local archive of report runs
+
+        Every get_report and get_kpis_report run is archived, so use this for questions like
+        "how has MAU trended over the last year" instead of re-running reports or querying
+        ClickHouse. Returns each metric's value per period end with the change from the
+        previous one, and a summary (first, last, min, max, mean, overall change).
+
+        Args:
+            metrics: report query names (e.g. ['monthly_active_users', 'tvl_usd'], or
+                ['weekly_active_users'] for weeks); leave empty to list the archived metrics
+            period: 'month' (get_report) or 'week' (get_kpis_report)
+            start: first period end to include (YYYY-MM-DD)
+            end: last period end to include (YYYY-MM-DD)
+        """
+        if not metrics:
+            return {"archived_metrics": await run_blocking(ARCHIVE.metrics)}
+        return await run_blocking(trend, period, metrics, start, end)
+
+    @mcp.tool()
+    async def get_result_slice(result_handle: str, offset: int = 0, limit: int = 100,
+                               columns: Optional[List[str]] = None, sort_by: Optional[str] = None,
+                               descending: bool = False) -> Any:
+        """
+        Read rows of a large result that a tool returned as a result_handle
+
+        Args:
+            result_handle: the handle returned instead of the full table
+            offset: first row to return (after sorting)
+            limit: number of rows, capped at the inline row limit (200 by default)
+            columns: columns to return, all by default
+            sort_by: column to sort by before slicing
+            descending: sort in descending order
+        """
+        try:
+            return await run_blocking(RESULTS.slice, result_handle, offset, limit, columns, sort_by, descending)
+        except (KeyError, ValueError) as e:
+            return f"Error: {e}"
+
+    @mcp.tool()
+    async def aggregate_result(result_handle: str, aggregations: Dict[str, str],
+                               group_by: Optional[List[str]] = None) -> Any:
+        """
+        Aggregate a large result that a tool returned as a result_handle, without reading it row by row
+
+        Args:
+            result_handle: the handle returned instead of the full table
+            aggregations: function per column, e.g. {"tx_count": "sum", "address": "count_distinct"}.
+                Functions: sum, mean, min, max, count, count_distinct
+            group_by: columns to group by; all rows form one group by default
+        """
+        try:
+            return await run_blocking(RESULTS.aggregate, result_handle, aggregations, group_by)
+        except (KeyError, ValueError) as e:
+            return f"Error: {e}"
+
+
+def combine(name: str, toolsets: Dict[str, FastMCP]) -> AnalyticsMCP:
+    """
+    Host several servers' tools in one server
+
+    Tools keep their names unless two toolsets share one (e.g. get_tvl_report),
+    in which case each copy is prefixed with its toolset name (paul_get_tvl_report,
+    maria_get_tvl_report). The tools are registered as already instrumented. The
+    common tools are registered once, unprefixed (see register_common_tools).
+
+    Args:
+        name: name of the combined server
+        toolsets: prefix -> server whose tools are registered
+    """
+    combined = AnalyticsMCP(name)
+    register_common_tools(combined)
+    tools = {prefix: [tool for tool in server._tool_manager.list_tools() if tool.name not in COMMON_TOOLS]
+             for prefix, server in toolsets.items()}
+    counts = Counter(tool.name for server_tools in tools.values() for tool in server_tools)
+    for prefix, server_tools in tools.items():
+        for tool in server_tools:
+            tool_name = f"{prefix}_{tool.name}" if counts[tool.name] > 1 else tool.name
+            combined.add_tool(tool.fn, name=tool_name, description=tool.description,
+                              annotations=tool.annotations)
+    return combined
@@ -0,0 +1,182 @@
+import datetime
+import math
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import gspread
+from gspread.utils import DateTimeOption, ValueInputOption, ValueRenderOption, a1_to_rowcol, rowcol_to_a1
+
+from utils.cache import CACHES, PersistentCache
+from utils.config import get_settings
+from utils.execution import TIMEOUTS, run_blocking
+from utils.log import get_logger
+
+logger = get_logger("sheets")
+
+SHEETS_SETTINGS = get_settings("sheets", {
+    # Service account key the reports are written with
+    "credentials": "/Users/marc/Documents/paul/credentials/insights-credentials.json",
+    # Spreadsheet IDs by title, opened without searching Drive. Titles not listed here
+    # are searched once and their IDs kept in SPREADSHEET_IDS.
+    "spreadsheet_ids": {},
+})
+
+# Spreadsheet IDs found by title, kept across restarts and shared by the servers
+SPREADSHEET_IDS = PersistentCache("spreadsheet_ids")
+
+# Day 0 of Sheets date serial numbers
+SERIAL_EPOCH = datetime.date(1899, 12, 30)
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+class SheetsGateway:
+    """
+    One authorized gspread client per process, with its spreadsheet and worksheet handles
+
+    The service account is authorized on first use and its HTTP session is reused by
+    every later call. Spreadsheets are opened by ID: from settings.sheets.spreadsheet_ids,
+    or else as found the first time the title was searched in Drive, which is kept
+    in the `ids` cache. Opened spreadsheets and worksheets are kept by key, so a
+    publish goes straight to its first write. If a known ID no longer opens, the
+    title is searched again.
+
+    Args:
+        settings: the Sheets settings, see SHEETS_SETTINGS
+        ids: where the IDs found by title are kept
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, ids: PersistentCache = SPREADSHEET_IDS):
+        self.settings = {**SHEETS_SETTINGS, **(settings or {})}
+        self.ids = ids
+        self.spreadsheets: Dict[str, gspread.Spreadsheet] = {}
+        self.worksheets: Dict[Tuple[str, str], gspread.Worksheet] = {}
+        self._client = None
+        self._lock = threading.Lock()
+        CACHES.append(self)
+
+    def client(self) -> gspread.Client:
+        with self._lock:
+            if self._client is None:
+                client = gspread.service_account(filename=self.settings["credentials"])
+                client.set_timeout((TIMEOUTS["http_connect"], TIMEOUTS["sheets"]))
+                self._client = client
+            return self._client
+
+    def _open(self, title: str) -> gspread.Spreadsheet:
+        client = self.client()
+        key = self.settings["spreadsheet_ids"].get(title)
+        if key is None:
+            _, key = self.ids.get(title)
+        if key is not None:
+            try:
+                return client.open_by_key(key)
+            except gspread.SpreadsheetNotFound:
+                logger.warning("known spreadsheet id not found, searching the title again",
+                               extra={"title": title, "id": key})
+        spreadsheet = client.open(title)
+        try:
+            self.ids.set(title, spreadsheet.id)
+        except OSError:
+            logger.warning("could not keep the spreadsheet id", extra={"title": title}, exc_info=True)
+        return spreadsheet
+
+    async def spreadsheet(self, title: str) -> gspread.Spreadsheet:
+        if title not in self.spreadsheets:
+            self.spreadsheets[title] = await run_blocking(self._open, title, timeout=TIMEOUTS["sheets"],
+                                                          upstream="sheets")
+        return self.spreadsheets[title]
+
+    async def worksheet(self, title: str, sheet: str) -> gspread.Worksheet:
+        if (title, sheet) not in self.worksheets:
+            spreadsheet = await self.spreadsheet(title)
+            self.worksheets[title, sheet] = await run_blocking(spreadsheet.worksheet, sheet,
+                                                               timeout=TIMEOUTS["sheets"], upstream="sheets")
+        return self.worksheets[title, sheet]
+
+    async def add_worksheet(self, title: str, sheet: str, rows: int = 1000, cols: int = 26) -> gspread.Worksheet:
+        spreadsheet = await self.spreadsheet(title)
+        worksheet = await run_blocking(spreadsheet.add_worksheet, title=sheet, rows=rows, cols=cols,
+                                       timeout=TIMEOUTS["sheets"], upstream="sheets")
+        self.worksheets[title, sheet] = worksheet
+        return worksheet
+
+    def forget(self, title: str):
+        """Drop the handles of one spreadsheet, e.g. after its sheets were changed by hand"""
+        self.spreadsheets.pop(title, None)
+        for key in [key for key in self.worksheets if key[0] == title]:
+            del self.worksheets[key]
+
+    def clear(self):
+        """Drop every handle; the client and the known IDs are kept"""
+        self.spreadsheets.clear()
+        self.worksheets.clear()
+
+
+def cell_value(value: Any) -> Any:
+    """A report value as a Sheets cell: plain Python numbers, empty for missing"""
+    if value is None:
+        return ""
+    if hasattr(value, "item"):
+        # numpy scalars
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    return value
+
+
+def serial_number(value: Any) -> Any:
+    """An ISO date as Sheets stores it once typed in (days since 1899-12-30); other values as they are"""
+    if isinstance(value, str) and ISO_DATE.fullmatch(value.strip()):
+        return (datetime.date.fromisoformat(value.strip()) - SERIAL_EPOCH).days
+    return value
+
+
+def same_cell(current: Any, wanted: Any) -> bool:
+    """Whether a cell read back from Sheets (dates as serial numbers) already holds the wanted value"""
+    current, wanted = cell_value(current), serial_number(cell_value(wanted))
+    try:
+        return math.isclose(float(current), float(wanted), rel_tol=1e-9, abs_tol=1e-12)
+    except (TypeError, ValueError):
+        return str(current).strip() == str(wanted).strip()
+
+
+def reconcile(worksheet: gspread.Worksheet, cells: Dict[str, Any]) -> List[str]:
+    """
+    Make a worksheet hold the given cells, writing only those that differ
+
+    The bounding range of the cells is read in one batch_get (unformatted numbers,
+    dates as serial numbers, so they compare whatever the sheet's locale) and the
+    changed cells are written in one batch_update, as if typed in, which turns ISO
+    dates into dates. Blocking; run it with run_blocking.
+
+    Args:
+        worksheet: the worksheet to update
+        cells: wanted value by A1 label, e.g. {'F3': '2025-03-31'}
+
+    Returns:
+        Labels of the cells written, empty when the sheet was already up to date
+    """
+    positions = {label: a1_to_rowcol(label) for label in cells}
+    top = min(r for r, _ in positions.values())
+    left = min(c for _, c in positions.values())
+    bottom = max(r for r, _ in positions.values())
+    right = max(c for _, c in positions.values())
+    block = f"{rowcol_to_a1(top, left)}:{rowcol_to_a1(bottom, right)}"
+    current = worksheet.batch_get([block], value_render_option=ValueRenderOption.unformatted,
+                                  date_time_render_option=DateTimeOption.serial_number)[0]
+
+    changed = []
+    for label, (r, c) in positions.items():
+        row = current[r - top] if r - top < len(current) else []
+        value = row[c - left] if c - left < len(row) else ""
+        if not same_cell(value, cells[label]):
+            changed.append(label)
+    if changed:
+        worksheet.batch_update([{"range": label, "values": [[cell_value(cells[label])]]} for label in changed],
+                               value_input_option=ValueInputOption.user_entered)
+    return changed
+
+
+# One gateway per process, shared by every toolset it hosts
+SHEETS = SheetsGateway()
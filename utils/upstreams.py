@@ -0,0 +1,12 @@
+from utils.config import get_settings
+
+# Base URLs of every HTTP upstream. Overridable from config.json so the benchmarks
+# (and anyone behind a proxy) can point the tools at stand-in servers.
+UPSTREAMS = get_settings("upstreams", {
+    "defillama": "https://api.llama.fi",
+    "defillama_stablecoins": "https://stablecoins.llama.fi",
+    "coingecko": "https://www.coingecko.com",
+    "nodely": "https://algoanalytics.api.nodely.io",
+    "coinmarketcap": "https://coinmarketcap.com",
+    "npm": "https://api.npmjs.org",
+})
@@ -1,11 +1,20 @@
+import json
 import requests
 import pandas as pd
 import time
 from datetime import datetime
+from bs4 import BeautifulSoup
+from utils.execution import TIMEOUTS
+from utils.log import get_logger
+from utils.upstreams import UPSTREAMS
+
+logger = get_logger("utils")
+
+HTTP_TIMEOUT = (TIMEOUTS["http_connect"], TIMEOUTS["http_read"])
 
 def fetch_stables_data(coin_id, stable, stable_name):
     """
-    Fetch stablecoin data from DeFiLlama API and return as DataFrame
+    Download stablecoin data from DeFiLlama API
     
     Inputs:
         - coin_id: the name of the crypto we are getting the data (e.g., 'algorand')
@@ -13,33 +22,43 @@ def fetch_stables_data(coin_id, stable, stable_name):
         - stable_name: name of the stablecoin for identification
     
     Output:
-        - DataFrame with the stablecoin data
+        - Raw JSON body of the response (parse it with parse_stables_data), b'' on failure
     """
     # Construct the URL
-    full_url = f'https://stablecoins.llama.fi/stablecoincharts/{coin_id}?stablecoin={stable}'
+    full_url = f'{UPSTREAMS["defillama_stablecoins"]}/stablecoincharts/{coin_id}?stablecoin={stable}'
     
     try:
         # Download the data
-        response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'})
+        response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'}, timeout=HTTP_TIMEOUT)
         
         if response.status_code == 429:
-            print(f"Rate limited for {stable_name}. Waiting...")
+            logger.warning("rate limited", extra={"stable": stable_name})
             time.sleep(int(response.headers.get("Retry-After", 60)))
-            response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'})
+            response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'}, timeout=HTTP_TIMEOUT)
         
         if response.status_code == 200:
-            # Parse JSON directly into DataFrame
-            data = response.json()
-            df = pd.DataFrame(data)
-            print(f"Successfully fetched {stable_name} data: {len(df)} records")
-            return df
+            return response.content
         else:
-            print(f"Failed to fetch data for {stable_name}. Status code: {response.status_code}")
-            return pd.DataFrame()
+            logger.error("failed to fetch stable", extra={"stable": stable_name, "status": response.status_code})
+            return b''
             
     except Exception as e:
-        print(f"Error fetching {stable_name}: {e}")
+        logger.exception("error fetching stable", extra={"stable": stable_name})
+        return b''
+
+def parse_stables_data(body, stable_name):
+    """
+    Parse a stablecoin download into a DataFrame, empty if the download failed
+    """
+    if not body:
+        return pd.DataFrame()
+    try:
+        df = pd.DataFrame(json.loads(body))
+    except Exception:
+        logger.exception("error parsing stable", extra={"stable": stable_name})
         return pd.DataFrame()
+    logger.info("fetched stable", extra={"stable": stable_name, "records": len(df)})
+    return df
 
 def extract_pegged_usd_values(df):
     """
@@ -88,10 +107,10 @@ def convert_timestamps_in_df(df, date_column='date', format_string='%Y-%m-%d'):
 
 def fetch_all_algorand_stables():
     """
-    Fetch all Algorand stablecoin data and return as dictionary of DataFrames
+    Download all Algorand stablecoin data
     
     Returns:
-        Dictionary with stablecoin names as keys and DataFrames as values
+        Dictionary with stablecoin names as keys and raw JSON bodies as values
     """
     # Stablecoin definitions
     stables = {
@@ -103,28 +122,50 @@ def fetch_all_algorand_stables():
         'monerium': 101
     }
     
-    # Dictionary to store all dataframes
-    stables_data = {}
+    # Dictionary to store all downloads
+    bodies = {}
 
     # Fetch data for each stablecoin
     for stable_name, stable_id in stables.items():
-        df = fetch_stables_data('algorand', stable_id, stable_name)
+        bodies[stable_name] = fetch_stables_data('algorand', stable_id, stable_name)
+        
+        # Small delay to be respectful to the API
+        time.sleep(0.5)
+    
+    return bodies
+
+def prepare_frames(bodies, parse):
+    """
+    Parse downloads and flatten them: peggedUSD values extracted, timestamps converted
+    
+    Args:
+        bodies: dictionary of raw JSON bodies by name
+        parse: parse_stables_data or parse_rwa_data
+        
+    Returns:
+        Dictionary of DataFrames by name, empty for failed downloads
+    """
+    frames = {}
+    for name, body in bodies.items():
+        df = parse(body, name)
         
         if not df.empty:
             # Extract peggedUSD values
-            df_processed = extract_pegged_usd_values(df)
+            df = extract_pegged_usd_values(df)
             
             # Convert timestamps to readable dates
-            df_processed = convert_timestamps_in_df(df_processed)
+            df = convert_timestamps_in_df(df)
             
-            stables_data[stable_name] = df_processed
-        else:
-            stables_data[stable_name] = pd.DataFrame()
-        
-        # Small delay to be respectful to the API
-        time.sleep(0.5)
+        frames[name] = df
+    return frames
+
+def build_stables_history(bodies):
+    """
+    Stablecoin market cap history from the fetch_all_algorand_stables downloads
     
-    return stables_data
+    CPU-bound (JSON parsing, per-cell extraction, merges): run it with run_cpu.
+    """
+    return merge_stables_data(prepare_frames(bodies, parse_stables_data))
 
 def merge_stables_data(stables_data):
     """
@@ -141,7 +182,7 @@ def merge_stables_data(stables_data):
     valid_dfs = {name: df for name, df in stables_data.items() if not df.empty}
     
     if not valid_dfs:
-        print("No valid data to merge")
+        logger.warning("no valid data to merge")
         return pd.DataFrame()
     
     merged_dfs = []
@@ -157,13 +198,12 @@ def merge_stables_data(stables_data):
                     'totalCirculatingUSD': f"{stable_name}_totalCirculatingUSD"
                 })
                 merged_dfs.append(df_subset)
-                print(f"Added {stable_name}_totalCirculatingUSD: {len(df_subset)} records")
+                logger.info("added column", extra={"column": f"{stable_name}_totalCirculatingUSD", "records": len(df_subset)})
             else:
-                print(f"Warning: {stable_name} doesn't have 'totalCirculatingUSD' column")
-                print(f"Available columns: {list(df.columns)}")
+                logger.warning("missing totalCirculatingUSD column", extra={"stable": stable_name, "columns": list(df.columns)})
     
     if not merged_dfs:
-        print("No DataFrames with 'totalCirculatingUSD' column found")
+        logger.warning("no DataFrames with totalCirculatingUSD column found")
         return pd.DataFrame()
     
     # Start with the first DataFrame
@@ -184,7 +224,7 @@ def merge_stables_data(stables_data):
         merged_df['total_mcap'] = merged_df[totalCirculatingUSD_columns].sum(axis=1)
     else:
         merged_df['total_mcap'] = 0
-        print("Warning: No totalCirculatingUSD columns found for total_mcap calculation")
+        logger.warning("no totalCirculatingUSD columns found for total_mcap calculation")
     
     # Sort by date for better readability
     merged_df = merged_df.sort_values('date').reset_index(drop=True)
@@ -193,38 +233,51 @@ def merge_stables_data(stables_data):
 
 def fetch_rwa_data(protocol):
     """
+    Download a protocol's data from DeFiLlama API
+
+    Output:
+        - Raw JSON body of the response (parse it with parse_rwa_data), b'' on failure
     """
     # Construct the URL
-    full_url = f'https://api.llama.fi/protocol/{protocol}'
+    full_url = f'{UPSTREAMS["defillama"]}/protocol/{protocol}'
     
     try:
         # Download the data
-        response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'})
+        response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'}, timeout=HTTP_TIMEOUT)
         
         if response.status_code == 429:
-            print(f"Rate limited for {protocol}. Waiting...")
+            logger.warning("rate limited", extra={"protocol": protocol})
             time.sleep(int(response.headers.get("Retry-After", 60)))
-            response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'})
+            response = requests.get(full_url, headers={'User-agent': 'Price Scrapper'}, timeout=HTTP_TIMEOUT)
         
         if response.status_code == 200:
-            # Parse JSON directly into DataFrame
-            data = response.json()['tvl']
-            df = pd.DataFrame(data)
-            return df
+            return response.content
         else:
-            print(f"Failed to fetch data for {protocol}. Status code: {response.status_code}")
-            return pd.DataFrame()
+            logger.error("failed to fetch protocol", extra={"protocol": protocol, "status": response.status_code})
+            return b''
             
     except Exception as e:
-        print(f"Error fetching {protocol}: {e}")
+        logger.exception("error fetching protocol", extra={"protocol": protocol})
+        return b''
+
+def parse_rwa_data(body, protocol):
+    """
+    Parse a protocol download into a DataFrame of its TVL history, empty if the download failed
+    """
+    if not body:
+        return pd.DataFrame()
+    try:
+        return pd.DataFrame(json.loads(body)['tvl'])
+    except Exception:
+        logger.exception("error parsing protocol", extra={"protocol": protocol})
         return pd.DataFrame()
     
 def fetch_all_rwa():
     """
-    Fetch all Algorand stablecoin data and return as dictionary of DataFrames
+    Download all Algorand RWA protocol data
     
     Returns:
-        Dictionary with stablecoin names as keys and DataFrames as values
+        Dictionary with protocol names as keys and raw JSON bodies as values
     """
     # RWA protocols
 
@@ -235,28 +288,25 @@ def fetch_all_rwa():
         'vesta': 'vesta%20equity'
     }
     
-    # Dictionary to store all dataframes
-    rwa_data = {}
+    # Dictionary to store all downloads
+    bodies = {}
 
-    # Fetch data for each stablecoin
+    # Fetch data for each protocol
     for protocol_name, protocol_id in protocols.items():
-        df = fetch_rwa_data(protocol_id)
-        
-        if not df.empty:
-            # Extract peggedUSD values
-            df_processed = extract_pegged_usd_values(df)
-            
-            # Convert timestamps to readable dates
-            df_processed = convert_timestamps_in_df(df_processed)
-            
-            rwa_data[protocol_name] = df_processed
-        else:
-            rwa_data[protocol_name] = pd.DataFrame()
+        bodies[protocol_name] = fetch_rwa_data(protocol_id)
         
         # Small delay to be respectful to the API
         time.sleep(0.5)
     
-    return rwa_data    
+    return bodies    
+
+def build_rwa_history(bodies):
+    """
+    RWA TVL history from the fetch_all_rwa downloads
+    
+    CPU-bound (JSON parsing, per-cell extraction, merges): run it with run_cpu.
+    """
+    return merge_rwa_data(prepare_frames(bodies, parse_rwa_data))
 
 def merge_rwa_data(rwa_data):
     """
@@ -273,7 +323,7 @@ def merge_rwa_data(rwa_data):
     valid_dfs = {name: df for name, df in rwa_data.items() if not df.empty}
     
     if not valid_dfs:
-        print("No valid data to merge")
+        logger.warning("no valid data to merge")
         return pd.DataFrame()
     
     merged_dfs = []
@@ -289,13 +339,12 @@ def merge_rwa_data(rwa_data):
                     'totalLiquidityUSD': f"{stable_name}_totalLiquidityUSD"
                 })
                 merged_dfs.append(df_subset)
-                print(f"Added {stable_name}_totalLiquidityUSD: {len(df_subset)} records")
+                logger.info("added column", extra={"column": f"{stable_name}_totalLiquidityUSD", "records": len(df_subset)})
             else:
-                print(f"Warning: {stable_name} doesn't have 'totalLiquidityUSD' column")
-                print(f"Available columns: {list(df.columns)}")
+                logger.warning("missing totalLiquidityUSD column", extra={"protocol": stable_name, "columns": list(df.columns)})
     
     if not merged_dfs:
-        print("No DataFrames with 'totalLiquidityUSD' column found")
+        logger.warning("no DataFrames with totalLiquidityUSD column found")
         return pd.DataFrame()
     
     # Start with the first DataFrame
@@ -316,9 +365,43 @@ def merge_rwa_data(rwa_data):
         merged_df['total_tvl'] = merged_df[totalLiquidityUSD_columns].sum(axis=1)
     else:
         merged_df['total_tvl'] = 0
-        print("Warning: No totalLiquidityUSD columns found for total_tvl calculation")
+        logger.warning("no totalLiquidityUSD columns found for total_tvl calculation")
     
     # Sort by date for better readability
     merged_df = merged_df.sort_values('date').reset_index(drop=True)
     
     return merged_df
+
+def parse_cmc_ranking(html):
+    """
+    Rank of Algorand in a CoinMarketCap historical snapshot page
+
+    CPU-bound (HTML parsing): run it with run_cpu.
+
+    Args:
+        html: the page, as text
+
+    Returns:
+        1-based rank among the top 100 coins
+    """
+    soup = BeautifulSoup(html, "html.parser")
+
+    # Select both top 20 and remaining 80 coins
+    top_20_rows = soup.select("tr.cmc-table-row")
+    remaining_80_rows = soup.select("tr.sc-9db05dbd-1.iWrTcJ.cmc-table-row")
+
+    all_rows = top_20_rows + remaining_80_rows  # Combine both lists
+
+    top_100 = []
+    for index, row in enumerate(all_rows[:100]):  # Ensure exactly top 100
+        name_tag = row.select_one("a.cmc-link")
+
+        if name_tag:
+            if index < 20 and 'title' in name_tag.attrs:  # First 20: Use title
+                full_name = name_tag['title'].strip()
+            else:  # Remaining 80: Use text
+                full_name = name_tag.text.strip()
+            
+            top_100.append(full_name)
+    ranking = top_100.index('Algorand')+1
+    return ranking